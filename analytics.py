@@ -0,0 +1,130 @@
+"""
+Warranty and Depreciation Analytics Module
+
+Parses free-text warranty terms ("1 Year", "18 months") into durations and
+computes warranty expiry and book value for the whole asset frame with NumPy.
+Text columns are factorized first, so parsing runs once per distinct value
+rather than once per asset.
+"""
+import numpy as np
+import pandas as pd
+from config import (
+    DEPRECIATION_METHOD, DECLINING_BALANCE_FACTOR, DEFAULT_USEFUL_LIFE_YEARS, USEFUL_LIFE_YEARS
+)
+
+WARRANTY_PATTERN = r'(?P<count>\d+(?:\.\d+)?)\s*(?P<unit>y|yr|year|m|mo|mon|month|w|wk|week|d|day)s?\b'
+UNIT_MONTHS = {
+    'y': 12.0, 'yr': 12.0, 'year': 12.0,
+    'm': 1.0, 'mo': 1.0, 'mon': 1.0, 'month': 1.0,
+    'w': 12.0 / 52, 'wk': 12.0 / 52, 'week': 12.0 / 52,
+    'd': 12.0 / 365.25, 'day': 12.0 / 365.25,
+}
+DAYS_PER_YEAR = 365.25
+
+
+def _by_unique(values, parse):
+    """Apply a vectorized parse to the distinct values of a column and broadcast back"""
+    codes, uniques = pd.factorize(values)
+    parsed = np.asarray(parse(pd.Series(uniques, dtype=object).astype(str)))
+    # Missing cells (code -1) get the parse of an empty string; concatenating keeps the parse's dtype
+    # (datetime64 for dates) even when there are no values at all
+    return np.concatenate([parsed, np.asarray(parse(pd.Series([''], dtype=object)))[:1]])[codes]
+
+
+def _warranty_months(terms):
+    """Months for each distinct warranty term; NaN when no duration is recognised"""
+    found = terms.str.lower().str.extractall(WARRANTY_PATTERN)
+    if found.empty:
+        return np.full(len(terms), np.nan)
+    months = found['count'].astype(float) * found['unit'].map(UNIT_MONTHS)
+    # "1 year 6 months" adds up
+    return months.groupby(level=0).sum().reindex(range(len(terms))).to_numpy()
+
+
+def parse_warranty_months(warranty):
+    """Warranty duration in months for every asset (NaN for blank or unparseable terms)"""
+    return _by_unique(warranty, _warranty_months)
+
+
+def parse_dates(values):
+    """datetime64[D] array; NaT where the text is not a date"""
+    return _by_unique(values, lambda s: pd.to_datetime(s, errors='coerce').to_numpy(dtype='datetime64[D]'))
+
+
+def parse_amounts(values):
+    if pd.api.types.is_numeric_dtype(values):
+        return pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+    return _by_unique(values, lambda s: pd.to_numeric(s.str.replace(',', '', regex=False), errors='coerce')
+                      .to_numpy(dtype=float))
+
+
+def add_months(dates, months):
+    """dates (datetime64[D]) + whole or fractional months, clamping to the end of the month"""
+    whole = np.floor(np.nan_to_num(months, nan=0.0)).astype(np.int64)
+    month_start = dates.astype('datetime64[M]')
+    day_offset = (dates - month_start.astype('datetime64[D]')).astype(np.int64)
+    target_month = month_start + whole
+    month_length = ((target_month + 1).astype('datetime64[D]') - target_month.astype('datetime64[D]')).astype(np.int64)
+    result = target_month.astype('datetime64[D]') + np.minimum(day_offset, month_length - 1)
+    # Fractional months (weeks, days) are added as days
+    extra_days = np.round((np.nan_to_num(months, nan=0.0) - whole) * DAYS_PER_YEAR / 12).astype(np.int64)
+    result = result + extra_days
+    return np.where(np.isnan(months) | np.isnat(dates), np.datetime64('NaT'), result)
+
+
+def book_values(cost, age_years, useful_life, method=DEPRECIATION_METHOD):
+    """Book value after age_years, straight-line to zero or declining balance"""
+    age_years = np.clip(age_years, 0, None)
+    if method == 'declining_balance':
+        rate = np.minimum(DECLINING_BALANCE_FACTOR / useful_life, 1.0)
+        return cost * (1.0 - rate) ** age_years
+    return cost * np.clip(1.0 - age_years / useful_life, 0.0, 1.0)
+
+
+def asset_analytics(assets_df, as_of=None, method=DEPRECIATION_METHOD):
+    """Per-asset warranty expiry, days left, age and book value (same row order as assets_df)"""
+    today = np.datetime64(pd.Timestamp(as_of or pd.Timestamp.now()).normalize().date(), 'D')
+
+    def column(name):
+        return assets_df[name] if name in assets_df.columns else pd.Series('', index=assets_df.index, dtype=object)
+
+    purchase = parse_dates(column('Date of Purchase'))
+    cost = parse_amounts(column('Amount'))
+    months = parse_warranty_months(column('Warranty'))
+    expiry = add_months(purchase, months)
+    days_left = (expiry - today).astype('timedelta64[D]').astype(float)
+    days_left[np.isnat(expiry)] = np.nan
+
+    useful_life = _by_unique(column('Asset Category'), lambda s: s.map(USEFUL_LIFE_YEARS)
+                             .fillna(DEFAULT_USEFUL_LIFE_YEARS).to_numpy(dtype=float))
+    age_years = (today - purchase).astype('timedelta64[D]').astype(float) / DAYS_PER_YEAR
+    age_years[np.isnat(purchase)] = np.nan
+    # Without a purchase date the asset is carried at cost
+    book = np.where(np.isnan(age_years), cost, book_values(cost, np.nan_to_num(age_years), useful_life, method))
+
+    return pd.DataFrame({
+        'Asset Code': column('Asset Code'),
+        'Purchase Date': purchase,
+        'Cost': cost,
+        'Warranty Months': months,
+        'Warranty Expiry': expiry,
+        'Days To Expiry': days_left,
+        'Age Years': age_years,
+        'Useful Life Years': useful_life,
+        'Book Value': book,
+    }, index=assets_df.index)
+
+
+def expiring_within(analytics, days):
+    """Rows whose warranty ends in the next `days` days (expired ones excluded)"""
+    left = analytics['Days To Expiry'].to_numpy()
+    return analytics[(left >= 0) & (left <= days)].sort_values('Days To Expiry')
+
+
+def book_value_by(analytics, assets_df, column='Department'):
+    """Total cost and book value grouped by an asset column"""
+    keys = assets_df[column].fillna('').astype(str).replace('', 'Unassigned') if column in assets_df.columns \
+        else pd.Series('Unassigned', index=assets_df.index)
+    totals = analytics[['Cost', 'Book Value']].groupby(keys.to_numpy()).sum()
+    totals.index.name = column
+    return totals.sort_values('Book Value', ascending=False)
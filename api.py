@@ -0,0 +1,510 @@
+"""
+HTTP API Module
+
+Headless JSON API for scanners and integrations, run as its own process next to
+the Streamlit app and sharing its storage (GoogleSheetsDB, sharding, movement
+log) and login (auth.authenticate_user, HTTP Basic):
+
+    GET  /api/health                      no auth; index version and size
+    GET  /api/assets?offset=&limit=       paginated listing (filters: location, status, category, q)
+    GET  /api/assets/<code>               one asset
+    GET  /api/assets/lookup?codes=A,B     bulk lookup (also POST with {"codes": [...]})
+    POST /api/assets                      create; the asset code is generated as in the app
+    POST /api/assets/move                 {"codes": [...], "to_location": ..., "reason": ...,
+                                           "expected_locations": {code: location}}
+
+Reads are served from an in-memory index of the Assets sheet that is re-checked
+against the Drive version at most every API_REFRESH_INTERVAL seconds (and
+immediately after a write through this process). Every read carries an ETag
+derived from its response body, so a client sending If-None-Match gets a 304
+without the API touching Sheets. Bodies are gzipped when the client accepts it.
+Users with a Locations entry in the Users sheet only see, create and move assets
+at those locations, as in the app.
+
+The server speaks plain HTTP and Basic auth sends passwords with every request, so it
+binds to localhost (API_HOST) by default; to serve other machines, put a reverse proxy
+that terminates TLS in front of it.
+
+    python api.py --spreadsheet <id or title>
+    python api.py --fake --assets 100000     # in-memory fake backend, log in as admin/password
+"""
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import pandas as pd
+
+from auth import authenticate_user, hash_password
+from asset_search import build_search_index
+from barcode_utils import generate_asset_code
+from config import (
+    SHEETS, ASSET_STATUS_OPTIONS, API_HOST, API_PORT, API_SPREADSHEET, API_REFRESH_INTERVAL, API_AUTH_TTL,
+    API_DEFAULT_PAGE_SIZE, API_MAX_PAGE_SIZE, API_MAX_LOOKUP_CODES, API_GZIP_MIN_BYTES, API_LIST_CACHE_SIZE
+)
+from google_sheets import GoogleSheetsDB, read_failed
+from metrics import Histogram, record_cache
+from movement_log import MovementLog
+from reference_data import get_reference_data
+from sharding import ShardRouter, ShardedSheetsDB
+
+logger = logging.getLogger(__name__)
+
+API_REQUEST_SECONDS = Histogram(
+    'assettracker_api_request_seconds', 'Latency of HTTP API requests', ['endpoint', 'status'])
+
+REQUIRED_FIELDS = ['Item Name', 'Asset Category', 'Location']
+
+
+class ApiError(Exception):
+    """Error reported to the client as {"error": message} with an HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _jsonable(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return ''
+    return value if isinstance(value, (str, int, float, bool)) else str(value)
+
+
+class AssetIndex:
+    """One version of the Assets sheet: records by code plus cached JSON per record"""
+
+    def __init__(self, assets_df, version):
+        self.version = version
+        self.loaded = time.monotonic()
+        self.columns = [str(c) for c in assets_df.columns]
+        values = [[_jsonable(v) for v in assets_df[c].tolist()] for c in assets_df.columns]
+        self.rows = list(zip(*values)) if values else []
+        self.codes = [str(code) for code in assets_df['Asset Code'].tolist()] \
+            if 'Asset Code' in assets_df.columns else []
+        # Later rows win, as a re-added code shadows the old row in the app
+        self.positions = {code: i for i, code in enumerate(self.codes)}
+        self._location = self.columns.index('Location') if 'Location' in self.columns else None
+        self._frame = assets_df
+        self._search_index = None
+        self._encoded = {}
+        self._lists = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.codes)
+
+    def record(self, position):
+        return dict(zip(self.columns, self.rows[position]))
+
+    def encoded(self, position):
+        """JSON of one record, encoded once per index version"""
+        data = self._encoded.get(position)
+        if data is None:
+            data = json.dumps(self.record(position), ensure_ascii=False, separators=(',', ':')).encode()
+            self._encoded[position] = data
+        return data
+
+    def in_scope(self, position, scope):
+        """Whether a record is at one of the scope's locations (always, for an unscoped user)"""
+        if scope is None:
+            return True
+        return self._location is not None and str(self.rows[position][self._location]) in scope
+
+    def lookup(self, codes, scope=None):
+        """(positions found, codes missing) keeping the requested order, repeats dropped"""
+        found, missing = [], []
+        for code in dict.fromkeys(codes):
+            position = self.positions.get(code)
+            if position is None or not self.in_scope(position, scope):
+                missing.append(code)
+            else:
+                found.append(position)
+        return found, missing
+
+    def filtered(self, location='', status='', category='', query='', scope=None):
+        """Positions matching the listing filters, cached per filter combination"""
+        key = (location, status, category, query, scope)
+        with self._lock:
+            positions = self._lists.get(key)
+        if positions is not None:
+            return positions
+        frame = self._frame
+        mask = pd.Series(True, index=frame.index)
+        for column, value in (('Location', location), ('Asset Status', status), ('Asset Category', category)):
+            if value:
+                mask &= frame[column].astype(str) == value if column in frame.columns else False
+        if scope is not None:
+            mask &= frame['Location'].astype(str).isin(list(scope)) if 'Location' in frame.columns else False
+        if query:
+            if self._search_index is None:
+                self._search_index = build_search_index(frame)
+            mask &= self._search_index.str.contains(query.lower(), regex=False).to_numpy()
+        positions = [i for i, keep in enumerate(mask.to_numpy(dtype=bool)) if keep]
+        with self._lock:
+            if len(self._lists) >= API_LIST_CACHE_SIZE:
+                self._lists.clear()
+            self._lists[key] = positions
+        return positions
+
+
+class AssetService:
+    """Shared state of the API process: database, asset index, credential cache and write lock"""
+
+    def __init__(self, db, refresh_interval=API_REFRESH_INTERVAL):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.movement_log = db.movement_log() if hasattr(db, 'movement_log') else MovementLog(db)
+        self._index = None
+        self._stale = True
+        self._refresh_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._users = {}
+        self._users_lock = threading.Lock()
+        GoogleSheetsDB.change_listeners.append(self._on_change)
+
+    def _on_change(self, spreadsheet_id, sheet_name):
+        if sheet_name == SHEETS['assets']:
+            self._stale = True
+
+    def index(self):
+        """Current asset index; re-checked against Sheets when older than refresh_interval.
+
+        While one thread refreshes on a timer, the others keep answering from the previous
+        version; after a write through this process every reader waits for the new one.
+        """
+        index = self._index
+        stale = self._stale
+        if index is not None and not stale and time.monotonic() - index.loaded < self.refresh_interval:
+            return index
+        if not self._refresh_lock.acquire(blocking=index is None or stale):
+            return index
+        try:
+            if self._index is not index:
+                return self._index
+            self._stale = False
+            assets_df = self.db.read_data(SHEETS['assets'])
+            if read_failed(assets_df):
+                # Keep answering from the previous index
+                self._stale = self._stale or stale
+                if index is None:
+                    raise ApiError(503, "Assets are unavailable, try again later")
+                return index
+            version = self.db.last_version()
+            if index is not None and version is not None and version == index.version and not self._stale:
+                index.loaded = time.monotonic()
+                return index
+            self._index = AssetIndex(assets_df, version)
+            return self._index
+        finally:
+            self._refresh_lock.release()
+
+    def authenticate(self, username, password):
+        """authenticate_user with successful logins cached for API_AUTH_TTL seconds"""
+        key = (username.lower(), hash_password(password))
+        with self._users_lock:
+            entry = self._users.get(key)
+        if entry is not None and time.monotonic() - entry[0] < API_AUTH_TTL:
+            record_cache('api_auth', True)
+            return entry[1]
+        record_cache('api_auth', False)
+        user = authenticate_user(self.db, username, password)
+        if user:
+            user = {k: [_jsonable(x) for x in v] if isinstance(v, list) else _jsonable(v) for k, v in user.items()}
+            with self._users_lock:
+                self._users[key] = (time.monotonic(), user)
+        return user
+
+    def scope_for(self, user):
+        """Locations a user may see (None for every location)"""
+        patterns = user.get('locations') or []
+        return get_reference_data(self.db).locations_matching(patterns) if patterns else None
+
+    def create_asset(self, fields, user, scope=None):
+        reference = get_reference_data(self.db)
+        asset = {str(k): _jsonable(v) for k, v in fields.items()}
+        missing = [field for field in REQUIRED_FIELDS if not asset.get(field)]
+        if missing:
+            raise ApiError(422, f"Missing required field(s): {', '.join(missing)}")
+        if asset['Asset Category'] not in reference.category_codes:
+            raise ApiError(422, f"Unknown category {asset['Asset Category']}")
+        if asset['Location'] not in reference.locations:
+            raise ApiError(422, f"Unknown location {asset['Location']}")
+        if scope is not None and asset['Location'] not in scope:
+            raise ApiError(403, f"{asset['Location']} is not one of your locations")
+        if asset.setdefault('Asset Status', 'Active') not in ASSET_STATUS_OPTIONS:
+            raise ApiError(422, f"Asset Status must be one of {', '.join(ASSET_STATUS_OPTIONS)}")
+        category = asset['Asset Category']
+        subcategory = asset.get('Asset Subcategory', '')
+        with self._write_lock:
+            existing_codes = set(self.index().codes)
+            asset['Asset Code'] = generate_asset_code('AST', reference.category_code(category),
+                                                      reference.subcategory_code(category, subcategory),
+                                                      existing_codes)
+            asset.setdefault('Image', 'No')
+            asset.setdefault('Document', 'No')
+            asset['Created At'] = str(datetime.now())
+            if not self.db.append_row(SHEETS['assets'], asset):
+                raise ApiError(502, "Could not write the asset to the spreadsheet")
+        logger.info("%s created %s", user['username'], asset['Asset Code'])
+        return asset
+
+    def move_assets(self, codes, to_location, reason, expected_locations, user, scope=None):
+        if to_location not in get_reference_data(self.db).locations:
+            raise ApiError(422, f"Unknown location {to_location}")
+        with self._write_lock:
+            # Assets can be sent anywhere, but only from the user's own locations; checked against the
+            # locations the move itself re-reads, not the (possibly stale) index
+            success, message = self.movement_log.move_assets(
+                codes, to_location, reason=reason, moved_by=user['username'],
+                expected_locations=expected_locations, from_locations=scope
+            )
+        if not success:
+            # Conflicts cancel the whole move; anything else is a storage failure
+            if message.startswith("Not at your locations"):
+                raise ApiError(403, message)
+            raise ApiError(409 if message.startswith("Move cancelled") else 502, message)
+        return message
+
+
+def _etag(body):
+    return f'W/"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+
+def _codes_param(value):
+    return [code.strip() for code in value.split(',') if code.strip()]
+
+
+def _int_param(params, name, default, maximum=None):
+    try:
+        value = int(params.get(name, default))
+    except ValueError:
+        raise ApiError(400, f"{name} must be an integer")
+    if value < 0:
+        raise ApiError(400, f"{name} must not be negative")
+    return min(value, maximum) if maximum is not None else value
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; with Nagle on, keep-alive clients wait for delayed ACKs
+    disable_nagle_algorithm = True
+    service = None
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        started = time.perf_counter()
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        parts = [unquote(p) for p in url.path.strip('/').split('/')]
+        endpoint, status = 'unknown', 500
+        # Read the body up front so an early error cannot leave it in a kept-alive connection
+        self._body = self.rfile.read(int(self.headers.get('Content-Length') or 0)) if method == 'POST' else b''
+        try:
+            if parts[:1] != ['api'] or len(parts) < 2:
+                raise ApiError(404, "Not found")
+            if parts[1] == 'health' and method == 'GET':
+                endpoint = 'health'
+                index = self.service.index()
+                status = self._send_json(200, {'status': 'ok', 'assets': len(index),
+                                               'version': _jsonable(index.version)})
+                return
+            user = self._authenticate()
+            scope = self.service.scope_for(user)
+            if parts[1:] == ['assets'] and method == 'GET':
+                endpoint = 'list'
+                status = self._list(params, scope)
+            elif parts[1:] == ['assets', 'lookup']:
+                endpoint = 'lookup'
+                codes = _codes_param(params.get('codes', '')) if method == 'GET' else self._read_json().get('codes')
+                status = self._lookup(codes, scope)
+            elif parts[1:] == ['assets'] and method == 'POST':
+                endpoint = 'create'
+                asset = self.service.create_asset(self._read_json(), user, scope)
+                status = self._send_json(201, {'asset': asset})
+            elif parts[1:] == ['assets', 'move'] and method == 'POST':
+                endpoint = 'move'
+                body = self._read_json()
+                codes = body.get('codes') or []
+                if not isinstance(codes, list) or not body.get('to_location'):
+                    raise ApiError(422, "codes (a list) and to_location are required")
+                expected_locations = body.get('expected_locations')
+                if expected_locations is not None and not isinstance(expected_locations, dict):
+                    raise ApiError(422, "expected_locations must be an object of asset code to location")
+                message = self.service.move_assets([str(c) for c in codes], str(body['to_location']),
+                                                   str(body.get('reason', '')),
+                                                   expected_locations or None, user, scope)
+                status = self._send_json(200, {'message': message})
+            elif len(parts) == 3 and parts[1] == 'assets' and method == 'GET':
+                endpoint = 'asset'
+                index = self.service.index()
+                position = index.positions.get(parts[2])
+                if position is None or not index.in_scope(position, scope):
+                    raise ApiError(404, f"Asset {parts[2]} not found")
+                status = self._send_conditional(b'{"asset":' + index.encoded(position) + b'}')
+            else:
+                raise ApiError(404 if method == 'GET' else 405, "Not found")
+        except ApiError as e:
+            extra = {'WWW-Authenticate': 'Basic realm="Asset Tracker"'} if e.status == 401 else None
+            status = self._send_json(e.status, {'error': e.message}, extra)
+        except Exception as e:
+            logger.exception("API request failed: %s %s", method, self.path)
+            status = self._send_json(500, {'error': str(e)})
+        finally:
+            API_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, status=status)
+
+    def _authenticate(self):
+        header = self.headers.get('Authorization', '')
+        if header.startswith('Basic '):
+            try:
+                username, _, password = base64.b64decode(header[6:]).decode().partition(':')
+            except ValueError:
+                username, password = '', ''
+            user = self.service.authenticate(username, password) if username else None
+            if user:
+                return user
+        raise ApiError(401, "Valid credentials are required")
+
+    def _read_json(self):
+        try:
+            body = json.loads(self._body or b'{}')
+        except ValueError:
+            raise ApiError(400, "Request body must be JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "Request body must be a JSON object")
+        return body
+
+    def _list(self, params, scope=None):
+        index = self.service.index()
+        offset = _int_param(params, 'offset', 0)
+        limit = _int_param(params, 'limit', API_DEFAULT_PAGE_SIZE, API_MAX_PAGE_SIZE)
+        filters = [params.get(name, '') for name in ('location', 'status', 'category', 'q')]
+        positions = index.filtered(*filters, scope=scope) if any(filters) or scope is not None \
+            else range(len(index))
+        page = positions[offset:offset + limit]
+        following = offset + limit if offset + limit < len(positions) else None
+        body = (f'{{"total":{len(positions)},"offset":{offset},"limit":{limit},'
+                f'"next_offset":{json.dumps(following)},"assets":[').encode() \
+            + b','.join(index.encoded(p) for p in page) + b']}'
+        return self._send_conditional(body)
+
+    def _lookup(self, codes, scope=None):
+        if not isinstance(codes, list) or not codes:
+            raise ApiError(422, "codes must be a non-empty list")
+        if len(codes) > API_MAX_LOOKUP_CODES:
+            raise ApiError(413, f"At most {API_MAX_LOOKUP_CODES} codes per lookup")
+        index = self.service.index()
+        found, missing = index.lookup([str(code) for code in codes], scope)
+        body = b'{"assets":[' + b','.join(index.encoded(p) for p in found) + b'],"missing":' \
+            + json.dumps(missing, ensure_ascii=False).encode() + b'}'
+        return self._send_conditional(body)
+
+    def _send_conditional(self, body):
+        """200 with an ETag, or 304 when the client already has this body"""
+        etag = _etag(body)
+        if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            record_cache('api_etag', True)
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return 304
+        record_cache('api_etag', False)
+        return self._send(200, body, {'ETag': etag, 'Cache-Control': 'no-cache'})
+
+    def _send_json(self, status, payload, headers=None):
+        return self._send(status, json.dumps(payload, ensure_ascii=False).encode(), headers)
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Vary', 'Accept-Encoding')
+        if len(body) >= API_GZIP_MIN_BYTES and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=5)
+            self.send_header('Content-Encoding', 'gzip')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return status
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(db, port=API_PORT, host=API_HOST):
+    """HTTP server answering the API for db's spreadsheet (call serve_forever to run it)"""
+    handler = type('ApiHandler', (_ApiHandler,), {'service': AssetService(db)})
+    server = ThreadingHTTPServer((host, int(port)), handler)
+    server.daemon_threads = True
+    return server
+
+
+def _fake_db(args):
+    """GoogleSheetsDB over the in-memory fake backend filled with synthetic data"""
+    from fake_sheets import FakeClient
+    from rate_limiter import RequestScheduler
+    from snapshot_cache import SnapshotCache
+    from synthetic_data import populate
+
+    client = FakeClient()
+    spreadsheet = client.create('Asset Tracker API')
+    populate(client, spreadsheet, args.assets, args.movements, args.locations, args.seed)
+    client.backend.latency = args.latency
+    return GoogleSheetsDB(spreadsheet.id, client=client, scheduler=RequestScheduler(requests_per_minute=10 ** 9),
+                          snapshot_cache=SnapshotCache(None))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Asset Tracker HTTP API")
+    parser.add_argument('--spreadsheet', default=API_SPREADSHEET, help="spreadsheet ID or title")
+    parser.add_argument('--host', default=API_HOST,
+                        help="interface to bind; put a TLS-terminating proxy in front before exposing it")
+    parser.add_argument('--port', type=int, default=API_PORT)
+    parser.add_argument('--fake', action='store_true', help="serve synthetic data from the in-memory fake backend")
+    parser.add_argument('--assets', type=int, default=1000)
+    parser.add_argument('--movements', type=int, default=5000)
+    parser.add_argument('--locations', type=int, default=40)
+    parser.add_argument('--latency', type=float, default=0.0, help="simulated seconds per fake API call")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    # Streamlit calls outside `streamlit run` log a "missing ScriptRunContext" warning each
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith('streamlit'):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+    if args.fake:
+        db = _fake_db(args)
+        logger.info("Fake backend with %d assets; log in as admin / password", args.assets)
+    else:
+        if not args.spreadsheet:
+            parser.error("--spreadsheet (or ASSET_TRACKER_SPREADSHEET) is required without --fake")
+        db = GoogleSheetsDB()
+        router = ShardRouter.from_file()
+        db = ShardedSheetsDB(db, router) if router else db
+        if not db.set_spreadsheet(args.spreadsheet):
+            parser.error(f"Could not open spreadsheet {args.spreadsheet}")
+    server = create_server(db, args.port, args.host)
+    logger.info("Asset Tracker API listening on http://%s:%d/api", args.host, server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,28 @@
 """
 Main Asset Tracker Application
 """
+import time
+_import_started = time.perf_counter()
 import streamlit as st
 import pandas as pd
+import os
 from datetime import datetime
 from google_sheets import GoogleSheetsDB
+from sharding import ShardRouter, ShardedSheetsDB
 from auth import authenticate_user, register_user, check_authentication, get_current_user, logout
-from dashboard import show_dashboard
-from barcode_utils import generate_barcode, generate_asset_code, create_barcode_label
-from config import SHEETS, ASSET_STATUS_OPTIONS, OWNERSHIP_OPTIONS
-from PIL import Image
-import io
+from jobs import Job, get_job_scheduler
+from asset_search import build_search_index, filter_assets
+from movement_log import get_movement_log, legacy_remaining
+from reference_data import get_reference_data
+from metrics import (
+    PAGE_RENDER_SECONDS, DB_METHOD_SECONDS, SHEETS_CALL_SECONDS, SHEETS_BYTES, IMPORT_SECONDS,
+    cache_hit_ratios, render_prometheus, write_metrics_file, start_metrics_server
+)
+from lazy_imports import lazy_import, record_import
+from rate_limiter import get_scheduler
+from config import SHEETS, ASSET_STATUS_OPTIONS, OWNERSHIP_OPTIONS, EXPORT_PORT, DATA_QUALITY_SHEETS
+# Per-page modules (dashboard/plotly, barcode_utils, export, attachments, data_quality, duplicates) are loaded with lazy_import
+record_import('app', 'startup', time.perf_counter() - _import_started)
 
 # Page configuration
 st.set_page_config(
@@ -26,12 +38,34 @@ if 'db' not in st.session_state:
 if 'spreadsheet_id' not in st.session_state:
     st.session_state.spreadsheet_id = None
 
+def create_db():
+    """New database connection, sharded when a shard map is configured"""
+    db = GoogleSheetsDB()
+    router = ShardRouter.from_file()
+    return ShardedSheetsDB(db, router) if router else db
+
 def init_db():
     """Initialize database connection"""
     if st.session_state.db is None:
-        st.session_state.db = GoogleSheetsDB()
+        st.session_state.db = create_db()
     return st.session_state.db
 
+def register_jobs():
+    """Background precomputation jobs, re-run when a sheet they read is written"""
+    scheduler = get_job_scheduler()
+    assets, locations = SHEETS['assets'], SHEETS['locations']
+    scheduler.register(Job('dashboard_aggregates', lambda db: lazy_import('dashboard', page='jobs').precompute_dashboard(db),
+                           sheets=[assets, locations]))
+    scheduler.register(Job('search_index', lambda db: build_search_index(db.read_data(assets)), sheets=[assets]))
+    scheduler.register(Job('asset_codes', lambda db: existing_asset_codes(db.read_data(assets)), sheets=[assets]))
+    scheduler.register(Job('data_quality', lambda db: lazy_import('data_quality', page='jobs').check_database(db),
+                           sheets=DATA_QUALITY_SHEETS))
+    scheduler.register(Job('duplicate_index', lambda db: lazy_import('duplicates', page='jobs').build_duplicate_index(
+                               db.read_data(assets)), sheets=[assets]))
+    scheduler.register(Job('barcode_labels', lambda db: lazy_import('barcode_utils', page='jobs').prerender_labels(
+                               db.read_data(assets)), sheets=[assets]))
+    return scheduler
+
 def login_page():
     """Login page"""
     st.title("🔐 Asset Tracker Login")
@@ -55,6 +89,7 @@ def login_page():
                     st.session_state.username = user['username']
                     st.session_state.user_role = user['role']
                     st.session_state.user_id = user['user_id']
+                    st.session_state.user_locations = user['locations']
                     st.success("Login successful!")
                     st.rerun()
                 else:
@@ -121,48 +156,134 @@ def main_app():
         return
     
     db.set_spreadsheet(st.session_state.spreadsheet_id)
-    
+    register_jobs().watch(st.session_state.spreadsheet_id, create_db)
+    # Site managers: Assets and movement reads are limited to (and only download) their locations
+    patterns = st.session_state.get('user_locations') or []
+    db.set_scope(get_reference_data(db).locations_matching(patterns) if patterns else None)
+    if db.scope is not None:
+        st.sidebar.caption(f"Locations: {', '.join(patterns)} ({len(db.scope)})")
     # Navigation menu
-    menu = st.sidebar.selectbox(
-        "Navigation",
-        [
-            "Dashboard",
-            "Locations",
-            "Categories",
-            "Subcategories",
-            "Asset Types",
-            "Brands",
-            "Assets",
-            "Search Assets",
-            "Barcode Scanner",
-            "Print Barcodes",
-            "Asset Movements"
-        ]
-    )
+    pages = [
+        "Dashboard",
+        "Locations",
+        "Categories",
+        "Subcategories",
+        "Asset Types",
+        "Brands",
+        "Assets",
+        "Search Assets",
+        "Barcode Scanner",
+        "Stocktake",
+        "Print Barcodes",
+        "Asset Movements",
+        "Data Quality",
+        "Duplicates"
+    ]
+    if db.scope is not None:
+        # Reference data is shared by every site; its delete checks need all assets
+        pages = [page for page in pages if page not in
+                 ("Locations", "Categories", "Subcategories", "Asset Types", "Brands", "Data Quality")]
+    if st.session_state.user_role == 'Admin':
+        pages.append("Performance")
+    menu = st.sidebar.selectbox("Navigation", pages)
+    
+    start_metrics_server()
+    if EXPORT_PORT:
+        lazy_import('export', page='startup').start_export_server(create_db)
     
     # Route to appropriate page
-    if menu == "Dashboard":
-        show_dashboard(db)
-    elif menu == "Locations":
-        manage_locations(db)
-    elif menu == "Categories":
-        manage_categories(db)
-    elif menu == "Subcategories":
-        manage_subcategories(db)
-    elif menu == "Asset Types":
-        manage_asset_types(db)
-    elif menu == "Brands":
-        manage_brands(db)
-    elif menu == "Assets":
-        manage_assets(db)
-    elif menu == "Search Assets":
-        search_assets(db)
-    elif menu == "Barcode Scanner":
-        barcode_scanner(db)
-    elif menu == "Print Barcodes":
-        print_barcodes(db)
-    elif menu == "Asset Movements":
-        manage_asset_movements(db)
+    try:
+        with PAGE_RENDER_SECONDS.time(page=menu):
+            if menu == "Dashboard":
+                lazy_import('dashboard', page=menu).show_dashboard(db)
+            elif menu == "Locations":
+                manage_locations(db)
+            elif menu == "Categories":
+                manage_categories(db)
+            elif menu == "Subcategories":
+                manage_subcategories(db)
+            elif menu == "Asset Types":
+                manage_asset_types(db)
+            elif menu == "Brands":
+                manage_brands(db)
+            elif menu == "Assets":
+                manage_assets(db)
+            elif menu == "Search Assets":
+                search_assets(db)
+            elif menu == "Barcode Scanner":
+                barcode_scanner(db)
+            elif menu == "Stocktake":
+                lazy_import('stocktake', page=menu).show_stocktake(db)
+            elif menu == "Data Quality":
+                lazy_import('data_quality', page=menu).show_data_quality(db)
+            elif menu == "Duplicates":
+                lazy_import('duplicates', page=menu).show_duplicates(db)
+            elif menu == "Print Barcodes":
+                print_barcodes(db)
+            elif menu == "Asset Movements":
+                manage_asset_movements(db)
+            elif menu == "Performance":
+                show_performance()
+    finally:
+        write_metrics_file()
+
+def show_performance():
+    """Performance metrics (Admin only)"""
+    st.title("⏱️ Performance")
+    
+    scheduler_metrics = get_scheduler().get_metrics()
+    bytes_by_direction = {key[0]: value for key, value in SHEETS_BYTES.values().items()}
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("API Calls", scheduler_metrics['calls'])
+    with col2:
+        st.metric("Throttled / Retried", f"{scheduler_metrics['throttled']} / {scheduler_metrics['retried']}")
+    with col3:
+        st.metric("MB Received", f"{bytes_by_direction.get('received', 0) / 1e6:,.2f}")
+    with col4:
+        st.metric("MB Sent", f"{bytes_by_direction.get('sent', 0) / 1e6:,.2f}")
+    
+    st.subheader("Page Render Times")
+    st.dataframe(pd.DataFrame(PAGE_RENDER_SECONDS.summary()), use_container_width=True)
+    
+    st.subheader("Storage Methods")
+    st.dataframe(pd.DataFrame(DB_METHOD_SECONDS.summary()), use_container_width=True)
+    
+    st.subheader("Sheets API Calls")
+    st.dataframe(pd.DataFrame(SHEETS_CALL_SECONDS.summary()), use_container_width=True)
+    
+    st.subheader("Import Times")
+    st.caption("First import of each module in this process, by the page that needed it")
+    st.dataframe(pd.DataFrame(IMPORT_SECONDS.summary()), use_container_width=True)
+    
+    st.subheader("Cache Hit Ratio")
+    ratios = cache_hit_ratios()
+    if ratios:
+        st.dataframe(pd.DataFrame({'Cache': list(ratios), 'Hit Ratio': list(ratios.values())}), use_container_width=True)
+    else:
+        st.info("No cache lookups recorded yet")
+    
+    st.subheader("Background Jobs")
+    job_scheduler = get_job_scheduler()
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Queue Depth", job_scheduler.queue_depth())
+    with col2:
+        st.metric("Runs", sum(row['Runs'] for row in job_scheduler.stats()))
+    st.dataframe(pd.DataFrame(job_scheduler.stats()), use_container_width=True)
+    job_names = [row['Job'] for row in job_scheduler.stats()]
+    if job_names:
+        job_to_run = st.selectbox("Job", job_names)
+        if st.button("Run Now"):
+            job_scheduler.trigger(st.session_state.spreadsheet_id, job_to_run)
+            st.success(f"Queued {job_to_run}")
+    with st.expander("Recent Runs"):
+        st.dataframe(pd.DataFrame(job_scheduler.history()[::-1]), use_container_width=True)
+    
+    metrics_text = render_prometheus()
+    st.download_button("Download Prometheus Metrics", metrics_text, file_name="metrics.prom", mime="text/plain")
+    with st.expander("Prometheus Text"):
+        st.code(metrics_text)
 
 def manage_locations(db):
     """Manage Locations"""
@@ -180,10 +301,15 @@ def manage_locations(db):
                 st.subheader("Delete Location")
                 location_to_delete = st.selectbox("Select Location to Delete", locations_df['Location Name'].tolist() if 'Location Name' in locations_df.columns else [])
                 if st.button("Delete Location"):
-                    idx = locations_df[locations_df['Location Name'] == location_to_delete].index[0]
-                    if db.delete_row(SHEETS['locations'], idx + 1):
-                        st.success("Location deleted!")
-                        st.rerun()
+                    blockers = lazy_import('data_quality', page='Locations').delete_blockers(
+                        db, SHEETS['locations'], location_to_delete)
+                    if blockers:
+                        st.error(f"Cannot delete {location_to_delete}: {blockers}")
+                    else:
+                        idx = locations_df[locations_df['Location Name'] == location_to_delete].index[0]
+                        if db.delete_row(SHEETS['locations'], idx + 1):
+                            st.success("Location deleted!")
+                            st.rerun()
         else:
             st.info("No locations found")
     
@@ -222,10 +348,15 @@ def manage_categories(db):
                 st.subheader("Delete Category")
                 category_to_delete = st.selectbox("Select Category to Delete", categories_df['Category Name'].tolist() if 'Category Name' in categories_df.columns else [])
                 if st.button("Delete Category"):
-                    idx = categories_df[categories_df['Category Name'] == category_to_delete].index[0]
-                    if db.delete_row(SHEETS['categories'], idx + 1):
-                        st.success("Category deleted!")
-                        st.rerun()
+                    blockers = lazy_import('data_quality', page='Categories').delete_blockers(
+                        db, SHEETS['categories'], category_to_delete)
+                    if blockers:
+                        st.error(f"Cannot delete {category_to_delete}: {blockers}")
+                    else:
+                        idx = categories_df[categories_df['Category Name'] == category_to_delete].index[0]
+                        if db.delete_row(SHEETS['categories'], idx + 1):
+                            st.success("Category deleted!")
+                            st.rerun()
         else:
             st.info("No categories found")
     
@@ -267,16 +398,21 @@ def manage_subcategories(db):
                 subcategory_to_delete = st.selectbox("Select Subcategory to Delete", subcategories_df['Subcategory Name'].tolist() if 'Subcategory Name' in subcategories_df.columns else [])
                 if st.button("Delete Subcategory"):
                     idx = subcategories_df[subcategories_df['Subcategory Name'] == subcategory_to_delete].index[0]
-                    if db.delete_row(SHEETS['subcategories'], idx + 1):
+                    category = subcategories_df.loc[idx].get('Category', '')
+                    blockers = lazy_import('data_quality', page='Subcategories').delete_blockers(
+                        db, SHEETS['subcategories'], (category, subcategory_to_delete))
+                    if blockers:
+                        st.error(f"Cannot delete {subcategory_to_delete}: {blockers}")
+                    elif db.delete_row(SHEETS['subcategories'], idx + 1):
                         st.success("Subcategory deleted!")
                         st.rerun()
         else:
             st.info("No subcategories found")
     
     with tab2:
-        categories_df = db.read_data(SHEETS['categories'])
+        reference = get_reference_data(db)
         with st.form("subcategory_form"):
-            category_name = st.selectbox("Category *", categories_df['Category Name'].tolist() if not categories_df.empty and 'Category Name' in categories_df.columns else [])
+            category_name = st.selectbox("Category *", reference.category_names)
             subcategory_name = st.text_input("Subcategory Name *")
             subcategory_code = st.text_input("Subcategory Code")
             subcategory_description = st.text_area("Description")
@@ -351,10 +487,15 @@ def manage_brands(db):
                 st.subheader("Delete Brand")
                 brand_to_delete = st.selectbox("Select Brand to Delete", brands_df['Brand Name'].tolist() if 'Brand Name' in brands_df.columns else [])
                 if st.button("Delete Brand"):
-                    idx = brands_df[brands_df['Brand Name'] == brand_to_delete].index[0]
-                    if db.delete_row(SHEETS['brands'], idx + 1):
-                        st.success("Brand deleted!")
-                        st.rerun()
+                    blockers = lazy_import('data_quality', page='Brands').delete_blockers(
+                        db, SHEETS['brands'], brand_to_delete)
+                    if blockers:
+                        st.error(f"Cannot delete {brand_to_delete}: {blockers}")
+                    else:
+                        idx = brands_df[brands_df['Brand Name'] == brand_to_delete].index[0]
+                        if db.delete_row(SHEETS['brands'], idx + 1):
+                            st.success("Brand deleted!")
+                            st.rerun()
         else:
             st.info("No brands found")
     
@@ -378,6 +519,9 @@ def manage_brands(db):
 
 def manage_assets(db):
     """Manage Assets"""
+    barcode_utils = lazy_import('barcode_utils', page='Assets')
+    export = lazy_import('export', page='Assets')
+    duplicates = lazy_import('duplicates', page='Assets')
     st.title("📦 Assets Management")
     
     tab1, tab2, tab3 = st.tabs(["View Assets", "Add Asset", "Edit Asset"])
@@ -386,6 +530,7 @@ def manage_assets(db):
         assets_df = db.read_data(SHEETS['assets'])
         if not assets_df.empty:
             st.dataframe(assets_df, use_container_width=True)
+            export.show_export(db, 'assets')
             
             if len(assets_df) > 0:
                 st.subheader("Delete Asset")
@@ -400,24 +545,22 @@ def manage_assets(db):
     
     with tab2:
         # Get dropdown options
-        categories_df = db.read_data(SHEETS['categories'])
-        subcategories_df = db.read_data(SHEETS['subcategories'])
-        brands_df = db.read_data(SHEETS['brands'])
-        locations_df = db.read_data(SHEETS['locations'])
+        # Dropdowns come from the cached reference data: no Sheets reads on rerun
+        reference = get_reference_data(db)
         
         with st.form("asset_form"):
             col1, col2 = st.columns(2)
             
             with col1:
                 item_name = st.text_input("Item Name *")
-                asset_category = st.selectbox("Asset Category *", categories_df['Category Name'].tolist() if not categories_df.empty and 'Category Name' in categories_df.columns else [])
-                asset_subcategory = st.selectbox("Asset Subcategory", subcategories_df[subcategories_df.get('Category', '') == asset_category]['Subcategory Name'].tolist() if not subcategories_df.empty and asset_category else [])
-                brand = st.selectbox("Brand", [''] + brands_df['Brand Name'].tolist() if not brands_df.empty and 'Brand Name' in brands_df.columns else [])
+                asset_category = st.selectbox("Asset Category *", reference.category_names)
+                asset_subcategory = st.selectbox("Asset Subcategory", reference.subcategories_for(asset_category))
+                brand = st.selectbox("Brand", [''] + reference.brand_names)
                 asset_description = st.text_area("Asset Description")
                 amount = st.number_input("Amount", min_value=0.0, value=0.0)
             
             with col2:
-                location = st.selectbox("Location *", locations_df['Location Name'].tolist() if not locations_df.empty and 'Location Name' in locations_df.columns else [])
+                location = st.selectbox("Location *", reference.location_names_in(db.scope))
                 date_of_purchase = st.date_input("Date of Purchase")
                 warranty = st.text_input("Warranty (e.g., 1 Year)")
                 department = st.text_input("Department")
@@ -426,27 +569,44 @@ def manage_assets(db):
                 image_file = st.file_uploader("Image Attachment", type=['png', 'jpg', 'jpeg'])
                 document_file = st.file_uploader("Document Attachment", type=['pdf', 'doc', 'docx'])
             
+            allow_duplicate = st.checkbox("Save even if it looks like a duplicate")
             submit = st.form_submit_button("Save Asset")
             
             if submit:
-                if item_name and asset_category and location:
+                likely = None
+                if item_name and asset_category and location and not allow_duplicate:
+                    # Same LSH buckets as the Duplicates page: compares against a few rows, not every asset
+                    likely = duplicates.likely_duplicates(db, {
+                        'Item Name': item_name,
+                        'Asset Description': asset_description,
+                        'Brand': brand or '',
+                        'Location': location,
+                        'Amount': str(amount)
+                    })
+                if not (item_name and asset_category and location):
+                    st.error("Item Name, Asset Category, and Location are required")
+                elif likely is not None and not likely.empty:
+                    st.warning(f"This looks like {len(likely)} existing asset(s); tick "
+                               "'Save even if it looks like a duplicate' to save it anyway")
+                    columns = [c for c in ('Asset Code', 'Item Name', 'Location', 'Brand', 'Amount', 'Score')
+                               if c in likely.columns]
+                    st.dataframe(likely[columns].head(10), use_container_width=True, hide_index=True)
+                else:
                     # Generate asset code
-                    category_code = categories_df[categories_df['Category Name'] == asset_category]['Category Code'].iloc[0] if not categories_df.empty and 'Category Code' in categories_df.columns else ''
-                    subcategory_code = subcategories_df[(subcategories_df['Category'] == asset_category) & (subcategories_df['Subcategory Name'] == asset_subcategory)]['Subcategory Code'].iloc[0] if asset_subcategory and not subcategories_df.empty and 'Subcategory Code' in subcategories_df.columns else ''
+                    category_code = reference.category_code(asset_category)
+                    subcategory_code = reference.subcategory_code(asset_category, asset_subcategory)
                     
-                    # Get existing asset codes to ensure uniqueness
-                    existing_assets_df = db.read_data(SHEETS['assets'])
-                    existing_codes = existing_assets_df['Asset Code'].tolist() if not existing_assets_df.empty and 'Asset Code' in existing_assets_df.columns else []
+                    # Get existing asset codes to ensure uniqueness; the View tab's read this run
+                    # set the data version the precomputed codes are matched against
+                    existing_codes = get_job_scheduler().result(db, 'asset_codes')
+                    if existing_codes is None:
+                        existing_codes = existing_asset_codes(db.read_data(SHEETS['assets']))
                     
-                    asset_code = generate_asset_code('AST', category_code, subcategory_code, existing_codes)
+                    asset_code = barcode_utils.generate_asset_code('AST', category_code, subcategory_code, existing_codes)
                     
                     # Handle file uploads
-                    image_data = None
-                    document_data = None
-                    if image_file:
-                        image_data = image_file.read()
-                    if document_file:
-                        document_data = document_file.read()
+                    image_ref = save_attachment(image_file, thumbnail=True)
+                    document_ref = save_attachment(document_file)
                     
                     asset_data = {
                         'Asset Code': asset_code,
@@ -462,20 +622,18 @@ def manage_assets(db):
                         'Department': department,
                         'Ownership': ownership or '',
                         'Asset Status': asset_status,
-                        'Image': 'Yes' if image_data else 'No',
-                        'Document': 'Yes' if document_data else 'No',
+                        'Image': image_ref or 'No',
+                        'Document': document_ref or 'No',
                         'Created At': str(datetime.now())
                     }
                     
                     if db.append_row(SHEETS['assets'], asset_data):
                         st.success(f"Asset saved! Asset Code: {asset_code}")
                         # Show barcode
-                        barcode_img = generate_barcode(asset_code)
+                        barcode_img = barcode_utils.generate_barcode(asset_code)
                         if barcode_img:
                             st.image(barcode_img, caption=f"Barcode: {asset_code}")
                         st.rerun()
-                else:
-                    st.error("Item Name, Asset Category, and Location are required")
     
     with tab3:
         assets_df = db.read_data(SHEETS['assets'])
@@ -484,29 +642,31 @@ def manage_assets(db):
             if asset_to_edit:
                 asset_row = assets_df[assets_df['Asset Code'] == asset_to_edit].iloc[0]
                 
-                categories_df = db.read_data(SHEETS['categories'])
-                subcategories_df = db.read_data(SHEETS['subcategories'])
-                brands_df = db.read_data(SHEETS['brands'])
-                locations_df = db.read_data(SHEETS['locations'])
+                reference = get_reference_data(db)
+                brand_options = [''] + reference.brand_names
                 
                 with st.form("edit_asset_form"):
                     col1, col2 = st.columns(2)
                     
                     with col1:
                         item_name = st.text_input("Item Name *", value=asset_row.get('Item Name', ''))
-                        asset_category = st.selectbox("Asset Category *", categories_df['Category Name'].tolist() if not categories_df.empty else [], index=categories_df[categories_df['Category Name'] == asset_row.get('Asset Category', '')].index[0] if not categories_df.empty and asset_row.get('Asset Category') in categories_df['Category Name'].values else 0)
-                        asset_subcategory = st.selectbox("Asset Subcategory", [''] + subcategories_df[subcategories_df.get('Category', '') == asset_category]['Subcategory Name'].tolist() if not subcategories_df.empty else [], index=0)
-                        brand = st.selectbox("Brand", [''] + brands_df['Brand Name'].tolist() if not brands_df.empty else [], index=0)
+                        asset_category = st.selectbox("Asset Category *", reference.category_names, index=reference.index_of(reference.category_names, asset_row.get('Asset Category', '')))
+                        subcategory_options = [''] + reference.subcategories_for(asset_category)
+                        asset_subcategory = st.selectbox("Asset Subcategory", subcategory_options, index=reference.index_of(subcategory_options, asset_row.get('Asset Subcategory', '')))
+                        brand = st.selectbox("Brand", brand_options, index=reference.index_of(brand_options, asset_row.get('Brand', '')))
                         asset_description = st.text_area("Asset Description", value=asset_row.get('Asset Description', ''))
                         amount = st.number_input("Amount", min_value=0.0, value=float(asset_row.get('Amount', 0)) if asset_row.get('Amount') else 0.0)
                     
                     with col2:
-                        location = st.selectbox("Location *", locations_df['Location Name'].tolist() if not locations_df.empty else [], index=locations_df[locations_df['Location Name'] == asset_row.get('Location', '')].index[0] if not locations_df.empty and asset_row.get('Location') in locations_df['Location Name'].values else 0)
+                        location_names = reference.location_names_in(db.scope)
+                        location = st.selectbox("Location *", location_names, index=reference.index_of(location_names, asset_row.get('Location', '')))
                         date_of_purchase = st.date_input("Date of Purchase", value=pd.to_datetime(asset_row.get('Date of Purchase', datetime.now())).date() if asset_row.get('Date of Purchase') else datetime.now().date())
                         warranty = st.text_input("Warranty", value=asset_row.get('Warranty', ''))
                         department = st.text_input("Department", value=asset_row.get('Department', ''))
                         ownership = st.selectbox("Ownership", [''] + OWNERSHIP_OPTIONS, index=OWNERSHIP_OPTIONS.index(asset_row.get('Ownership', '')) + 1 if asset_row.get('Ownership') in OWNERSHIP_OPTIONS else 0)
                         asset_status = st.selectbox("Asset Status", ASSET_STATUS_OPTIONS, index=ASSET_STATUS_OPTIONS.index(asset_row.get('Asset Status', 'Active')) if asset_row.get('Asset Status') in ASSET_STATUS_OPTIONS else 0)
+                        image_file = st.file_uploader("Replace Image", type=['png', 'jpg', 'jpeg'])
+                        document_file = st.file_uploader("Replace Document", type=['pdf', 'doc', 'docx'])
                     
                     submit = st.form_submit_button("Update Asset")
                     
@@ -525,7 +685,9 @@ def manage_assets(db):
                                 'Warranty': warranty,
                                 'Department': department,
                                 'Ownership': ownership or '',
-                                'Asset Status': asset_status
+                                'Asset Status': asset_status,
+                                'Image': save_attachment(image_file, thumbnail=True) or asset_row.get('Image', ''),
+                                'Document': save_attachment(document_file) or asset_row.get('Document', '')
                             }
                             
                             idx = assets_df[assets_df['Asset Code'] == asset_to_edit].index[0]
@@ -535,8 +697,31 @@ def manage_assets(db):
                         else:
                             st.error("Item Name, Asset Category, and Location are required")
 
+def save_attachment(uploaded_file, thumbnail=False):
+    """Stream an upload into the attachment store and return its reference ('' if none)"""
+    if uploaded_file is None:
+        return ''
+    try:
+        store = lazy_import('attachments', page='Assets').get_attachment_store()
+        reference = store.put(uploaded_file, os.path.splitext(uploaded_file.name)[1])
+        if thumbnail:
+            store.request_thumbnail(reference)
+        return reference
+    except Exception as e:
+        st.error(f"Error saving attachment {uploaded_file.name}: {str(e)}")
+        return ''
+
+def existing_asset_codes(assets_df):
+    """Set of asset codes in use"""
+    if assets_df.empty or 'Asset Code' not in assets_df.columns:
+        return set()
+    return set(assets_df['Asset Code'].astype(str))
+
 def search_assets(db):
     """Search Assets"""
+    barcode_utils = lazy_import('barcode_utils', page='Search Assets')
+    export = lazy_import('export', page='Search Assets')
+    attachments = lazy_import('attachments', page='Search Assets')
     st.title("🔍 Search Assets")
     
     assets_df = db.read_data(SHEETS['assets'])
@@ -548,14 +733,11 @@ def search_assets(db):
     search_term = st.text_input("Search by Asset Code, Item Name, or Description")
     
     if search_term:
-        filtered = assets_df[
-            assets_df['Asset Code'].str.contains(search_term, case=False, na=False) |
-            assets_df['Item Name'].str.contains(search_term, case=False, na=False) |
-            assets_df.get('Asset Description', '').str.contains(search_term, case=False, na=False)
-        ]
+        filtered = filter_assets(assets_df, search_term, get_job_scheduler().result(db, 'search_index'))
         st.dataframe(filtered, use_container_width=True)
         
         if len(filtered) > 0:
+            export.show_export(db, 'search', search_term)
             selected_asset = st.selectbox("Select Asset to View", filtered['Asset Code'].tolist())
             if selected_asset:
                 asset = filtered[filtered['Asset Code'] == selected_asset].iloc[0]
@@ -575,8 +757,20 @@ def search_assets(db):
                     st.write(f"**Ownership:** {asset.get('Ownership', '')}")
                     st.write(f"**Warranty:** {asset.get('Warranty', '')}")
                 
+                # Attachments: a cached thumbnail instead of the full-size image
+                if attachments.parse_reference(asset.get('Image', '')):
+                    thumbnail = attachments.get_attachment_store().thumbnail(asset.get('Image'))
+                    if thumbnail:
+                        st.image(thumbnail, caption="Image")
+                    else:
+                        st.caption("Image thumbnail is still being generated")
+                document = attachments.parse_reference(asset.get('Document', ''))
+                if document and st.button("Load Document"):
+                    st.download_button("Download Document", attachments.get_attachment_store().read(asset.get('Document')),
+                                       file_name=f"{asset.get('Asset Code', 'document')}.{document[1] or 'bin'}")
+                
                 # Show barcode
-                barcode_img = generate_barcode(asset.get('Asset Code', ''))
+                barcode_img = barcode_utils.generate_barcode(asset.get('Asset Code', ''))
                 if barcode_img:
                     st.image(barcode_img, caption=f"Barcode: {asset.get('Asset Code', '')}")
     else:
@@ -584,6 +778,7 @@ def search_assets(db):
 
 def barcode_scanner(db):
     """Barcode Scanner"""
+    barcode_utils = lazy_import('barcode_utils', page='Barcode Scanner')
     st.title("📷 Barcode Scanner")
     
     st.info("Enter barcode manually or use camera scanner")
@@ -607,7 +802,7 @@ def barcode_scanner(db):
                     st.write(f"**Status:** {asset.get('Asset Status', '')}")
                 
                 with col2:
-                    barcode_img = generate_barcode(barcode_input)
+                    barcode_img = barcode_utils.generate_barcode(barcode_input)
                     if barcode_img:
                         st.image(barcode_img, caption=f"Barcode: {barcode_input}")
             else:
@@ -615,6 +810,7 @@ def barcode_scanner(db):
 
 def print_barcodes(db):
     """Print Barcodes"""
+    barcode_utils = lazy_import('barcode_utils', page='Print Barcodes')
     st.title("🖨️ Print Barcodes")
     
     assets_df = db.read_data(SHEETS['assets'])
@@ -629,7 +825,7 @@ def print_barcodes(db):
         st.subheader("Selected Assets for Printing")
         for asset_code in selected_assets:
             asset = assets_df[assets_df['Asset Code'] == asset_code].iloc[0]
-            label = create_barcode_label(
+            label = barcode_utils.get_barcode_label(
                 asset_code,
                 asset.get('Item Name', ''),
                 asset.get('Location', '')
@@ -641,24 +837,56 @@ def print_barcodes(db):
 
 def manage_asset_movements(db):
     """Manage Asset Movements"""
+    export = lazy_import('export', page='Asset Movements')
     st.title("🚚 Asset Movements")
     
-    tab1, tab2 = st.tabs(["View Movements", "Move Asset"])
+    tab1, tab2, tab3 = st.tabs(["View Movements", "Move Asset", "Bulk Move"])
+    
+    movement_log = get_movement_log(db)
     
     with tab1:
-        movements_df = db.read_data(SHEETS['asset_movements'])
+        view = st.radio("View", ["Latest", "Asset Timeline", "Date Range"], horizontal=True)
+        if view == "Latest":
+            limit = st.number_input("Number of Movements", min_value=1, max_value=1000, value=50)
+            movements_df = movement_log.latest(int(limit))
+        elif view == "Asset Timeline":
+            timeline_code = st.text_input("Asset Code")
+            movements_df = movement_log.timeline(timeline_code) if timeline_code else pd.DataFrame()
+        else:
+            col1, col2 = st.columns(2)
+            with col1:
+                start_date = st.date_input("From Date", value=(datetime.now() - pd.Timedelta(days=30)).date())
+            with col2:
+                end_date = st.date_input("To Date", value=datetime.now().date())
+            movements_df = movement_log.between(start_date, end_date)
+        
         if not movements_df.empty:
             st.dataframe(movements_df, use_container_width=True)
         else:
             st.info("No movements recorded")
+        
+        st.subheader("Export Full History")
+        export.show_export(db, 'movements')
+        
+        # Copy of the old single-sheet history into the partitioned log; offered until every row is in
+        if st.session_state.user_role == 'Admin':
+            remaining = legacy_remaining(movement_log)
+            if remaining and st.button(f"Import Legacy Movements ({remaining} left)"):
+                imported = movement_log.migrate_legacy()
+                left = legacy_remaining(movement_log)
+                if left:
+                    st.warning(f"Imported {imported} movements, {left} still to import: run the import again")
+                else:
+                    st.success(f"Imported {imported} movements")
+                    st.rerun()
     
     with tab2:
         assets_df = db.read_data(SHEETS['assets'])
-        locations_df = db.read_data(SHEETS['locations'])
+        location_names = get_reference_data(db).location_names
         
         if assets_df.empty:
             st.info("No assets available")
-        elif locations_df.empty:
+        elif not location_names:
             st.info("No locations available")
         else:
             with st.form("movement_form"):
@@ -666,7 +894,7 @@ def manage_asset_movements(db):
                 current_location = assets_df[assets_df['Asset Code'] == asset_code]['Location'].iloc[0] if asset_code else ''
                 st.info(f"Current Location: {current_location}")
                 
-                to_location = st.selectbox("Move To Location *", locations_df['Location Name'].tolist() if 'Location Name' in locations_df.columns else [])
+                to_location = st.selectbox("Move To Location *", location_names)
                 movement_reason = st.text_area("Reason for Movement")
                 movement_date = st.date_input("Movement Date", value=datetime.now().date())
                 
@@ -674,27 +902,61 @@ def manage_asset_movements(db):
                 
                 if submit:
                     if asset_code and to_location:
-                        # Record movement
-                        movement_data = {
-                            'Asset Code': asset_code,
-                            'From Location': current_location,
-                            'To Location': to_location,
-                            'Reason': movement_reason,
-                            'Date': str(movement_date),
-                            'Moved By': st.session_state.username,
-                            'Created At': str(datetime.now())
-                        }
-                        
-                        if db.append_row(SHEETS['asset_movements'], movement_data):
-                            # Update asset location
-                            idx = assets_df[assets_df['Asset Code'] == asset_code].index[0]
-                            asset_row = assets_df.iloc[idx].to_dict()
-                            asset_row['Location'] = to_location
-                            if db.update_row(SHEETS['assets'], idx + 1, asset_row):
-                                st.success("Asset moved successfully!")
-                                st.rerun()
+                        # Movement record and asset location are written in one batch
+                        success, message = movement_log.move_asset(
+                            asset_code,
+                            to_location,
+                            from_location=current_location,
+                            reason=movement_reason,
+                            date=movement_date,
+                            moved_by=st.session_state.username
+                        )
+                        if success:
+                            st.success("Asset moved successfully!")
+                            st.rerun()
+                        else:
+                            st.error(message)
                     else:
                         st.error("Asset Code and To Location are required")
+    
+    with tab3:
+        assets_df = db.read_data(SHEETS['assets'])
+        location_names = get_reference_data(db).location_names
+        
+        if assets_df.empty or 'Location' not in assets_df.columns:
+            st.info("No assets available")
+        elif not location_names:
+            st.info("No locations available")
+        else:
+            from_location = st.selectbox("From Location *", get_reference_data(db).location_names_in(db.scope),
+                                         key="bulk_from_location")
+            at_location = assets_df[assets_df['Location'] == from_location]
+            
+            with st.form("bulk_movement_form"):
+                selected_codes = st.multiselect("Assets to Move *", at_location['Asset Code'].tolist(), default=at_location['Asset Code'].tolist())
+                to_location = st.selectbox("Move To Location *", location_names)
+                movement_reason = st.text_area("Reason for Movement")
+                movement_date = st.date_input("Movement Date", value=datetime.now().date())
+                
+                submit = st.form_submit_button("Move Assets")
+                
+                if submit:
+                    if selected_codes and to_location:
+                        success, message = movement_log.move_assets(
+                            selected_codes,
+                            to_location,
+                            reason=movement_reason,
+                            date=movement_date,
+                            moved_by=st.session_state.username,
+                            expected_locations={code: from_location for code in selected_codes}
+                        )
+                        if success:
+                            st.success(message)
+                            st.rerun()
+                        else:
+                            st.error(message)
+                    else:
+                        st.error("Select at least one asset and a To Location")
 
 # Main execution
 if __name__ == "__main__":
@@ -0,0 +1,22 @@
+"""
+Asset Search Module
+"""
+import pandas as pd
+
+
+def build_search_index(assets_df):
+    """Lower-cased Asset Code, Item Name and Description per asset, indexed by Asset Code"""
+    if assets_df.empty or 'Asset Code' not in assets_df.columns:
+        return pd.Series(dtype=str)
+    fields = [assets_df[c].astype(str).str.lower() for c in ('Asset Code', 'Item Name', 'Asset Description')
+              if c in assets_df.columns]
+    haystack = fields[0].str.cat(fields[1:], sep='\x1f') if len(fields) > 1 else fields[0]
+    return pd.Series(haystack.to_numpy(), index=assets_df['Asset Code'].astype(str).to_numpy())
+
+
+def filter_assets(assets_df, search_term, search_index=None):
+    """Filter assets by Asset Code, Item Name, or Description"""
+    if search_index is None:
+        search_index = build_search_index(assets_df)
+    matches = search_index.index[search_index.str.contains(str(search_term).lower(), regex=False)]
+    return assets_df[assets_df['Asset Code'].astype(str).isin(matches)]
@@ -0,0 +1,279 @@
+"""
+Async Google Sheets Integration Module
+"""
+import asyncio
+import json
+from urllib.parse import quote
+
+import aiohttp
+import pandas as pd
+import streamlit as st
+from google.auth.transport.requests import Request
+from google.oauth2.service_account import Credentials
+
+from config import CREDENTIALS_FILE, SCOPES, SHEETS_API_URL, DRIVE_API_URL, SHEETS_MAX_CONCURRENCY
+from google_sheets import records_from_values
+from rate_limiter import get_scheduler, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from metrics import SHEETS_CALL_SECONDS, SHEETS_BYTES
+
+
+class AsyncGoogleSheetsDB:
+    """Asyncio counterpart of GoogleSheetsDB built on the Sheets REST API"""
+
+    def __init__(self, spreadsheet_id=None, base_url=SHEETS_API_URL, credentials=None,
+                 anonymous=False, max_concurrency=SHEETS_MAX_CONCURRENCY, scheduler=None, drive_url=DRIVE_API_URL):
+        """Initialize client settings; the HTTP session is opened by `open()` or `async with`"""
+        self.spreadsheet_id = spreadsheet_id
+        self.base_url = base_url.rstrip('/')
+        self.drive_url = drive_url
+        self.credentials = credentials
+        self.anonymous = anonymous
+        self.session = None
+        self.scheduler = scheduler or get_scheduler()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._sheet_ids = {}
+
+    async def open(self):
+        """Open the HTTP session and load credentials"""
+        try:
+            if self.credentials is None and not self.anonymous:
+                self.credentials = Credentials.from_service_account_file(
+                    CREDENTIALS_FILE,
+                    scopes=SCOPES
+                )
+            if self.session is None:
+                self.session = aiohttp.ClientSession()
+            return True
+        except Exception as e:
+            st.error(f"Error connecting to Google Sheets: {str(e)}")
+            return False
+
+    async def close(self):
+        """Close the HTTP session"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _headers(self):
+        if self.anonymous or self.credentials is None:
+            return {}
+        if not self.credentials.valid:
+            # google-auth refreshes synchronously, keep it off the event loop
+            await asyncio.to_thread(self.credentials.refresh, Request())
+        return {'Authorization': f'Bearer {self.credentials.token}'}
+
+    async def _request(self, method, url, priority=PRIORITY_INTERACTIVE, idempotent=True, **kwargs):
+        """Send one API request through the shared scheduler"""
+        with SHEETS_CALL_SECONDS.time(call=f"async_{method.lower()}"):
+            return await self.scheduler.call_async(self._send, method, url, priority=priority,
+                                                   idempotent=idempotent, **kwargs)
+
+    async def _send(self, method, url, **kwargs):
+        async with self._semaphore:
+            headers = await self._headers()
+            async with self.session.request(method, url, headers=headers, **kwargs) as response:
+                response.raise_for_status()
+                body = await response.read()
+                if 'json' in kwargs:
+                    SHEETS_BYTES.inc(len(json.dumps(kwargs['json'])), direction='sent')
+                SHEETS_BYTES.inc(len(body), direction='received')
+                return json.loads(body) if body else {}
+
+    def _url(self, suffix=''):
+        return f"{self.base_url}/{self.spreadsheet_id}{suffix}"
+
+    @staticmethod
+    def _drive_literal(value):
+        """String literal for a Drive files query (backslashes and single quotes escaped)"""
+        return "'" + str(value).replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+    @staticmethod
+    def _range(sheet_name, cells=''):
+        quoted = "'" + sheet_name.replace("'", "''") + "'"
+        return quote(f"{quoted}!{cells}" if cells else quoted, safe='')
+
+    async def set_spreadsheet(self, spreadsheet_id_or_title):
+        """Set the spreadsheet by ID or title"""
+        try:
+            if len(spreadsheet_id_or_title) > 30:  # Likely an ID
+                spreadsheet_id = spreadsheet_id_or_title
+            else:  # Likely a title
+                query = (
+                    f"name = {self._drive_literal(spreadsheet_id_or_title)} and "
+                    "mimeType = 'application/vnd.google-apps.spreadsheet' and trashed = false"
+                )
+                result = await self._request('GET', self.drive_url, params={'q': query, 'fields': 'files(id)'})
+                files = result.get('files', [])
+                if not files:
+                    raise ValueError(f"Spreadsheet '{spreadsheet_id_or_title}' not found")
+                spreadsheet_id = files[0]['id']
+            self.spreadsheet_id = spreadsheet_id
+            self._sheet_ids = {}
+            await self._load_sheet_ids()
+            return True
+        except Exception as e:
+            st.error(f"Error opening spreadsheet: {str(e)}")
+            return False
+
+    async def _load_sheet_ids(self):
+        result = await self._request('GET', self._url(), params={'fields': 'sheets.properties(sheetId,title)'})
+        self._sheet_ids = {
+            sheet['properties']['title']: sheet['properties']['sheetId']
+            for sheet in result.get('sheets', [])
+        }
+
+    async def get_worksheet(self, sheet_name):
+        """Get a worksheet's sheetId by name, create if doesn't exist"""
+        if not self.spreadsheet_id:
+            return None
+        if sheet_name not in self._sheet_ids:
+            await self._load_sheet_ids()
+        if sheet_name not in self._sheet_ids:
+            # Create worksheet if it doesn't exist
+            body = {'requests': [{'addSheet': {'properties': {
+                'title': sheet_name,
+                'gridProperties': {'rowCount': 1000, 'columnCount': 20}
+            }}}]}
+            result = await self._request('POST', self._url(':batchUpdate'), priority=PRIORITY_BACKGROUND,
+                                         idempotent=False, json=body)
+            properties = result['replies'][0]['addSheet']['properties']
+            self._sheet_ids[sheet_name] = properties['sheetId']
+        return self._sheet_ids[sheet_name]
+
+    async def _get_values(self, sheet_name, cells=''):
+        result = await self._request('GET', self._url(f"/values/{self._range(sheet_name, cells)}"))
+        return result.get('values', [])
+
+    async def read_data(self, sheet_name):
+        """Read all data from a sheet as DataFrame"""
+        try:
+            if await self.get_worksheet(sheet_name) is None:
+                return pd.DataFrame()
+            values = await self._get_values(sheet_name)
+            return pd.DataFrame(records_from_values(values))
+        except Exception as e:
+            st.error(f"Error reading data from {sheet_name}: {str(e)}")
+            return pd.DataFrame()
+
+    async def read_many(self, sheet_names):
+        """Read several sheets concurrently, returning a dict of DataFrames"""
+        frames = await asyncio.gather(*(self.read_data(name) for name in sheet_names))
+        return dict(zip(sheet_names, frames))
+
+    async def write_data(self, sheet_name, data):
+        """Write data to a sheet (data can be list of dicts or DataFrame)"""
+        try:
+            if await self.get_worksheet(sheet_name) is None:
+                return False
+            # Clear existing data
+            await self._request('POST', self._url(f"/values/{self._range(sheet_name)}:clear"),
+                                priority=PRIORITY_BACKGROUND)
+
+            rows = []
+            # Handle DataFrame
+            if isinstance(data, pd.DataFrame):
+                if not data.empty:
+                    rows.append(data.columns.tolist())
+                    rows.extend(data.astype(str).values.tolist())
+            # Handle list of dicts
+            elif isinstance(data, list) and len(data) > 0:
+                headers = list(data[0].keys())
+                rows.append(headers)
+                rows.extend([str(row.get(h, '')) for h in headers] for row in data)
+            if rows:
+                # One request for the whole sheet instead of one per row
+                await self._request(
+                    'PUT', self._url(f"/values/{self._range(sheet_name, 'A1')}"), priority=PRIORITY_BACKGROUND,
+                    params={'valueInputOption': 'RAW'}, json={'values': rows}
+                )
+            return True
+        except Exception as e:
+            st.error(f"Error writing data to {sheet_name}: {str(e)}")
+            return False
+
+    async def append_row(self, sheet_name, row_data):
+        """Append a single row to a sheet"""
+        try:
+            if await self.get_worksheet(sheet_name) is None:
+                return False
+            header_rows = await self._get_values(sheet_name, '1:1')
+            headers = header_rows[0] if header_rows else []
+            rows = []
+            if not headers:
+                headers = list(row_data.keys())
+                rows.append(headers)
+
+            # Ensure all headers exist in row_data
+            row_values = []
+            for h in headers:
+                value = row_data.get(h, '')
+                # Convert None to empty string
+                if value is None:
+                    value = ''
+                row_values.append(str(value))
+            rows.append(row_values)
+
+            await self._request(
+                'POST', self._url(f"/values/{self._range(sheet_name, 'A1')}:append"), idempotent=False,
+                params={'valueInputOption': 'RAW'}, json={'values': rows}
+            )
+            return True
+        except Exception as e:
+            st.error(f"Error appending row to {sheet_name}: {str(e)}")
+            return False
+
+    async def update_row(self, sheet_name, row_index, row_data):
+        """Update a row in a sheet"""
+        try:
+            if await self.get_worksheet(sheet_name) is None:
+                return False
+            header_rows = await self._get_values(sheet_name, '1:1')
+            headers = header_rows[0] if header_rows else []
+            row_values = [row_data.get(h, '') for h in headers]
+            await self._request(
+                'PUT', self._url(f"/values/{self._range(sheet_name, f'A{row_index+1}')}"),
+                params={'valueInputOption': 'RAW'}, json={'values': [row_values]}
+            )
+            return True
+        except Exception as e:
+            st.error(f"Error updating row in {sheet_name}: {str(e)}")
+            return False
+
+    async def delete_row(self, sheet_name, row_index):
+        """Delete a row from a sheet"""
+        try:
+            sheet_id = await self.get_worksheet(sheet_name)
+            if sheet_id is None:
+                return False
+            body = {'requests': [{'deleteDimension': {'range': {
+                'sheetId': sheet_id,
+                'dimension': 'ROWS',
+                'startIndex': row_index,
+                'endIndex': row_index + 1
+            }}}]}
+            await self._request('POST', self._url(':batchUpdate'), idempotent=False, json=body)
+            return True
+        except Exception as e:
+            st.error(f"Error deleting row from {sheet_name}: {str(e)}")
+            return False
+
+    async def find_row(self, sheet_name, column_name, value):
+        """Find row index by column value"""
+        try:
+            if await self.get_worksheet(sheet_name) is None:
+                return -1
+            data = records_from_values(await self._get_values(sheet_name))
+            for idx, row in enumerate(data):
+                if str(row.get(column_name, '')).lower() == str(value).lower():
+                    return idx + 1  # +1 because row 1 is header
+            return -1
+        except Exception as e:
+            st.error(f"Error finding row in {sheet_name}: {str(e)}")
+            return -1
@@ -0,0 +1,206 @@
+"""
+Attachments Module
+
+Content-addressed store for asset images and documents. Uploads are streamed
+to a staging file in chunks while being hashed, then committed under their
+SHA-256 digest, so the same file uploaded twice is stored once. The asset
+record keeps a reference of the form ``sha256:<digest>.<ext>`` in its Image or
+Document column.
+
+Thumbnails are rendered once on a small worker pool and cached in the store
+next to the originals. Storage goes through a backend object; the local
+filesystem backend is the default and others can be added with
+register_backend().
+"""
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from PIL import Image
+
+from config import (
+    ATTACHMENT_BACKEND, ATTACHMENT_DIR, ATTACHMENT_CHUNK_SIZE, THUMBNAIL_SIZE, THUMBNAIL_WORKERS, THUMBNAIL_WAIT
+)
+from metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_PATTERN = re.compile(r'^sha256:(?P<digest>[0-9a-f]{64})(?:\.(?P<ext>[A-Za-z0-9]{1,10}))?$')
+
+
+def make_reference(digest, extension=''):
+    extension = extension.lstrip('.').lower()
+    return f"sha256:{digest}.{extension}" if extension else f"sha256:{digest}"
+
+
+def parse_reference(value):
+    """(digest, extension) for an attachment reference; None for anything else (e.g. legacy 'Yes'/'No')"""
+    match = REFERENCE_PATTERN.match(str(value or '').strip())
+    if not match:
+        return None
+    return match.group('digest'), match.group('ext') or ''
+
+
+class LocalAttachmentBackend:
+    """Blobs as files under root/<key>; staging happens inside root so commits are a rename"""
+
+    def __init__(self, root=ATTACHMENT_DIR):
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def staging_dir(self):
+        path = os.path.join(self.root, 'tmp')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def put_file(self, key, source_path):
+        """Move a staged file into place (first writer wins; duplicates are dropped)"""
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(source_path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+
+    def put_bytes(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def open(self, key):
+        return open(self._path(key), 'rb')
+
+
+BACKENDS = {'local': LocalAttachmentBackend}
+
+
+def register_backend(name, backend_class):
+    """Make a storage backend selectable with ASSET_TRACKER_ATTACHMENT_BACKEND"""
+    BACKENDS[name] = backend_class
+
+
+class AttachmentStore:
+    """Deduplicating attachment store with a cached thumbnail per image"""
+
+    def __init__(self, backend=None, thumbnail_size=THUMBNAIL_SIZE, workers=THUMBNAIL_WORKERS):
+        self.backend = backend or BACKENDS[ATTACHMENT_BACKEND]()
+        self.thumbnail_size = thumbnail_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnails')
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _blob_key(digest):
+        return f"blobs/{digest[:2]}/{digest}"
+
+    def _thumbnail_key(self, digest):
+        return f"thumbnails/{digest[:2]}/{digest}-{self.thumbnail_size}.png"
+
+    def put(self, fileobj, extension='', chunk_size=ATTACHMENT_CHUNK_SIZE):
+        """Stream a file object into the store and return its reference"""
+        staging = getattr(self.backend, 'staging_dir', lambda: None)()
+        fd, temp_path = tempfile.mkstemp(prefix='upload-', dir=staging)
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = fileobj.read(chunk_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+            key = self._blob_key(digest.hexdigest())
+            if self.backend.exists(key):
+                record_cache('attachments', True)
+                os.remove(temp_path)
+            else:
+                record_cache('attachments', False)
+                self.backend.put_file(key, temp_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return make_reference(digest.hexdigest(), extension)
+
+    def read(self, reference):
+        """Full contents of an attachment"""
+        digest, _ = parse_reference(reference)
+        with self.backend.open(self._blob_key(digest)) as f:
+            return f.read()
+
+    def _render_thumbnail(self, digest):
+        key = self._thumbnail_key(digest)
+        try:
+            if self.backend.exists(key):
+                with self.backend.open(key) as f:
+                    return f.read()
+            with self.backend.open(self._blob_key(digest)) as f:
+                image = Image.open(f)
+                # JPEGs can be decoded straight at a reduced scale
+                image.draft('RGB', (self.thumbnail_size, self.thumbnail_size))
+                image.thumbnail((self.thumbnail_size, self.thumbnail_size))
+                if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                    image = image.convert('RGBA')
+                buffer = io.BytesIO()
+                image.save(buffer, format='PNG', optimize=True)
+            data = buffer.getvalue()
+            self.backend.put_bytes(key, data)
+            return data
+        except Exception:
+            logger.warning("Could not render thumbnail for %s", digest, exc_info=True)
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(digest, None)
+
+    def request_thumbnail(self, reference):
+        """Queue thumbnail rendering on the worker pool (once per image); returns the future"""
+        digest, _ = parse_reference(reference)
+        with self._lock:
+            future = self._pending.get(digest)
+            if future is None:
+                future = self._executor.submit(self._render_thumbnail, digest)
+                self._pending[digest] = future
+            return future
+
+    def thumbnail(self, reference, wait=THUMBNAIL_WAIT):
+        """PNG thumbnail bytes, rendering it if needed; None if it is not ready within `wait` seconds"""
+        parsed = parse_reference(reference)
+        if parsed is None:
+            return None
+        key = self._thumbnail_key(parsed[0])
+        if self.backend.exists(key):
+            record_cache('thumbnails', True)
+            with self.backend.open(key) as f:
+                return f.read()
+        record_cache('thumbnails', False)
+        try:
+            return self.request_thumbnail(reference).result(timeout=wait)
+        except TimeoutError:
+            return None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_attachment_store():
+    """Process-wide attachment store using the configured backend"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AttachmentStore()
+        return _store
@@ -3,13 +3,20 @@ Authentication Module
 """
 import streamlit as st
 import hashlib
+import re
 from google_sheets import GoogleSheetsDB
-from config import SESSION_KEYS, SHEETS
+from config import SESSION_KEYS, SHEETS, USER_LOCATIONS_COLUMN
 
 def hash_password(password):
     """Hash password using SHA256"""
     return hashlib.sha256(password.encode()).hexdigest()
 
+def parse_locations(value, role='User'):
+    """Location names/patterns from a Users sheet cell; empty (every location) for admins and blank cells"""
+    if role == 'Admin' or value is None:
+        return []
+    return [part.strip() for part in re.split(r'[;\n]', str(value)) if part.strip()]
+
 def authenticate_user(db, username, password):
     """Authenticate user credentials"""
     try:
@@ -24,10 +31,12 @@ def authenticate_user(db, username, password):
         ]
         
         if not user.empty:
+            role = user.iloc[0].get('Role', 'User')
             return {
                 'username': user.iloc[0]['Username'],
-                'role': user.iloc[0].get('Role', 'User'),
-                'user_id': user.iloc[0].get('ID', '')
+                'role': role,
+                'user_id': user.iloc[0].get('ID', ''),
+                'locations': parse_locations(user.iloc[0].get(USER_LOCATIONS_COLUMN), role)
             }
         return None
     except Exception as e:
@@ -75,7 +84,8 @@ def get_current_user():
         return {
             'username': st.session_state.get(SESSION_KEYS['username'], ''),
             'role': st.session_state.get(SESSION_KEYS['user_role'], 'User'),
-            'user_id': st.session_state.get(SESSION_KEYS['user_id'], '')
+            'user_id': st.session_state.get(SESSION_KEYS['user_id'], ''),
+            'locations': st.session_state.get(SESSION_KEYS['user_locations'], [])
         }
     return None
 
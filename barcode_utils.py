@@ -1,15 +1,24 @@
 """
 Barcode Utilities Module
 """
-import barcode
-from barcode.writer import ImageWriter
-from PIL import Image
 import io
+import threading
 import streamlit as st
+import pandas as pd
+from collections import OrderedDict
 from datetime import datetime
+from config import LABEL_CACHE_SIZE, LABEL_PRERENDER_LIMIT
+
+# Rendered labels shared by all sessions, keyed by the text printed on them
+_label_cache = OrderedDict()
+_label_cache_lock = threading.Lock()
 
 def generate_barcode(code, format_type='code128'):
     """Generate barcode image"""
+    # Imported on first use so pages without barcodes don't pay for them
+    import barcode
+    from barcode.writer import ImageWriter
+    from PIL import Image
     try:
         if format_type == 'code128':
             code_class = barcode.get_barcode_class('code128')
@@ -46,6 +55,7 @@ def generate_asset_code(prefix='AST', category_code='', subcategory_code='', exi
 
 def create_barcode_label(asset_code, item_name, location=''):
     """Create a printable barcode label"""
+    from PIL import Image, ImageDraw, ImageFont
     barcode_img = generate_barcode(asset_code)
     if barcode_img:
         # Create label with text
@@ -55,7 +65,6 @@ def create_barcode_label(asset_code, item_name, location=''):
         label.paste(barcode_img, (50, 20))
         
         # Add text
-        from PIL import ImageDraw, ImageFont
         draw = ImageDraw.Draw(label)
         try:
             font = ImageFont.truetype("arial.ttf", 16)
@@ -70,3 +79,34 @@ def create_barcode_label(asset_code, item_name, location=''):
         return label
     return None
 
+def get_barcode_label(asset_code, item_name, location=''):
+    """Barcode label from the shared cache, rendering it on a miss"""
+    key = (str(asset_code), str(item_name), str(location or ''))
+    with _label_cache_lock:
+        label = _label_cache.get(key)
+        if label is not None:
+            _label_cache.move_to_end(key)
+            return label
+    label = create_barcode_label(*key)
+    if label is not None:
+        with _label_cache_lock:
+            _label_cache[key] = label
+            while len(_label_cache) > LABEL_CACHE_SIZE:
+                _label_cache.popitem(last=False)
+    return label
+
+def prerender_labels(assets_df, limit=LABEL_PRERENDER_LIMIT):
+    """Render labels for the most recently created assets that are not cached yet; returns how many"""
+    if assets_df.empty or 'Asset Code' not in assets_df.columns:
+        return 0
+    if 'Created At' in assets_df.columns:
+        order = pd.to_datetime(assets_df['Created At'], errors='coerce').argsort(kind='stable')
+        assets_df = assets_df.iloc[order]
+    rendered = 0
+    for asset in assets_df.tail(limit).to_dict('records'):
+        key = (str(asset.get('Asset Code', '')), str(asset.get('Item Name', '')), str(asset.get('Location', '') or ''))
+        with _label_cache_lock:
+            cached = key in _label_cache
+        if not cached and get_barcode_label(*key) is not None:
+            rendered += 1
+    return rendered
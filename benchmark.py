@@ -0,0 +1,204 @@
+"""
+Offline Benchmark Suite
+
+Runs the app's hot paths against the in-memory fake Sheets backend with
+synthetic data and writes the timings to JSON for regression tracking.
+
+    python benchmark.py --assets 10000 --movements 50000 --latency 0.05
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from fake_sheets import FakeClient
+from google_sheets import GoogleSheetsDB
+from rate_limiter import RequestScheduler
+from snapshot_cache import SnapshotCache
+from synthetic_data import populate
+from auth import authenticate_user
+from dashboard import show_dashboard
+from barcode_utils import generate_asset_code, create_barcode_label
+from movement_log import get_movement_log
+from asset_search import filter_assets
+from config import SHEETS
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark function taking the shared context"""
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+@benchmark('login')
+def bench_login(ctx):
+    assert authenticate_user(ctx['db'], 'admin', 'password') is not None
+
+
+@benchmark('dashboard')
+def bench_dashboard(ctx):
+    show_dashboard(ctx['db'])
+
+
+@benchmark('search')
+def bench_search(ctx):
+    assets_df = ctx['db'].read_data(SHEETS['assets'])
+    filter_assets(assets_df, ctx['rng'].choice(['laptop', 'chair', 'AST-IT', 'spare', 'forklift']))
+
+
+@benchmark('add_asset')
+def bench_add_asset(ctx):
+    db = ctx['db']
+    existing_df = db.read_data(SHEETS['assets'])
+    asset_code = generate_asset_code('AST', 'ITE', 'LAP', existing_df['Asset Code'].tolist())
+    db.append_row(SHEETS['assets'], {
+        'Asset Code': asset_code,
+        'Item Name': 'Benchmark Laptop',
+        'Asset Category': 'IT Equipment',
+        'Asset Subcategory': 'Laptop',
+        'Amount': '999.0',
+        'Location': ctx['locations'][0],
+        'Asset Status': 'Active',
+        'Created At': str(datetime.now())
+    })
+
+
+@benchmark('move')
+def bench_move(ctx):
+    rng = ctx['rng']
+    success, message = get_movement_log(ctx['db']).move_asset(
+        rng.choice(ctx['asset_codes']), rng.choice(ctx['locations']), moved_by='benchmark'
+    )
+    assert success, message
+
+
+@benchmark('labels')
+def bench_labels(ctx):
+    assets_df = ctx['db'].read_data(SHEETS['assets'])
+    for _, asset in assets_df.head(ctx['labels']).iterrows():
+        create_barcode_label(asset['Asset Code'], asset['Item Name'], asset['Location'])
+
+
+@benchmark('cold_start')
+def bench_cold_start(ctx):
+    # A new session: fresh GoogleSheetsDB whose reads are served from the disk snapshots
+    db = GoogleSheetsDB(client=ctx['client'], scheduler=ctx['db'].scheduler,
+                        snapshot_cache=SnapshotCache(ctx['snapshot_dir']))
+    db.set_spreadsheet(ctx['db'].spreadsheet_id)
+    show_dashboard(db)
+
+
+@benchmark('startup')
+def bench_startup(ctx):
+    # Cold process start: a fresh interpreter importing app.py (per-page modules load lazily)
+    subprocess.run([sys.executable, '-c', 'import app'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                   check=True, capture_output=True)
+
+
+def setup(args):
+    """Build a fake spreadsheet filled with synthetic data and a GoogleSheetsDB bound to it"""
+    client = FakeClient()
+    spreadsheet = client.create('Asset Tracker Benchmark')
+    data = populate(client, spreadsheet, args.assets, args.movements, args.locations, args.seed)
+    # Simulated latency and quota apply to the benchmarked calls only, not to loading the data
+    client.backend.latency = args.latency
+    client.backend.latency_per_cell = args.latency_per_cell
+    client.backend.quota_per_minute = args.quota
+    scheduler = RequestScheduler(requests_per_minute=args.quota or 10 ** 9)
+    # Snapshots are only used by the cold_start benchmark; the other benchmarks measure live reads
+    db = GoogleSheetsDB(spreadsheet.id, client=client, scheduler=scheduler, snapshot_cache=SnapshotCache(None))
+    return {
+        'client': client,
+        'db': db,
+        'rng': random.Random(args.seed),
+        'asset_codes': data['assets']['Asset Code'].tolist(),
+        'locations': data['master_data'][SHEETS['locations']]['Location Name'].tolist(),
+        'labels': args.labels,
+        'snapshot_dir': tempfile.mkdtemp(prefix='asset-tracker-snapshots-'),
+    }
+
+
+def _quiet_streamlit():
+    """Streamlit calls outside `streamlit run` log a "missing ScriptRunContext" warning each"""
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith('streamlit'):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+
+def run(names, ctx, repeat, warmup):
+    results = {}
+    backend = ctx['client'].backend
+    for name in names:
+        fn = BENCHMARKS[name]
+        for _ in range(warmup):
+            fn(ctx)
+        _quiet_streamlit()
+        timings = []
+        backend.reset_counts()
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn(ctx)
+            timings.append(time.perf_counter() - started)
+        timings = np.array(timings)
+        results[name] = {
+            'repeat': repeat,
+            'mean_seconds': float(timings.mean()),
+            'min_seconds': float(timings.min()),
+            'max_seconds': float(timings.max()),
+            'p50_seconds': float(np.percentile(timings, 50)),
+            'p95_seconds': float(np.percentile(timings, 95)),
+            'api_calls_per_run': sum(backend.calls.values()) / repeat,
+            'api_calls_by_method': {k: v / repeat for k, v in sorted(backend.calls.items())},
+            'cells_per_run': backend.cells / repeat,
+        }
+        print(f"{name:<12} mean {results[name]['mean_seconds'] * 1000:9.2f} ms   "
+              f"p95 {results[name]['p95_seconds'] * 1000:9.2f} ms   "
+              f"api calls {results[name]['api_calls_per_run']:6.1f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Asset Tracker offline benchmarks")
+    parser.add_argument('--assets', type=int, default=1000)
+    parser.add_argument('--movements', type=int, default=5000)
+    parser.add_argument('--locations', type=int, default=40)
+    parser.add_argument('--latency', type=float, default=0.0, help="simulated seconds per API call")
+    parser.add_argument('--latency-per-cell', type=float, default=0.0, help="simulated seconds per cell transferred")
+    parser.add_argument('--quota', type=int, default=0, help="simulated requests per minute (0 = unlimited)")
+    parser.add_argument('--labels', type=int, default=20, help="labels rendered by the labels benchmark")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='*', choices=sorted(BENCHMARKS), help="benchmarks to run (default: all)")
+    parser.add_argument('--output', default='benchmark_results.json')
+    args = parser.parse_args()
+
+    ctx = setup(args)
+    _quiet_streamlit()
+    results = run(args.only or list(BENCHMARKS), ctx, args.repeat, args.warmup)
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'parameters': vars(args),
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
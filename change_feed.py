@@ -0,0 +1,109 @@
+"""
+Change Feed Module
+
+Process-wide, monotonically versioned log of the writes made through
+GoogleSheetsDB (append_row, update_row, delete_row, write_data) and the
+movement log's batched moves. Each change names the sheet and data row it
+touched and carries the row values before and after the write when the writer
+knew them, so readers can patch what they already hold instead of re-reading:
+delta-sync snapshots patch their frames, the dashboard patches the tiles whose
+columns changed, and open sessions poll version() to rerun only when something
+changed. Writes made by other processes or directly in Google Sheets are not in
+the feed; delta sync still picks those up.
+"""
+import threading
+import time
+from collections import deque
+
+from config import CHANGE_FEED_SIZE
+
+OPERATIONS = ('append', 'update', 'patch', 'delete', 'reset')
+
+
+class Change:
+    """One recorded write.
+
+    row is the 0-based data row (sheet row minus the header row), None for appends and resets.
+    before/after are {column: value}: whole rows for append/update/delete, only the changed
+    columns (plus the row's first column) for patch; before is None when the writer did not know it.
+    """
+    __slots__ = ('version', 'spreadsheet_id', 'sheet_name', 'operation', 'row', 'before', 'after', 'at')
+
+    def __init__(self, version, spreadsheet_id, sheet_name, operation, row=None, before=None, after=None):
+        self.version = version
+        self.spreadsheet_id = spreadsheet_id
+        self.sheet_name = sheet_name
+        self.operation = operation
+        self.row = row
+        self.before = before
+        self.after = after
+        self.at = time.time()
+
+    def __repr__(self):
+        return f"Change({self.version}, {self.sheet_name!r}, {self.operation!r}, row={self.row})"
+
+
+class ChangeFeed:
+    """Bounded, versioned log of changes; versions only ever increase"""
+
+    def __init__(self, size=CHANGE_FEED_SIZE):
+        self._changes = deque(maxlen=size)
+        self._version = 0
+        self._latest = {}  # spreadsheet id -> version of its most recent change
+        self._lock = threading.Lock()
+
+    def record(self, spreadsheet_id, sheet_name, operation, row=None, before=None, after=None):
+        """Append a change and return its version"""
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown change operation {operation}")
+        with self._lock:
+            self._version += 1
+            self._changes.append(Change(self._version, spreadsheet_id, sheet_name, operation, row, before, after))
+            self._latest[spreadsheet_id] = self._version
+            return self._version
+
+    def version(self, spreadsheet_ids=None):
+        """Latest version overall, or of the latest change to any of the given spreadsheets (0 if none)"""
+        if spreadsheet_ids is None:
+            return self._version
+        if isinstance(spreadsheet_ids, str):
+            spreadsheet_ids = [spreadsheet_ids]
+        latest = self._latest
+        return max((latest.get(spreadsheet_id, 0) for spreadsheet_id in spreadsheet_ids), default=0)
+
+    def since(self, version, spreadsheet_ids=None, sheet_name=None):
+        """Changes newer than version, oldest first; None if some were already dropped from the log"""
+        if isinstance(spreadsheet_ids, str):
+            spreadsheet_ids = [spreadsheet_ids]
+        with self._lock:
+            if self._version <= version:
+                return []
+            if not self._changes or self._changes[0].version > version + 1:
+                return None
+            changes = []
+            for change in reversed(self._changes):
+                if change.version <= version:
+                    break
+                changes.append(change)
+        changes.reverse()
+        return [change for change in changes
+                if (spreadsheet_ids is None or change.spreadsheet_id in spreadsheet_ids)
+                and (sheet_name is None or change.sheet_name == sheet_name)]
+
+
+def spreadsheet_ids(db):
+    """Spreadsheets whose changes concern db (every shard of a sharded database)"""
+    return db.shard_ids() if hasattr(db, 'shard_ids') else [db.spreadsheet_id]
+
+
+_feed = None
+_feed_lock = threading.Lock()
+
+
+def get_change_feed():
+    """Process-wide change feed shared by every session"""
+    global _feed
+    with _feed_lock:
+        if _feed is None:
+            _feed = ChangeFeed()
+        return _feed
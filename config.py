@@ -16,20 +16,130 @@ SHEETS = {
     'asset_types': 'AssetTypes',
     'brands': 'Brands',
     'assets': 'Assets',
-    'asset_movements': 'AssetMovements'
+    'asset_movements': 'AssetMovements',
+    'asset_movement_index': 'AssetMovementIndex',
+    'duplicate_reviews': 'DuplicateReviews'
 }
 
+# Movement Log Layout (monthly partitions of the AssetMovements history)
+MOVEMENT_PARTITION_FORMAT = 'AssetMovements_%Y_%m'
+MOVEMENT_COLUMNS = ['Asset Code', 'From Location', 'To Location', 'Reason', 'Date', 'Moved By', 'Created At']
+MOVEMENT_INDEX_COLUMNS = ['Asset Code', 'Date', 'Partition']
+
 # Asset Status Options
 ASSET_STATUS_OPTIONS = ['Active', 'Inactive', 'Under Maintenance', 'Disposed', 'Lost']
 
 # Ownership Options
 OWNERSHIP_OPTIONS = ['Company', 'Leased', 'Rented']
 
+# Warranty and Depreciation
+WARRANTY_ALERT_DAYS = [30, 60, 90]
+DEPRECIATION_METHOD = 'straight_line'  # or 'declining_balance'
+DECLINING_BALANCE_FACTOR = 2.0  # 2.0 = double-declining balance
+DEFAULT_USEFUL_LIFE_YEARS = 5
+USEFUL_LIFE_YEARS = {
+    'IT Equipment': 3,
+    'Office Equipment': 5,
+    'Appliances': 7,
+    'Furniture': 10,
+    'Vehicles': 8,
+    'Machinery': 10
+}
+
 # Session State Keys
 SESSION_KEYS = {
     'authenticated': 'authenticated',
     'username': 'username',
     'user_role': 'user_role',
-    'user_id': 'user_id'
+    'user_id': 'user_id',
+    'user_locations': 'user_locations'
 }
 
+# Google Sheets API Quotas
+SHEETS_API_URL = "https://sheets.googleapis.com/v4/spreadsheets"
+DRIVE_API_URL = "https://www.googleapis.com/drive/v3/files"
+SHEETS_REQUESTS_PER_MINUTE = 60
+SHEETS_MAX_CONCURRENCY = 8
+SHEETS_MAX_RETRIES = 5
+SHEETS_BACKOFF_BASE = 1.0
+SHEETS_BACKOFF_MAX = 32.0
+
+# Instrumentation (Prometheus text written to a file and/or served on a port)
+METRICS_FILE = os.environ.get('ASSET_TRACKER_METRICS_FILE', '')
+METRICS_PORT = int(os.environ.get('ASSET_TRACKER_METRICS_PORT', '0') or 0)
+# Interface the metrics port binds to; set 0.0.0.0 to let a Prometheus server on another host scrape it
+METRICS_HOST = os.environ.get('ASSET_TRACKER_METRICS_HOST', '127.0.0.1')
+
+# Delta Sync (sheets re-read incrementally using a per-row Updated At stamp)
+UPDATED_AT_COLUMN = 'Updated At'
+DELTA_SYNC_SHEETS = [SHEETS['assets']]
+DELTA_SYNC_MAX_AGE = 30  # seconds to trust an unchanged Drive version before re-checking rows
+DELTA_SYNC_FULL_FETCH_RATIO = 0.5  # above this share of changed rows, re-download the whole sheet
+DELTA_SYNC_FULL_REFRESH = 600  # seconds between full reloads (picks up edits made directly in Sheets)
+
+# Snapshot Cache (last-known sheet contents on local disk for fast cold starts; needs pyarrow)
+SNAPSHOT_CACHE_DIR = os.environ.get('ASSET_TRACKER_SNAPSHOT_DIR', '.snapshot_cache')
+SNAPSHOT_CACHE_EXCLUDE = [SHEETS['users']]  # always read live so revoked accounts cannot log in
+
+# Sharding (optional shard map spreading Assets and their movement logs over several spreadsheets)
+SHARDS_FILE = os.environ.get('ASSET_TRACKER_SHARDS_FILE', 'shards.json')
+SHARDED_SHEETS = [SHEETS['assets']]
+
+# Export (chunked CSV/XLSX/Parquet downloads; a port enables the streaming HTTP endpoint)
+EXPORT_CHUNK_ROWS = 5000  # rows per ranged read; an export holds one chunk in memory at a time
+EXPORT_FORMATS = ['csv', 'xlsx', 'parquet']
+EXPORT_PORT = int(os.environ.get('ASSET_TRACKER_EXPORT_PORT', '0') or 0)
+# Interface the export port binds to; set 0.0.0.0 (behind a TLS proxy) when browsers reach it from other hosts
+EXPORT_HOST = os.environ.get('ASSET_TRACKER_EXPORT_HOST', '127.0.0.1')
+EXPORT_BASE_URL = os.environ.get('ASSET_TRACKER_EXPORT_URL', '')  # default http://localhost:<EXPORT_PORT>
+EXPORT_SECRET = os.environ.get('ASSET_TRACKER_EXPORT_SECRET', '')  # signs download links; random per process if unset
+EXPORT_LINK_TTL = 900  # seconds a signed download link stays valid
+
+# Attachments (content-addressed image/document store with cached thumbnails)
+ATTACHMENT_BACKEND = os.environ.get('ASSET_TRACKER_ATTACHMENT_BACKEND', 'local')
+ATTACHMENT_DIR = os.environ.get('ASSET_TRACKER_ATTACHMENT_DIR', '.attachments')
+ATTACHMENT_CHUNK_SIZE = 1024 * 1024  # bytes hashed and written per step of an upload
+THUMBNAIL_SIZE = 256  # longest side in pixels
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_WAIT = 2.0  # seconds a page waits for a thumbnail that is still rendering
+
+# Reference Data (Categories, Subcategories, Brands, Locations cached for the asset forms)
+REFERENCE_DATA_TTL = 600  # seconds before re-reading; writes through the app invalidate immediately
+
+# HTTP API (headless JSON API process started with `python api.py`)
+API_HOST = os.environ.get('ASSET_TRACKER_API_HOST', '127.0.0.1')  # plain HTTP: expose only behind a TLS proxy
+API_PORT = int(os.environ.get('ASSET_TRACKER_API_PORT', '8600') or 8600)
+API_SPREADSHEET = os.environ.get('ASSET_TRACKER_SPREADSHEET', '')  # ID or title served by the API
+API_REFRESH_INTERVAL = 5  # seconds reads are served from memory before re-checking the Drive version
+API_AUTH_TTL = 300  # seconds a successful login is trusted before the Users sheet is read again
+API_DEFAULT_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+API_MAX_LOOKUP_CODES = 1000
+API_LIST_CACHE_SIZE = 64  # filtered listings kept per index version
+API_GZIP_MIN_BYTES = 1024  # smaller responses are sent uncompressed
+
+# Change Feed (in-process log of writes; sessions patch their caches instead of re-reading)
+CHANGE_FEED_SIZE = 5000  # changes kept; a reader further behind falls back to delta sync
+CHANGE_FEED_POLL_INTERVAL = 5  # seconds between the dashboard tiles' checks for new changes
+
+# Location Scoping (users with a Locations entry only see, and only download, the assets at those locations)
+USER_LOCATIONS_COLUMN = 'Locations'  # Users sheet column: names or patterns like "Site 01 - *", separated by ';'
+LOCATION_SCOPED_SHEETS = [SHEETS['assets']]
+LOCATION_SCOPE_COLUMN = 'Location'
+LOCATION_SCOPE_RANGES_PER_CALL = 100  # row ranges per batch read of in-scope rows
+LOCATION_SCOPE_MAX_CALLS = 3  # when in-scope rows need more ranged reads than this, one full read is cheaper
+
+# Duplicate Detection (MinHash/LSH blocking over Item Name and Description words)
+DUPLICATE_NUM_HASHES = 32  # MinHash values per asset
+DUPLICATE_BANDS = 8  # LSH bands; assets sharing all values of any band become candidates
+DUPLICATE_WINDOW = 5  # neighbours each asset is compared with inside an LSH bucket
+DUPLICATE_THRESHOLD = 0.85  # pairs scoring at least this are flagged (see duplicates.SCORE_WEIGHTS)
+
+# Data Quality (sheets read by a full check; the movement index can be large and is opt-in)
+DATA_QUALITY_SHEETS = [SHEETS[name] for name in ('users', 'locations', 'categories', 'subcategories',
+                                                 'asset_types', 'brands', 'assets')]
+
+# Background Jobs
+JOB_REFRESH_INTERVAL = 300  # seconds between periodic runs of each precomputation job
+LABEL_PRERENDER_LIMIT = 200  # newest assets whose labels are pre-rendered per run
+LABEL_CACHE_SIZE = 2000
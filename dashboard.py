@@ -2,33 +2,116 @@
 Dashboard Module with Graphs
 """
 import streamlit as st
-import plotly.express as px
-import plotly.graph_objects as go
 import pandas as pd
+from datetime import datetime
 from google_sheets import GoogleSheetsDB
 from config import SHEETS
+from movement_log import get_movement_log
+from inventory_history import get_inventory_history
+from jobs import get_job_scheduler
+from change_feed import get_change_feed, spreadsheet_ids
+from lazy_imports import lazy_import
+from analytics import asset_analytics, expiring_within, book_value_by
+from config import WARRANTY_ALERT_DAYS, CHANGE_FEED_POLL_INTERVAL
 
-def show_dashboard(db):
-    """Display dashboard with graphs and statistics"""
-    st.title("📊 Asset Tracker Dashboard")
-    
-    # Get data
-    assets_df = db.read_data(SHEETS['assets'])
-    locations_df = db.read_data(SHEETS['locations'])
-    categories_df = db.read_data(SHEETS['categories'])
-    movements_df = db.read_data(SHEETS['asset_movements'])
-    
-    if assets_df.empty:
-        st.info("No assets found. Add assets to see dashboard statistics.")
-        return
-    
+def compute_dashboard_aggregates(assets_df, locations_df):
+    """Key metrics and chart series for the dashboard"""
+    amounts = pd.to_numeric(assets_df.get('Amount', pd.Series(dtype=float)), errors='coerce')
+    aggregates = {
+        'total_assets': len(assets_df),
+        'active_assets': int(assets_df.get('Asset Status', pd.Series(dtype=str)).astype(str)
+                             .str.contains('Active', case=False, na=False).sum()),
+        'total_value': amounts.sum(),
+        'total_locations': len(locations_df) if not locations_df.empty else 0,
+        'status_counts': None,
+        'location_counts': None,
+        'category_counts': None,
+        'department_value': None,
+    }
+    if 'Asset Status' in assets_df.columns:
+        aggregates['status_counts'] = assets_df['Asset Status'].value_counts()
+    # Full series (not just the top 10) so changes from the change feed can be applied to them
+    if 'Location' in assets_df.columns and not assets_df['Location'].isna().all():
+        aggregates['location_counts'] = assets_df['Location'].value_counts()
+    if 'Asset Category' in assets_df.columns:
+        aggregates['category_counts'] = assets_df['Asset Category'].value_counts()
+    if 'Department' in assets_df.columns:
+        aggregates['department_value'] = amounts.groupby(assets_df['Department']).sum()
+    return aggregates
+
+COUNT_TILES = {'status_counts': 'Asset Status', 'location_counts': 'Location', 'category_counts': 'Asset Category'}
+
+def _add(series, key, amount):
+    series = series.copy()
+    series[key] = series.get(key, 0) + amount
+    return series[series != 0]
+
+def patch_dashboard_aggregates(aggregates, changes, scope=None):
+    """Apply Assets changes from the change feed to the tiles whose columns they touch (None if one can't be)"""
+    aggregates = dict(aggregates)
+    for change in changes:
+        if change.operation == 'reset' or (change.operation != 'append' and change.before is None):
+            return None
+        rows = []
+        if change.operation in ('update', 'patch', 'delete'):
+            rows.append((change.before, -1))
+        if change.operation in ('append', 'update', 'patch'):
+            rows.append((change.after or {}, 1))
+        if scope is not None:
+            # Rows count only while at one of the scope's locations (a move can bring one in or take it out)
+            if any('Location' not in values for values, _ in rows):
+                return None
+            rows = [(values, sign) for values, sign in rows if str(values['Location']) in scope]
+        for values, sign in rows:
+            if change.operation != 'patch':
+                aggregates['total_assets'] += sign
+            if 'Asset Status' in values:
+                aggregates['active_assets'] += sign * ('active' in str(values['Asset Status']).lower())
+            for tile, column in COUNT_TILES.items():
+                if column in values and aggregates[tile] is not None:
+                    aggregates[tile] = _add(aggregates[tile], values[column], sign)
+            if 'Amount' in values:
+                amount = pd.to_numeric(pd.Series([values['Amount']]), errors='coerce').fillna(0).iloc[0]
+                aggregates['total_value'] += sign * amount
+                if aggregates['department_value'] is not None:
+                    if 'Department' not in values:
+                        return None
+                    aggregates['department_value'] = _add(aggregates['department_value'], values['Department'],
+                                                          sign * amount)
+    return aggregates
+
+def dashboard_aggregates(db, assets_df, locations_df, feed_version):
+    """Aggregates from the background job, else this session's copy patched with newer changes, else computed"""
+    cached = st.session_state.get('dashboard_tiles')
+    # Changes the feed does not carry (other processes, edits in Sheets) show up as a new revision of the frame
+    revision = db.data_revision(SHEETS['assets'])
+    aggregates = get_job_scheduler().result(db, 'dashboard_aggregates')
+    if aggregates is None and cached is not None and cached['spreadsheet_id'] == db.spreadsheet_id \
+            and cached['scope'] == db.scope and revision is not None and cached['revision'] == revision:
+        changes = get_change_feed().since(cached['feed_version'], spreadsheet_ids(db), SHEETS['assets'])
+        if changes is not None:
+            aggregates = patch_dashboard_aggregates(cached['aggregates'], changes, db.scope)
+    if aggregates is None:
+        aggregates = compute_dashboard_aggregates(assets_df, locations_df)
+    # Locations are counted on every render; the tiles above only follow Assets
+    aggregates = dict(aggregates, total_locations=len(locations_df) if db.scope is None else len(db.scope))
+    st.session_state.dashboard_tiles = {'spreadsheet_id': db.spreadsheet_id, 'scope': db.scope, 'revision': revision,
+                                        'feed_version': feed_version, 'aggregates': aggregates}
+    return aggregates
+
+def precompute_dashboard(db):
+    """Background job: dashboard aggregates for the current data"""
+    return compute_dashboard_aggregates(db.read_data(SHEETS['assets']), db.read_data(SHEETS['locations']))
+
+def draw_tiles(px, aggregates):
+    """Key metrics and the count/value charts"""
     # Key Metrics
     col1, col2, col3, col4 = st.columns(4)
     
-    total_assets = len(assets_df)
-    active_assets = len(assets_df[assets_df.get('Asset Status', '').str.contains('Active', case=False, na=False)])
-    total_value = pd.to_numeric(assets_df.get('Amount', 0), errors='coerce').sum()
-    total_locations = len(locations_df) if not locations_df.empty else 0
+    total_assets = aggregates['total_assets']
+    active_assets = aggregates['active_assets']
+    total_value = aggregates['total_value']
+    total_locations = aggregates['total_locations']
     
     with col1:
         st.metric("Total Assets", total_assets)
@@ -46,8 +129,8 @@ def show_dashboard(db):
     
     with col1:
         st.subheader("Assets by Status")
-        if 'Asset Status' in assets_df.columns:
-            status_counts = assets_df['Asset Status'].value_counts()
+        if aggregates['status_counts'] is not None:
+            status_counts = aggregates['status_counts']
             fig_status = px.pie(
                 values=status_counts.values,
                 names=status_counts.index,
@@ -59,8 +142,8 @@ def show_dashboard(db):
     
     with col2:
         st.subheader("Assets by Location")
-        if 'Location' in assets_df.columns and not assets_df['Location'].isna().all():
-            location_counts = assets_df['Location'].value_counts().head(10)
+        if aggregates['location_counts'] is not None:
+            location_counts = aggregates['location_counts'].sort_values(ascending=False).head(10)
             fig_location = px.bar(
                 x=location_counts.index,
                 y=location_counts.values,
@@ -76,8 +159,8 @@ def show_dashboard(db):
     
     with col1:
         st.subheader("Assets by Category")
-        if 'Asset Category' in assets_df.columns:
-            category_counts = assets_df['Asset Category'].value_counts().head(10)
+        if aggregates['category_counts'] is not None:
+            category_counts = aggregates['category_counts'].sort_values(ascending=False).head(10)
             fig_category = px.bar(
                 x=category_counts.values,
                 y=category_counts.index,
@@ -91,10 +174,8 @@ def show_dashboard(db):
     
     with col2:
         st.subheader("Assets Value by Department")
-        if 'Department' in assets_df.columns:
-            dept_value = assets_df.groupby('Department').apply(
-                lambda x: pd.to_numeric(x.get('Amount', 0), errors='coerce').sum()
-            ).sort_values(ascending=False).head(10)
+        if aggregates['department_value'] is not None:
+            dept_value = aggregates['department_value'].sort_values(ascending=False).head(10)
             fig_dept = px.bar(
                 x=dept_value.index,
                 y=dept_value.values,
@@ -104,11 +185,91 @@ def show_dashboard(db):
             st.plotly_chart(fig_dept, use_container_width=True)
         else:
             st.info("Department data not available")
+
+@st.fragment(run_every=CHANGE_FEED_POLL_INTERVAL)
+def live_tiles(db):
+    """The tiles as a fragment: re-run alone on a timer, redrawn from patched aggregates when the feed moved"""
+    cached = st.session_state.get('dashboard_tiles')
+    # Nothing written through this server and no new rows read from Sheets since the tiles were computed
+    if cached is not None and cached['spreadsheet_id'] == db.spreadsheet_id and cached['scope'] == db.scope \
+            and cached['revision'] == db.data_revision(SHEETS['assets']) \
+            and get_change_feed().version(spreadsheet_ids(db)) <= cached['feed_version']:
+        aggregates = cached['aggregates']
+    else:
+        # The feed version is taken first so changes made while reading are patched in next time
+        feed_version = get_change_feed().version()
+        aggregates = dashboard_aggregates(db, db.read_data(SHEETS['assets']), db.read_data(SHEETS['locations']),
+                                          feed_version)
+    draw_tiles(lazy_import('plotly.express', page='Dashboard'), aggregates)
+
+def show_dashboard(db):
+    """Display dashboard with graphs and statistics"""
+    # plotly is the heaviest import in the app; only the dashboard needs it
+    px = lazy_import('plotly.express', page='Dashboard')
+    st.title("📊 Asset Tracker Dashboard")
+    
+    # Get data
+    assets_df = db.read_data(SHEETS['assets'])
+    locations_df = db.read_data(SHEETS['locations'])
+    categories_df = db.read_data(SHEETS['categories'])
+    
+    as_of_date = None
+    
+    # Point-in-time view: locations replayed from the movement log
+    if st.checkbox("View as of date") and 'Asset Code' in assets_df.columns:
+        as_of_date = st.date_input("As of", value=datetime.now().date())
+        inventory = get_inventory_history(db).inventory_at(as_of_date).set_index('Asset Code')['Location']
+        codes = assets_df['Asset Code'].astype(str)
+        assets_df = assets_df[codes.isin(inventory.index)].assign(Location=codes.map(inventory))
+        st.caption(f"Showing asset locations as of {as_of_date}. Other fields show current values.")
+    
+    if assets_df.empty:
+        st.info("No assets found. Add assets to see dashboard statistics.")
+        return
+    
+    if as_of_date is not None:
+        draw_tiles(px, compute_dashboard_aggregates(assets_df, locations_df))
+    else:
+        live_tiles(db)
+    
+    # Warranty and Depreciation
+    st.divider()
+    analytics = asset_analytics(assets_df, as_of=as_of_date)
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.subheader("Warranties Expiring")
+        metric_cols = st.columns(len(WARRANTY_ALERT_DAYS))
+        for metric_col, days in zip(metric_cols, WARRANTY_ALERT_DAYS):
+            with metric_col:
+                st.metric(f"Within {days} Days", len(expiring_within(analytics, days)))
+        window = st.selectbox("Show warranties expiring within", WARRANTY_ALERT_DAYS, format_func=lambda d: f"{d} days")
+        expiring = expiring_within(analytics, window)
+        if not expiring.empty:
+            details = assets_df.loc[expiring.index, [c for c in ['Item Name', 'Location', 'Warranty'] if c in assets_df.columns]]
+            st.dataframe(pd.concat([expiring[['Asset Code', 'Warranty Expiry', 'Days To Expiry']], details], axis=1),
+                         use_container_width=True)
+        else:
+            st.info(f"No warranties expire in the next {window} days")
+    
+    with col2:
+        st.subheader("Book Value by Department")
+        book_value = book_value_by(analytics, assets_df, 'Department').head(10)
+        fig_book = px.bar(
+            book_value.reset_index(),
+            x='Department',
+            y=['Cost', 'Book Value'],
+            barmode='group',
+            title="Cost vs Book Value (Top 10 Departments)",
+            labels={'value': 'Value ($)', 'variable': ''}
+        )
+        st.plotly_chart(fig_book, use_container_width=True)
+        st.metric("Total Book Value", f"${analytics['Book Value'].sum():,.2f}")
     
     # Recent Movements
-    if not movements_df.empty and len(movements_df) > 0:
+    recent_movements = get_movement_log(db).latest(10)
+    if not recent_movements.empty:
         st.divider()
         st.subheader("Recent Asset Movements")
-        recent_movements = movements_df.tail(10)
         st.dataframe(recent_movements[['Asset Code', 'From Location', 'To Location', 'Date']] if 'Date' in recent_movements.columns else recent_movements, use_container_width=True)
 
@@ -0,0 +1,266 @@
+"""
+Data Quality Module
+
+Referential-integrity and data-quality checks across the spreadsheet's tables.
+Relations between sheets are declared once (FOREIGN_KEYS) and checked as
+anti-joins; keys, required fields, numbers, dates and option lists are checked
+per column. Every check works on whole columns: values are factorized first and
+each distinct value is tested once, so a million-row Assets sheet with a few
+thousand distinct locations, dates or categories is checked in a few seconds.
+
+The same relations guard deletes: delete_blockers() counts the rows that still
+reference a Location, Category, Subcategory or Brand before it is removed.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from config import SHEETS, ASSET_STATUS_OPTIONS, OWNERSHIP_OPTIONS, DATA_QUALITY_SHEETS
+from google_sheets import read_failed
+from jobs import get_job_scheduler
+
+VIOLATION_COLUMNS = ['Severity', 'Check', 'Sheet', 'Row', 'Column', 'Value']
+
+# (sheet, columns, referenced sheet, referenced columns, severity); blank references are not checked here
+FOREIGN_KEYS = [
+    (SHEETS['assets'], ['Location'], SHEETS['locations'], ['Location Name'], 'error'),
+    (SHEETS['assets'], ['Asset Category'], SHEETS['categories'], ['Category Name'], 'error'),
+    (SHEETS['assets'], ['Asset Category', 'Asset Subcategory'], SHEETS['subcategories'],
+     ['Category', 'Subcategory Name'], 'error'),
+    (SHEETS['assets'], ['Brand'], SHEETS['brands'], ['Brand Name'], 'error'),
+    (SHEETS['subcategories'], ['Category'], SHEETS['categories'], ['Category Name'], 'error'),
+    # History of deleted assets is kept on purpose, so this is informational
+    (SHEETS['asset_movement_index'], ['Asset Code'], SHEETS['assets'], ['Asset Code'], 'warning'),
+]
+UNIQUE_KEYS = {
+    SHEETS['users']: ['Username'],
+    SHEETS['locations']: ['Location Name'],
+    SHEETS['categories']: ['Category Name'],
+    SHEETS['subcategories']: ['Category', 'Subcategory Name'],
+    SHEETS['asset_types']: ['Asset Type'],
+    SHEETS['brands']: ['Brand Name'],
+    SHEETS['assets']: ['Asset Code'],
+}
+REQUIRED_COLUMNS = {
+    SHEETS['users']: ['Username', 'Password'],
+    SHEETS['locations']: ['Location Name'],
+    SHEETS['categories']: ['Category Name'],
+    SHEETS['subcategories']: ['Category', 'Subcategory Name'],
+    SHEETS['asset_types']: ['Asset Type'],
+    SHEETS['brands']: ['Brand Name'],
+    SHEETS['assets']: ['Asset Code', 'Item Name', 'Asset Category', 'Location'],
+}
+NUMBER_COLUMNS = {SHEETS['assets']: ['Amount']}
+DATE_COLUMNS = {SHEETS['assets']: ['Date of Purchase']}
+OPTION_COLUMNS = {SHEETS['assets']: {'Asset Status': ASSET_STATUS_OPTIONS, 'Ownership': OWNERSHIP_OPTIONS}}
+
+CHECKS = {
+    'missing_column': "Column expected by the app is missing from the sheet",
+    'missing_value': "Required field is blank",
+    'duplicate_key': "Key appears on more than one row",
+    'orphan_reference': "Refers to a row that does not exist",
+    'invalid_number': "Not a number (breaks the edit form and dashboard totals)",
+    'invalid_date': "Not a date (breaks the edit form)",
+    'invalid_option': "Not one of the allowed options",
+}
+
+
+def _text(frame, column):
+    """Column as strings, blanks for missing cells"""
+    return frame[column].fillna('').astype(str)
+
+
+def _factorize(frame, columns):
+    """(code per row, key per code, blank per code); composite keys are tuples, blank means the last part is empty"""
+    codes = np.zeros(len(frame), dtype=np.int64)
+    parts = []
+    for column in columns:
+        column_codes, uniques = pd.factorize(_text(frame, column))
+        codes = codes * max(len(uniques), 1) + column_codes
+        parts.append(np.asarray(uniques, dtype=object))
+    last = parts[-1]
+    last_blank = np.fromiter((not value.strip() for value in last), dtype=bool, count=len(last))
+    if len(columns) == 1:
+        return codes, last, last_blank
+    codes, combined = pd.factorize(codes)
+    keys = []
+    for value in combined:
+        key = []
+        for uniques in reversed(parts):
+            value, position = divmod(int(value), len(uniques))
+            key.append(uniques[position])
+        keys.append(tuple(reversed(key)))
+    return codes, keys, last_blank[combined % max(len(last), 1)]
+
+
+def _display(key):
+    # Composite keys are shown as "Category / Subcategory"
+    return ' / '.join(key) if isinstance(key, tuple) else key
+
+
+def _violations(check, sheet, columns, mask, codes, keys, severity='error'):
+    rows = np.flatnonzero(mask)
+    return pd.DataFrame({
+        'Severity': severity,
+        'Check': check,
+        'Sheet': sheet,
+        'Row': rows + 2,  # spreadsheet row: 1-based, after the header
+        'Column': ' + '.join(columns),
+        'Value': [_display(keys[code]) for code in codes[rows]],
+    }, columns=VIOLATION_COLUMNS)
+
+
+def _unparsable(parse):
+    """Test for run_checks: non-blank keys that parse() turns into NaN/NaT"""
+    return lambda codes, keys, blank: pd.isna(parse(pd.Series(keys, dtype=object))).to_numpy() & ~blank
+
+
+def _outside(allowed):
+    """Test for run_checks: non-blank keys not in allowed"""
+    allowed = set(allowed)
+    return lambda codes, keys, blank: np.fromiter((key not in allowed for key in keys), dtype=bool,
+                                                  count=len(keys)) & ~blank
+
+
+def _repeated(codes, keys, blank):
+    """Test for run_checks: non-blank keys used by more than one row"""
+    return (np.bincount(codes, minlength=len(keys)) > 1) & ~blank
+
+
+def run_checks(tables):
+    """All violations in {sheet name: DataFrame}, one row per offending cell (or key)"""
+    present = {sheet: frame for sheet, frame in tables.items() if frame is not None and not frame.empty}
+    found = []
+    factorized = {}
+
+    def check(name, sheet, columns, failing, severity='error'):
+        """Flag rows whose key fails; failing(codes, distinct keys, blank flags) returns one bool per key"""
+        if (sheet, tuple(columns)) not in factorized:
+            factorized[(sheet, tuple(columns))] = _factorize(present[sheet], columns)
+        codes, keys, blank = factorized[(sheet, tuple(columns))]
+        failing = np.asarray(failing(codes, keys, blank), dtype=bool)
+        if failing.any():
+            found.append(_violations(name, sheet, columns, failing[codes], codes, keys, severity))
+
+    def has_columns(sheet, columns):
+        return sheet in present and all(column in present[sheet].columns for column in columns)
+
+    for sheet, columns in REQUIRED_COLUMNS.items():
+        for column in columns:
+            if has_columns(sheet, [column]):
+                check('missing_value', sheet, [column], lambda codes, keys, blank: blank)
+            elif sheet in present:
+                found.append(pd.DataFrame([['error', 'missing_column', sheet, 1, column, '']],
+                                          columns=VIOLATION_COLUMNS))
+
+    for sheet, columns in UNIQUE_KEYS.items():
+        if has_columns(sheet, columns):
+            check('duplicate_key', sheet, columns, _repeated)
+
+    for sheet, columns, parent, parent_columns, severity in FOREIGN_KEYS:
+        # Missing columns are reported once, by the required-field check
+        if parent not in tables or not has_columns(sheet, columns):
+            continue
+        existing = _factorize(present[parent], parent_columns)[1] if has_columns(parent, parent_columns) else []
+        check('orphan_reference', sheet, columns, _outside(existing), severity)
+
+    for columns_by_sheet, name, parse in (
+            (NUMBER_COLUMNS, 'invalid_number', lambda values: pd.to_numeric(values, errors='coerce')),
+            (DATE_COLUMNS, 'invalid_date', lambda values: pd.to_datetime(values, errors='coerce', format='mixed'))):
+        for sheet, columns in columns_by_sheet.items():
+            for column in columns:
+                if has_columns(sheet, [column]):
+                    check(name, sheet, [column], _unparsable(parse))
+
+    for sheet, options in OPTION_COLUMNS.items():
+        for column, allowed in options.items():
+            if has_columns(sheet, [column]):
+                check('invalid_option', sheet, [column], _outside(allowed), 'warning')
+
+    if not found:
+        return pd.DataFrame(columns=VIOLATION_COLUMNS)
+    return pd.concat(found, ignore_index=True)
+
+
+def summarize(violations):
+    """Violation counts per check, sheet and column, with a few example values"""
+    if violations.empty:
+        return pd.DataFrame(columns=['Severity', 'Check', 'Sheet', 'Column', 'Count', 'Examples', 'Description'])
+    grouped = violations.groupby(['Severity', 'Check', 'Sheet', 'Column'], sort=False)
+    summary = grouped.size().rename('Count').reset_index()
+    summary['Examples'] = grouped['Value'].agg(
+        lambda values: ', '.join(list(dict.fromkeys(map(str, values.iloc[:1000])))[:3])).to_numpy()
+    summary['Description'] = summary['Check'].map(CHECKS)
+    return summary.sort_values(['Severity', 'Count'], ascending=[True, False], ignore_index=True)
+
+
+def check_database(db, include_movements=False):
+    """Read the checked sheets and run every check (background job and Data Quality page)"""
+    sheets = DATA_QUALITY_SHEETS + ([SHEETS['asset_movement_index']] if include_movements else [])
+    return run_checks({sheet: db.read_data(sheet) for sheet in sheets})
+
+
+def dependent_counts(tables, sheet_name, key):
+    """{referencing sheet: rows} that refer to `key` (a value, or a tuple for composite keys) of sheet_name"""
+    key = tuple(key) if isinstance(key, (tuple, list)) else (key,)
+    counts = {}
+    for sheet, columns, parent, parent_columns, severity in FOREIGN_KEYS:
+        frame = tables.get(sheet)
+        if parent != sheet_name or severity != 'error' or frame is None or frame.empty:
+            continue
+        if len(parent_columns) != len(key) or not all(column in frame.columns for column in columns):
+            continue
+        mask = np.ones(len(frame), dtype=bool)
+        for column, value in zip(columns, key):
+            mask &= (_text(frame, column) == str(value)).to_numpy(dtype=bool)
+        if mask.any():
+            counts[sheet] = counts.get(sheet, 0) + int(mask.sum())
+    return counts
+
+
+def delete_blockers(db, sheet_name, key):
+    """Why a reference row cannot be deleted ('' when nothing refers to it, or it could not be checked)"""
+    references = [(sheet, columns) for sheet, columns, parent, _, severity in FOREIGN_KEYS
+                  if parent == sheet_name and severity == 'error']
+    tables = {sheet: db.read_data(sheet) for sheet, _ in references}
+    # A failed read looks like an empty sheet; deleting on it would orphan every reference.
+    # A sheet that is really empty (even without a header row) refers to nothing.
+    unchecked = sorted({sheet for sheet, _ in references if read_failed(tables[sheet])})
+    if unchecked:
+        return f"{', '.join(unchecked)} could not be checked for references, try again"
+    counts = dependent_counts(tables, sheet_name, key)
+    if not counts:
+        return ''
+    return "still used by " + ", ".join(f"{count} row(s) in {sheet}" for sheet, count in counts.items())
+
+
+def show_data_quality(db):
+    """Data Quality page"""
+    st.title("🩺 Data Quality")
+    include_movements = st.checkbox("Include movement history (reads the movement index)")
+    violations = None if include_movements else get_job_scheduler().result(db, 'data_quality')
+    if violations is None:
+        with st.spinner("Checking sheets..."):
+            violations = check_database(db, include_movements)
+
+    errors = int((violations['Severity'] == 'error').sum())
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Errors", errors)
+    with col2:
+        st.metric("Warnings", len(violations) - errors)
+    with col3:
+        st.metric("Sheets Affected", violations['Sheet'].nunique())
+    if violations.empty:
+        st.success("No problems found")
+        return
+
+    summary = summarize(violations)
+    st.dataframe(summary, use_container_width=True)
+    labels = [f"{row.Sheet} · {row.Column} · {row.Check} ({row.Count})" for row in summary.itertuples()]
+    choice = st.selectbox("Show Rows", range(len(labels)), format_func=labels.__getitem__)
+    selected = summary.iloc[choice]
+    rows = violations[(violations['Check'] == selected['Check']) & (violations['Sheet'] == selected['Sheet'])
+                      & (violations['Column'] == selected['Column'])]
+    st.caption(selected['Description'])
+    st.dataframe(rows[['Row', 'Value']], use_container_width=True, hide_index=True)
@@ -0,0 +1,280 @@
+"""
+Duplicate Detection Module
+
+Finds assets that were entered twice under two generated codes without comparing
+every pair. The words of each asset's Item Name and Description are MinHashed
+into DUPLICATE_NUM_HASHES values and the signature is cut into DUPLICATE_BANDS
+bands; assets with identical values in any band share an LSH bucket. Inside a
+bucket, rows sorted by Location, Brand and Amount are paired with their next
+DUPLICATE_WINDOW neighbours, so the number of candidates grows with the number
+of assets instead of its square. Candidates are scored in one vectorized pass;
+pairs at or above DUPLICATE_THRESHOLD make up the review queue, and the asset
+form checks a new asset against the same buckets before saving it (in the last
+published index, plus the rows added since it was built, so saving never waits
+for a rebuild).
+"""
+import zlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from config import SHEETS, DUPLICATE_NUM_HASHES, DUPLICATE_BANDS, DUPLICATE_WINDOW, DUPLICATE_THRESHOLD
+from jobs import get_job_scheduler
+
+REVIEW_COLUMNS = ['Asset Code', 'Duplicate Of', 'Decision', 'Reviewed By', 'Reviewed At']
+QUEUE_COLUMNS = ['Asset Code', 'Duplicate Of', 'Score', 'Name Similarity', 'Item Name', 'Location', 'Brand',
+                 'Amount']
+# Share of the score per field; names count by estimated word (Jaccard) similarity, the rest by equality
+SCORE_WEIGHTS = {'name': 0.4, 'location': 0.2, 'brand': 0.15, 'amount': 0.25}
+AMOUNT_TOLERANCE = 0.01  # relative difference still counted as the same amount
+
+# Fixed seed: signatures must agree between the background index and the form check
+_rng = np.random.default_rng(0x5EED)
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32; a * hash stays below 2**63
+_A = _rng.integers(1, 1 << 31, DUPLICATE_NUM_HASHES, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 31, DUPLICATE_NUM_HASHES, dtype=np.uint64)
+_ROWS_PER_BAND = DUPLICATE_NUM_HASHES // DUPLICATE_BANDS
+_BAND_MIX = _rng.integers(1, 1 << 63, _ROWS_PER_BAND, dtype=np.uint64) | np.uint64(1)
+_NO_WORDS = np.uint64(np.iinfo(np.uint64).max)
+_HASH_BLOCK = 8  # hash functions gathered at once; bounds memory to words x _HASH_BLOCK values
+
+
+def _text(frame, column):
+    """Column as strings, blanks for missing cells or columns"""
+    if column not in frame.columns:
+        return pd.Series('', index=frame.index, dtype=object)
+    return frame[column].fillna('').astype(str)
+
+
+def _normalized(frame, column):
+    return _text(frame, column).str.strip().str.lower()
+
+
+def signatures(frame):
+    """MinHash signature per row (rows x DUPLICATE_NUM_HASHES); rows without words are all _NO_WORDS"""
+    text = (_text(frame, 'Item Name') + ' ' + _text(frame, 'Asset Description')).reset_index(drop=True)
+    words = text.str.lower().str.replace(r'[^0-9a-z]+', ' ', regex=True).str.split().explode().dropna()
+    signature = np.full((len(frame), DUPLICATE_NUM_HASHES), _NO_WORDS, dtype=np.uint64)
+    if words.empty:
+        return signature
+    # Each distinct word is hashed once (crc32 is stable across processes, unlike hash())
+    codes, vocabulary = pd.factorize(words)
+    word_hashes = np.fromiter((zlib.crc32(word.encode()) for word in vocabulary), dtype=np.uint64,
+                              count=len(vocabulary))
+    word_values = (word_hashes[:, None] * _A + _B) % _PRIME
+    rows = words.index.to_numpy()
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    for first in range(0, DUPLICATE_NUM_HASHES, _HASH_BLOCK):
+        block = slice(first, first + _HASH_BLOCK)
+        signature[rows[starts], block] = np.minimum.reduceat(word_values[codes, block], starts, axis=0)
+    return signature
+
+
+def band_keys(signature):
+    """One 64-bit bucket key per row and band (wrapping multiply-add of the band's MinHash values)"""
+    keys = np.empty((len(signature), DUPLICATE_BANDS), dtype=np.uint64)
+    for band in range(DUPLICATE_BANDS):
+        values = signature[:, band * _ROWS_PER_BAND:(band + 1) * _ROWS_PER_BAND]
+        keys[:, band] = (values * _BAND_MIX).sum(axis=1, dtype=np.uint64)
+    return keys
+
+
+def _field_scores(same_location, same_brand, amount_a, amount_b):
+    """Score from everything but the name; pairs below threshold - name weight cannot be flagged"""
+    with np.errstate(invalid='ignore'):
+        same_amount = np.abs(amount_a - amount_b) <= AMOUNT_TOLERANCE * np.maximum(np.abs(amount_a),
+                                                                                     np.abs(amount_b))
+    return (SCORE_WEIGHTS['location'] * same_location + SCORE_WEIGHTS['brand'] * same_brand
+            + SCORE_WEIGHTS['amount'] * same_amount)
+
+
+class DuplicateIndex:
+    """MinHash signatures, LSH buckets and comparison fields of one Assets frame"""
+
+    def __init__(self, assets_df):
+        self.frame = assets_df.reset_index(drop=True)
+        frame = self.frame
+        self.signatures = signatures(frame)
+        self.has_words = self.signatures[:, 0] != _NO_WORDS
+        self.location, self._locations = pd.factorize(_normalized(frame, 'Location'))
+        self.brand, self._brands = pd.factorize(_normalized(frame, 'Brand'))
+        self.amount = pd.to_numeric(_text(frame, 'Amount'), errors='coerce').to_numpy(dtype=float)
+        keys = band_keys(self.signatures)
+        # Per band: rows sorted by bucket, then by the fields scored next, so neighbours are the likeliest pairs
+        # (one stable sort per band over rows already in Location, Brand, Amount order)
+        by_fields = np.lexsort((self.amount, self.brand, self.location))
+        self._orders = [by_fields[np.argsort(keys[by_fields, band], kind='stable')]
+                        for band in range(DUPLICATE_BANDS)]
+        self._sorted_keys = [keys[order, band] for band, order in enumerate(self._orders)]
+        self._queue = None
+
+    def __len__(self):
+        return len(self.frame)
+
+    def candidate_pairs(self, window=DUPLICATE_WINDOW):
+        """(older, newer) row positions of pairs sharing a bucket within `window` rows of each other"""
+        n = len(self.frame)
+        pairs = [np.empty(0, dtype=np.int64)]
+        for order, keys in zip(self._orders, self._sorted_keys):
+            for offset in range(1, min(window, n - 1) + 1):
+                same = keys[offset:] == keys[:-offset]
+                first, second = order[:-offset][same], order[offset:][same]
+                pairs.append(np.minimum(first, second) * n + np.maximum(first, second))
+        # Sort and drop repeats (pairs found in several bands); cheaper than np.unique here
+        pairs = np.sort(np.concatenate(pairs))
+        pairs = pairs[np.r_[True, pairs[1:] != pairs[:-1]]] if len(pairs) else pairs
+        older, newer = pairs // max(n, 1), pairs % max(n, 1)
+        keep = self.has_words[older] & self.has_words[newer]
+        return older[keep], newer[keep]
+
+    def score(self, older, newer, threshold=DUPLICATE_THRESHOLD):
+        """(older, newer, estimated name similarity, score) of the pairs scoring at least threshold"""
+        fields = _field_scores(self.location[older] == self.location[newer], self.brand[older] == self.brand[newer],
+                               self.amount[older], self.amount[newer])
+        # Signatures are only compared for pairs the name could still lift over the threshold
+        possible = fields + SCORE_WEIGHTS['name'] >= threshold
+        older, newer, fields = older[possible], newer[possible], fields[possible]
+        name_similarity = (self.signatures[older] == self.signatures[newer]).mean(axis=1)
+        score = fields + SCORE_WEIGHTS['name'] * name_similarity
+        flagged = score >= threshold
+        return older[flagged], newer[flagged], name_similarity[flagged], score[flagged]
+
+    def review_queue(self, threshold=DUPLICATE_THRESHOLD):
+        """Likely duplicate pairs, highest score first; the later row is reported as the duplicate"""
+        if self._queue is not None and threshold == DUPLICATE_THRESHOLD:
+            return self._queue
+        older, newer, name_similarity, score = self.score(*self.candidate_pairs(), threshold)
+        ranked = np.argsort(-score, kind='stable')
+        older, newer, name_similarity, score = older[ranked], newer[ranked], name_similarity[ranked], score[ranked]
+        frame = self.frame
+        queue = pd.DataFrame({
+            'Asset Code': _text(frame, 'Asset Code').to_numpy()[newer],
+            'Duplicate Of': _text(frame, 'Asset Code').to_numpy()[older],
+            'Score': score.round(3),
+            'Name Similarity': name_similarity.round(3),
+            'Item Name': _text(frame, 'Item Name').to_numpy()[newer],
+            'Location': _text(frame, 'Location').to_numpy()[newer],
+            'Brand': _text(frame, 'Brand').to_numpy()[newer],
+            'Amount': _text(frame, 'Amount').to_numpy()[newer],
+        }, columns=QUEUE_COLUMNS)
+        if threshold == DUPLICATE_THRESHOLD:
+            self._queue = queue
+        return queue
+
+    def matches(self, asset, threshold=DUPLICATE_THRESHOLD):
+        """Existing assets that `asset` ({column: value}, as the asset form builds it) likely duplicates"""
+        probe = pd.DataFrame([asset])
+        signature = signatures(probe)
+        if signature[0, 0] == _NO_WORDS or self.frame.empty:
+            return self.frame.iloc[0:0].assign(Score=[])
+        keys = band_keys(signature)[0]
+        rows = np.unique(np.concatenate([
+            order[np.searchsorted(sorted_keys, key, 'left'):np.searchsorted(sorted_keys, key, 'right')]
+            for order, sorted_keys, key in zip(self._orders, self._sorted_keys, keys)]))
+        location = self._locations.get_indexer(_normalized(probe, 'Location'))[0]
+        brand = self._brands.get_indexer(_normalized(probe, 'Brand'))[0]
+        amount = pd.to_numeric(_text(probe, 'Amount'), errors='coerce').to_numpy(dtype=float)[0]
+        name_similarity = (self.signatures[rows] == signature[0]).mean(axis=1)
+        score = SCORE_WEIGHTS['name'] * name_similarity + _field_scores(
+            (self.location[rows] == location) & (location >= 0), (self.brand[rows] == brand) & (brand >= 0),
+            self.amount[rows], amount)
+        keep = score >= threshold
+        found = self.frame.iloc[rows[keep]].assign(Score=score[keep].round(3))
+        return found.sort_values('Score', ascending=False)
+
+
+def build_duplicate_index(assets_df):
+    """Index with its review queue computed (background job)"""
+    index = DuplicateIndex(assets_df)
+    index.review_queue()
+    return index
+
+
+def get_duplicate_index(db, assets_df=None):
+    """The background job's index when current, else one built from assets_df (read when not given)"""
+    index = get_job_scheduler().result(db, 'duplicate_index')
+    if index is None:
+        index = build_duplicate_index(db.read_data(SHEETS['assets']) if assets_df is None else assets_df)
+    return index
+
+
+def likely_duplicates(db, asset):
+    """matches() for the asset form: the last published index, however old, plus a small index of the
+    assets added since it was built; rows no longer in the sheet (or outside the user's scope) are dropped"""
+    index = get_job_scheduler().latest(db, 'duplicate_index')
+    if index is None:
+        return get_duplicate_index(db).matches(asset)
+    assets_df = db.read_data(SHEETS['assets'])
+    # Membership through Python sets: Series.isin with a large set is slow on Arrow-backed strings
+    codes = _text(assets_df, 'Asset Code').tolist()
+    indexed = set(_text(index.frame, 'Asset Code').tolist())
+    added = np.fromiter((code not in indexed for code in codes), dtype=bool, count=len(codes))
+    found = [index.matches(asset)]
+    if added.any():
+        found.append(DuplicateIndex(assets_df[added]).matches(asset))
+    found = pd.concat(found, ignore_index=True)
+    current = set(codes)
+    keep = [code in current for code in _text(found, 'Asset Code')]
+    if db.scope is not None:
+        keep = [k and location in db.scope for k, location in zip(keep, _text(found, 'Location'))]
+    return found[np.array(keep, dtype=bool)].sort_values('Score', ascending=False)
+
+
+def reviewed_pairs(db):
+    """{(asset code, duplicate of)} already decided on the Duplicates page"""
+    reviews = db.read_data(SHEETS['duplicate_reviews'])
+    if reviews.empty or not {'Asset Code', 'Duplicate Of'} <= set(reviews.columns):
+        return set()
+    return set(zip(_text(reviews, 'Asset Code'), _text(reviews, 'Duplicate Of')))
+
+
+def record_review(db, asset_code, duplicate_of, decision):
+    values = [asset_code, duplicate_of, decision, st.session_state.get('username', ''),
+              datetime.now().strftime("%Y-%m-%d %H:%M:%S")]
+    return db.append_row(SHEETS['duplicate_reviews'], dict(zip(REVIEW_COLUMNS, values)))
+
+
+def show_duplicates(db):
+    """Duplicates page: review queue of likely duplicate assets"""
+    st.title("👯 Duplicate Assets")
+    assets_df = db.read_data(SHEETS['assets'])
+    with st.spinner("Comparing assets..."):
+        queue = get_duplicate_index(db, assets_df).review_queue()
+    reviewed = reviewed_pairs(db)
+    if reviewed and not queue.empty:
+        pending = [(code, original) not in reviewed
+                   for code, original in zip(queue['Asset Code'], queue['Duplicate Of'])]
+        queue = queue[pending]
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Pairs to Review", len(queue))
+    with col2:
+        st.metric("Assets Checked", len(assets_df))
+    if queue.empty:
+        st.success("No likely duplicates")
+        return
+
+    st.dataframe(queue, use_container_width=True, hide_index=True)
+    labels = [f"{row['Asset Code']} ≈ {row['Duplicate Of']} ({row['Score']:.2f})" for _, row in queue.head(500).iterrows()]
+    choice = st.selectbox("Review Pair", range(len(labels)), format_func=labels.__getitem__)
+    pair = queue.iloc[choice]
+    codes = _text(assets_df, 'Asset Code')
+    both = assets_df[codes.isin([pair['Asset Code'], pair['Duplicate Of']])]
+    st.dataframe(both.astype(str).set_index('Asset Code').T, use_container_width=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Not a Duplicate"):
+            if record_review(db, pair['Asset Code'], pair['Duplicate Of'], 'Not a duplicate'):
+                st.rerun()
+    with col2:
+        if st.button(f"Delete {pair['Asset Code']}", type="primary"):
+            idx = both.index[_text(both, 'Asset Code') == pair['Asset Code']]
+            if len(idx) == 0:
+                st.error("Asset no longer exists")
+            elif db.delete_row(SHEETS['assets'], idx[-1] + 1):
+                record_review(db, pair['Asset Code'], pair['Duplicate Of'], 'Deleted')
+                st.rerun()
@@ -0,0 +1,356 @@
+"""
+Export Module
+
+Streams Assets, the movement log and search results as CSV, XLSX or Parquet.
+Rows come from the storage layer in ranged chunks (GoogleSheetsDB.iter_rows,
+MovementLog.iter_movements) and each chunk is encoded and handed on before the
+next is read, so an export holds one chunk in memory however large the sheet.
+
+Streamlit's download button needs the whole file up front, so the streaming
+path is a small HTTP endpoint (enabled with ASSET_TRACKER_EXPORT_PORT) that
+serves signed, expiring links with chunked transfer encoding. Without it the
+page falls back to building the file on demand and offering it as a download.
+"""
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+import zipfile
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from asset_search import filter_assets
+from config import (
+    SHEETS, EXPORT_FORMATS, EXPORT_HOST, EXPORT_PORT, EXPORT_BASE_URL, EXPORT_SECRET, EXPORT_LINK_TTL
+)
+from movement_log import MovementLog
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency: without pyarrow Parquet export is unavailable
+    pa = None
+    pq = None
+
+DATASETS = {
+    'assets': 'Assets',
+    'movements': 'Asset Movements',
+    'search': 'Search Results',
+}
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+_secret = EXPORT_SECRET.encode() or os.urandom(32)
+
+
+class _Sink:
+    """Write-only, unseekable file object whose contents are drained after every chunk"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def available_formats():
+    """Export formats usable with the installed libraries"""
+    return [fmt for fmt in EXPORT_FORMATS if fmt != 'parquet' or pq is not None]
+
+
+def iter_dataset(db, dataset, query=''):
+    """Yield a dataset as DataFrame chunks read straight from the sheets"""
+    if dataset == 'assets':
+        yield from db.iter_rows(SHEETS['assets'])
+    elif dataset == 'search':
+        for chunk in db.iter_rows(SHEETS['assets']):
+            matches = filter_assets(chunk, query) if query else chunk
+            if not matches.empty:
+                yield matches
+    elif dataset == 'movements':
+        log = db.movement_log() if hasattr(db, 'movement_log') else MovementLog(db)
+        yield from log.iter_movements()
+    else:
+        raise ValueError(f"Unknown export dataset: {dataset}")
+
+
+def aligned(chunks):
+    """Chunks reindexed to the first chunk's columns; the writers lay out every row by that header"""
+    columns = None
+    for chunk in chunks:
+        if columns is None:
+            columns = list(chunk.columns)
+        elif list(chunk.columns) != columns:
+            chunk = chunk.reindex(columns=columns, fill_value='')
+        yield chunk
+
+
+def stream_csv(chunks):
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header).encode('utf-8')
+        header = False
+
+
+def _xlsx_cell(column, row, value):
+    ref = f"{column}{row}"
+    if value is None or (isinstance(value, (float, np.floating)) and not np.isfinite(value)):
+        return ''
+    if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_)):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    text = str(value)
+    if not text:
+        return ''
+    # XML 1.0 cannot carry most control characters
+    text = ''.join(ch for ch in text if ch in '\t\n\r' or ord(ch) >= 32)
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+def _xlsx_columns(count):
+    letters = []
+    for n in range(1, count + 1):
+        name = ''
+        while n:
+            n, remainder = divmod(n - 1, 26)
+            name = chr(65 + remainder) + name
+        letters.append(name)
+    return letters
+
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'),
+}
+
+
+def stream_xlsx(chunks, sheet_title='Export'):
+    """Minimal single-sheet workbook written row by row into a streamed zip (no openpyxl needed)"""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, xml in _XLSX_PARTS.items():
+            archive.writestr(name, xml)
+        archive.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(sheet_title[:31])}" sheetId="1" r:id="rId1"/></sheets></workbook>'))
+        yield sink.drain()
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            row_number = 1
+            for chunk in chunks:
+                columns = _xlsx_columns(chunk.shape[1])
+                lines = []
+                if row_number == 1:
+                    cells = ''.join(_xlsx_cell(c, 1, name) for c, name in zip(columns, chunk.columns))
+                    lines.append(f'<row r="1">{cells}</row>')
+                    row_number = 2
+                for values in chunk.itertuples(index=False, name=None):
+                    cells = ''.join(_xlsx_cell(c, row_number, v) for c, v in zip(columns, values))
+                    lines.append(f'<row r="{row_number}">{cells}</row>')
+                    row_number += 1
+                sheet.write(''.join(lines).encode('utf-8'))
+                yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+def stream_parquet(chunks):
+    """One Parquet row group per chunk; sheet cells are mixed, so every column is written as text"""
+    if pq is None:
+        raise RuntimeError("Parquet export needs pyarrow")
+    sink = _Sink()
+    writer = None
+    schema = None
+    for chunk in chunks:
+        if writer is None:
+            schema = pa.schema([(str(c), pa.string()) for c in chunk.columns])
+            writer = pq.ParquetWriter(sink, schema)
+        arrays = [pa.array(['' if pd.isna(v) else str(v) for v in chunk.iloc[:, i]], type=pa.string())
+                  for i in range(chunk.shape[1])]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    if writer is None:
+        writer = pq.ParquetWriter(sink, pa.schema([]))
+    writer.close()
+    yield sink.drain()
+
+
+def export_stream(db, dataset, fmt, query=''):
+    """Yield the encoded bytes of an export as each chunk is read"""
+    chunks = aligned(iter_dataset(db, dataset, query))
+    if fmt == 'csv':
+        return stream_csv(chunks)
+    if fmt == 'xlsx':
+        return stream_xlsx(chunks, DATASETS.get(dataset, 'Export'))
+    if fmt == 'parquet':
+        return stream_parquet(chunks)
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def export_filename(dataset, fmt):
+    return f"{dataset}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+
+
+def _signature(spreadsheet_id, dataset, fmt, query, expires, locations=''):
+    message = '\x1f'.join([spreadsheet_id, dataset, fmt, query, str(expires), locations]).encode()
+    return hmac.new(_secret, message, hashlib.sha256).hexdigest()
+
+
+def export_url(spreadsheet_id, dataset, fmt, query='', scope=None):
+    """Signed, expiring link to the streaming endpoint, or None if it is not running"""
+    if _server is None:
+        return None
+    expires = int(time.time()) + EXPORT_LINK_TTL
+    # The link carries the user's location scope, so a site manager's export stays within their sites
+    locations = '' if scope is None else json.dumps(sorted(scope))
+    params = {'spreadsheet': spreadsheet_id, 'q': query, 'expires': expires,
+              'sig': _signature(spreadsheet_id, dataset, fmt, query, expires, locations)}
+    if scope is not None:
+        params['locations'] = locations
+    base = EXPORT_BASE_URL or f"http://localhost:{_server.server_address[1]}"
+    return f"{base.rstrip('/')}/export/{dataset}.{fmt}?{urlencode(params)}"
+
+
+class _ExportHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        name = url.path.rsplit('/', 1)[-1]
+        dataset, _, fmt = name.partition('.')
+        spreadsheet_id = params.get('spreadsheet', '')
+        query = params.get('q', '')
+        try:
+            expires = int(params.get('expires', '0'))
+        except ValueError:
+            expires = 0
+        if not url.path.startswith('/export/') or dataset not in DATASETS or fmt not in available_formats():
+            return self._fail(404, "Unknown export")
+        locations = params.get('locations', '')
+        expected = _signature(spreadsheet_id, dataset, fmt, query, expires, locations)
+        if expires < time.time() or not hmac.compare_digest(expected, params.get('sig', '')):
+            return self._fail(403, "Export link is invalid or has expired")
+
+        db = _db_factory()
+        if not db.set_spreadsheet(spreadsheet_id):
+            return self._fail(502, "Could not open the spreadsheet")
+        if locations:
+            db.set_scope(json.loads(locations))
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPES[fmt])
+        self.send_header('Content-Disposition', f'attachment; filename="{export_filename(dataset, fmt)}"')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        try:
+            for data in export_stream(db, dataset, fmt, query):
+                if data:
+                    self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except Exception:
+            # Headers are gone; dropping the connection without the last chunk marks the download failed
+            self.close_connection = True
+
+    def _fail(self, status, message):
+        body = message.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+_db_factory = None
+
+
+def start_export_server(db_factory, port=EXPORT_PORT, host=EXPORT_HOST):
+    """Serve /export/<dataset>.<format> on a background thread once per process"""
+    global _server, _db_factory
+    if not port:
+        return None
+    with _server_lock:
+        _db_factory = db_factory
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, int(port)), _ExportHandler)
+            except OSError:
+                # Another Streamlit process already owns the port
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server
+
+
+def show_export(db, dataset, query='', key=None):
+    """Format picker plus a streaming link, or an on-demand download when the endpoint is off"""
+    key = key or f"export_{dataset}"
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        fmt = st.selectbox("Export Format", available_formats(), key=f"{key}_format",
+                           format_func=str.upper)
+    with col2:
+        url = export_url(db.spreadsheet_id, dataset, fmt, query, getattr(db, 'scope', None))
+        if url:
+            st.link_button(f"⬇️ Export {DATASETS[dataset]} ({fmt.upper()})", url)
+        elif st.button(f"Prepare {DATASETS[dataset]} Export ({fmt.upper()})", key=f"{key}_prepare"):
+            with st.spinner("Building export..."):
+                data = b''.join(export_stream(db, dataset, fmt, query))
+            st.download_button(f"⬇️ Download {fmt.upper()}", data, file_name=export_filename(dataset, fmt),
+                               mime=CONTENT_TYPES[fmt], key=f"{key}_download")
@@ -0,0 +1,349 @@
+"""
+Fake Google Sheets Backend Module
+
+In-memory stand-in for the parts of the gspread client the app uses, with
+configurable simulated latency and per-minute quota. Used by the benchmark
+suite and for offline development.
+"""
+import itertools
+import threading
+import time
+from collections import Counter, deque
+
+import gspread
+from gspread.utils import a1_range_to_grid_range, numericise_all
+
+
+class FakeResponse:
+    """Minimal response object so gspread.exceptions.APIError can wrap simulated errors"""
+
+    def __init__(self, status_code, message):
+        self.status_code = status_code
+        self.text = message
+
+    def json(self):
+        return {'error': {'code': self.status_code, 'message': self.text, 'status': 'RESOURCE_EXHAUSTED'}}
+
+
+class FakeJSONResponse:
+    """Successful response returned by FakeClient.request"""
+
+    def __init__(self, payload):
+        self.status_code = 200
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+class FakeBackend:
+    """Shared latency, quota and call accounting for one fake client"""
+
+    def __init__(self, latency=0.0, latency_per_cell=0.0, quota_per_minute=0):
+        self.latency = latency
+        self.latency_per_cell = latency_per_cell
+        self.quota_per_minute = quota_per_minute
+        self.calls = Counter()
+        self.cells = 0
+        self._window = deque()
+        self._lock = threading.Lock()
+
+    def request(self, name, cells=0):
+        """Account for one API request: enforce quota, then sleep for the simulated latency"""
+        with self._lock:
+            now = time.monotonic()
+            if self.quota_per_minute:
+                while self._window and now - self._window[0] > 60:
+                    self._window.popleft()
+                if len(self._window) >= self.quota_per_minute:
+                    raise gspread.exceptions.APIError(FakeResponse(429, 'Quota exceeded (simulated)'))
+                self._window.append(now)
+            self.calls[name] += 1
+            self.cells += cells
+        delay = self.latency + self.latency_per_cell * cells
+        if delay > 0:
+            time.sleep(delay)
+
+    def reset_counts(self):
+        with self._lock:
+            self.calls.clear()
+            self.cells = 0
+
+
+def split_range(range_name):
+    """Split "'Sheet'!A1:B2" into ('Sheet', 'A1:B2')"""
+    if range_name.startswith("'"):
+        end = 1
+        while True:
+            end = range_name.index("'", end)
+            if range_name[end + 1:end + 2] == "'":
+                end += 2
+                continue
+            break
+        return range_name[1:end].replace("''", "'"), range_name[end + 2:]
+    if '!' in range_name:
+        sheet, cells = range_name.split('!', 1)
+        return sheet, cells
+    return range_name, ''
+
+
+def _cell_value(cell):
+    value = cell.get('userEnteredValue', {})
+    return '' if not value else str(next(iter(value.values())))
+
+
+class FakeWorksheet:
+    _ids = itertools.count(1)
+
+    def __init__(self, spreadsheet, title, rows=1000, cols=26):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = next(self._ids)
+        self._row_count = rows
+        self.col_count = cols
+        self._rows = []
+
+    @property
+    def row_count(self):
+        # Writes past the grid grow it, as appends do in Sheets
+        return max(self._row_count, len(self._rows))
+
+    @property
+    def _backend(self):
+        return self.spreadsheet.client.backend
+
+    def _grid(self, cells):
+        """Return the rows and columns selected by an A1 range (without the sheet name)"""
+        if not cells:
+            return [list(row) for row in self._rows]
+        grid = a1_range_to_grid_range(cells)
+        rows = self._rows[grid.get('startRowIndex', 0):grid.get('endRowIndex')]
+        start_col, end_col = grid.get('startColumnIndex', 0), grid.get('endColumnIndex')
+        values = [list(row[start_col:end_col]) for row in rows]
+        # The Sheets API trims trailing empty cells and rows
+        values = [row[:max([i + 1 for i, v in enumerate(row) if v != ''] or [0])] for row in values]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def _write(self, start_row, start_col, values):
+        self.spreadsheet.version += 1
+        for i, row in enumerate(values):
+            while len(self._rows) <= start_row + i:
+                self._rows.append([])
+            current = self._rows[start_row + i]
+            if len(current) < start_col + len(row):
+                current.extend([''] * (start_col + len(row) - len(current)))
+            for j, value in enumerate(row):
+                current[start_col + j] = '' if value is None else str(value)
+
+    def get_all_values(self, **kwargs):
+        values = self._grid('')
+        self._backend.request('get_all_values', sum(len(r) for r in values))
+        return values
+
+    def get_all_records(self, **kwargs):
+        values = self._grid('')
+        self._backend.request('get_all_records', sum(len(r) for r in values))
+        if not values:
+            return []
+        headers = values[0]
+        return [
+            dict(zip(headers, numericise_all((list(row) + [''] * len(headers))[:len(headers)])))
+            for row in values[1:]
+        ]
+
+    def get_values(self, range_name=None, **kwargs):
+        values = self._grid(range_name or '')
+        self._backend.request('get_values', sum(len(r) for r in values))
+        return values
+
+    def batch_get(self, ranges, **kwargs):
+        results = [self._grid(r) for r in ranges]
+        self._backend.request('batch_get', sum(len(r) for values in results for r in values))
+        return results
+
+    def row_values(self, row, **kwargs):
+        self._backend.request('row_values', 1)
+        return list(self._rows[row - 1]) if len(self._rows) >= row else []
+
+    def col_values(self, col, **kwargs):
+        self._backend.request('col_values', len(self._rows))
+        values = [row[col - 1] if len(row) >= col else '' for row in self._rows]
+        while values and values[-1] == '':
+            values.pop()
+        return values
+
+    def append_row(self, values, **kwargs):
+        return self.append_rows([values], **kwargs)
+
+    def append_rows(self, values, **kwargs):
+        self._backend.request('append_rows', sum(len(r) for r in values))
+        start = len(self._rows)
+        self._write(start, 0, values)
+        return {'updates': {'updatedRange': f"'{self.title}'!A{start + 1}"}}
+
+    def update(self, range_name, values=None, **kwargs):
+        # gspread accepts update(values, range_name) as well as update(range_name, values)
+        if isinstance(range_name, list):
+            range_name, values = values or 'A1', range_name
+        self._backend.request('update', sum(len(r) for r in values))
+        grid = a1_range_to_grid_range(range_name)
+        self._write(grid.get('startRowIndex', 0), grid.get('startColumnIndex', 0), values)
+        return {}
+
+    def delete_rows(self, start_index, end_index=None):
+        self._backend.request('delete_rows')
+        self.spreadsheet.version += 1
+        del self._rows[start_index - 1:(end_index or start_index)]
+        return {}
+
+    def clear(self):
+        self._backend.request('clear')
+        self.spreadsheet.version += 1
+        self._rows = []
+        return {}
+
+
+class FakeSpreadsheet:
+    def __init__(self, client, spreadsheet_id, title):
+        self.client = client
+        self.id = spreadsheet_id
+        self.title = title
+        self.version = 1  # Drive file version, bumped by every edit
+        self._worksheets = {}
+
+    @property
+    def _backend(self):
+        return self.client.backend
+
+    def _by_id(self, sheet_id):
+        for worksheet in self._worksheets.values():
+            if worksheet.id == sheet_id:
+                return worksheet
+        raise gspread.exceptions.APIError(FakeResponse(400, f'No grid with id: {sheet_id}'))
+
+    def worksheet(self, title):
+        self._backend.request('fetch_sheet_metadata')
+        if title not in self._worksheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self._worksheets[title]
+
+    def worksheets(self, exclude_hidden=False):
+        self._backend.request('fetch_sheet_metadata')
+        return list(self._worksheets.values())
+
+    def add_worksheet(self, title, rows, cols, index=None):
+        self._backend.request('add_worksheet')
+        worksheet = FakeWorksheet(self, title, rows, cols)
+        self._worksheets[title] = worksheet
+        return worksheet
+
+    def del_worksheet(self, worksheet):
+        self._backend.request('del_worksheet')
+        self._worksheets.pop(worksheet.title, None)
+
+    def values_get(self, range_name, params=None):
+        sheet, cells = split_range(range_name)
+        if sheet not in self._worksheets:
+            raise gspread.exceptions.APIError(FakeResponse(400, f'Unable to parse range: {range_name}'))
+        values = self._worksheets[sheet]._grid(cells)
+        self._backend.request('values_get', sum(len(r) for r in values))
+        result = {'range': range_name, 'majorDimension': 'ROWS'}
+        if values:
+            result['values'] = values
+        return result
+
+    def values_batch_get(self, ranges, params=None):
+        value_ranges = []
+        cells = 0
+        for range_name in ranges:
+            sheet, a1 = split_range(range_name)
+            values = self._worksheets[sheet]._grid(a1) if sheet in self._worksheets else []
+            cells += sum(len(r) for r in values)
+            value_range = {'range': range_name, 'majorDimension': 'ROWS'}
+            if values:
+                value_range['values'] = values
+            value_ranges.append(value_range)
+        self._backend.request('values_batch_get', cells)
+        return {'spreadsheetId': self.id, 'valueRanges': value_ranges}
+
+    def batch_update(self, body):
+        requests = body.get('requests', [])
+        self._backend.request('batch_update', len(requests))
+        self.version += 1
+        replies = []
+        for request in requests:
+            if 'appendCells' in request:
+                append = request['appendCells']
+                worksheet = self._by_id(append['sheetId'])
+                rows = [[_cell_value(c) for c in row.get('values', [])] for row in append['rows']]
+                worksheet._write(len(worksheet._rows), 0, rows)
+            elif 'updateCells' in request:
+                update = request['updateCells']
+                start = update['start']
+                rows = [[_cell_value(c) for c in row.get('values', [])] for row in update['rows']]
+                self._by_id(start['sheetId'])._write(start.get('rowIndex', 0), start.get('columnIndex', 0), rows)
+            elif 'deleteDimension' in request:
+                grid = request['deleteDimension']['range']
+                worksheet = self._by_id(grid['sheetId'])
+                del worksheet._rows[grid['startIndex']:grid['endIndex']]
+            elif 'addSheet' in request:
+                properties = request['addSheet']['properties']
+                worksheet = FakeWorksheet(self, properties['title'])
+                self._worksheets[worksheet.title] = worksheet
+                replies.append({'addSheet': {'properties': {'title': worksheet.title, 'sheetId': worksheet.id}}})
+                continue
+            else:
+                raise gspread.exceptions.APIError(FakeResponse(400, f'Unsupported request: {list(request)}'))
+            replies.append({})
+        return {'spreadsheetId': self.id, 'replies': replies}
+
+
+class FakeClient:
+    """Drop-in replacement for a gspread Client: GoogleSheetsDB(client=FakeClient())"""
+
+    # Unique across clients: process-wide caches (reference data, movement log index) are keyed by spreadsheet ID
+    _ids = itertools.count(1)
+
+    def __init__(self, latency=0.0, latency_per_cell=0.0, quota_per_minute=0):
+        self.backend = FakeBackend(latency, latency_per_cell, quota_per_minute)
+        self._spreadsheets = {}
+
+    def create(self, title):
+        self.backend.request('create')
+        spreadsheet_id = f"fake-spreadsheet-{next(self._ids):04d}-{'0' * 24}"
+        spreadsheet = FakeSpreadsheet(self, spreadsheet_id, title)
+        self._spreadsheets[spreadsheet_id] = spreadsheet
+        return spreadsheet
+
+    def open_by_key(self, key):
+        self.backend.request('open_by_key')
+        if key not in self._spreadsheets:
+            raise gspread.exceptions.SpreadsheetNotFound(key)
+        return self._spreadsheets[key]
+
+    def open(self, title):
+        self.backend.request('open')
+        for spreadsheet in self._spreadsheets.values():
+            if spreadsheet.title == title:
+                return spreadsheet
+        raise gspread.exceptions.SpreadsheetNotFound(title)
+
+    def request(self, method, endpoint, params=None, **kwargs):
+        """Drive files.get for a spreadsheet's version, the only raw request the app makes"""
+        self.backend.request('drive_files_get')
+        spreadsheet = self._spreadsheets.get(endpoint.rstrip('/').rsplit('/', 1)[-1])
+        if spreadsheet is None:
+            raise gspread.exceptions.APIError(FakeResponse(404, f'File not found: {endpoint}'))
+        return FakeJSONResponse({'version': str(spreadsheet.version)})
+
+    def load_frame(self, spreadsheet, sheet_name, frame):
+        """Bulk-load a DataFrame into a worksheet without simulated latency or quota"""
+        worksheet = spreadsheet._worksheets.get(sheet_name)
+        if worksheet is None:
+            worksheet = FakeWorksheet(spreadsheet, sheet_name, rows=len(frame) + 1, cols=len(frame.columns))
+            spreadsheet._worksheets[sheet_name] = worksheet
+        worksheet._rows = [list(frame.columns)] + frame.astype(str).values.tolist()
+        spreadsheet.version += 1
+        return worksheet
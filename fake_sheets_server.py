@@ -0,0 +1,144 @@
+"""
+Fake Sheets REST Server Module
+
+Local HTTP server speaking the subset of the Sheets v4 and Drive v3 REST APIs
+that AsyncGoogleSheetsDB uses (values get/update/append/clear, batchUpdate,
+spreadsheet metadata and the Drive files search by name). Spreadsheets live in
+a fake_sheets.FakeClient, so data loaded for the gspread fake is served here
+too. Used by the async storage-layer tests:
+
+    async with FakeSheetsServer(client) as server:
+        db = AsyncGoogleSheetsDB(spreadsheet.id, base_url=server.sheets_url,
+                                 drive_url=server.drive_url, anonymous=True)
+"""
+import asyncio
+import re
+from collections import Counter
+from urllib.parse import unquote
+
+import gspread
+from aiohttp import web
+
+from fake_sheets import FakeClient, split_range
+
+# A Drive query is clauses like name = 'x' joined by "and"; quotes and backslashes in literals are escaped
+_LITERAL = r"'(?:[^'\\]|\\.)*'"
+_CLAUSE = re.compile(rf"(\w+) = ({_LITERAL}|true|false)")
+_QUERY = re.compile(rf"{_CLAUSE.pattern}(?: and {_CLAUSE.pattern})*")
+# Ranges may arrive with raw ':' and '!' (HTTP clients re-quote paths), so the action is only taken from the end
+_SPREADSHEET_PATH = re.compile(r"/v4/spreadsheets/([^/:]+)(:batchUpdate)?(?:/values/(.+?)(?::(clear|append))?)?")
+
+
+def parse_drive_query(query):
+    """{field: value} of a Drive files query; ValueError when it is not well formed"""
+    if not _QUERY.fullmatch(query):
+        raise ValueError(f"Invalid query: {query}")
+    clauses = {}
+    for field, value in _CLAUSE.findall(query):
+        clauses[field] = re.sub(r"\\(.)", r"\1", value[1:-1]) if value.startswith("'") else value == 'true'
+    return clauses
+
+
+class FakeSheetsServer:
+    """aiohttp server on 127.0.0.1 (a free port) serving a FakeClient's spreadsheets"""
+
+    def __init__(self, client=None, delay=0.0):
+        self.client = client or FakeClient()
+        self.delay = delay  # seconds each request takes, to observe concurrency
+        self.requests = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.url = None
+        self._runner = None
+
+    @property
+    def sheets_url(self):
+        return f"{self.url}/v4/spreadsheets"
+
+    @property
+    def drive_url(self):
+        return f"{self.url}/drive/v3/files"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route('*', '/{path:.*}', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', 0).start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    async def _handle(self, request):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            body = await request.json() if request.can_read_body else {}
+            return web.json_response(self._dispatch(request.method, request.rel_url.raw_path,
+                                                    request.rel_url.query, body))
+        except gspread.exceptions.APIError as e:
+            return self._error(e.response.status_code, e.response.text)
+        except (gspread.exceptions.SpreadsheetNotFound, gspread.exceptions.WorksheetNotFound) as e:
+            return self._error(404, f"Not found: {e}")
+        except (ValueError, KeyError) as e:
+            return self._error(400, str(e))
+        finally:
+            self.in_flight -= 1
+
+    @staticmethod
+    def _error(status, message):
+        return web.json_response({'error': {'code': status, 'message': message}}, status=status)
+
+    def _dispatch(self, method, path, query, body):
+        if path == '/drive/v3/files' and method == 'GET':
+            self.requests['drive_files_list'] += 1
+            return self._search(parse_drive_query(query.get('q', '')))
+        match = _SPREADSHEET_PATH.fullmatch(path)
+        if match is None:
+            raise ValueError(f"Unsupported endpoint: {method} {path}")
+        spreadsheet_id, batch_update, range_name, action = match.groups()
+        spreadsheet = self.client.open_by_key(unquote(spreadsheet_id))
+        if batch_update:
+            self.requests['batch_update'] += 1
+            return spreadsheet.batch_update(body)
+        if range_name is None:
+            self.requests['get_spreadsheet'] += 1
+            return {'spreadsheetId': spreadsheet.id, 'sheets': [
+                {'properties': {'title': worksheet.title, 'sheetId': worksheet.id}}
+                for worksheet in spreadsheet.worksheets()]}
+        range_name = unquote(range_name)
+        self.requests[f"values_{action or method.lower()}"] += 1
+        if method == 'GET' and action is None:
+            return spreadsheet.values_get(range_name)
+        sheet, cells = split_range(range_name)
+        worksheet = spreadsheet.worksheet(sheet)
+        if action == 'clear':
+            if cells:
+                raise ValueError("Only whole-sheet clears are supported")
+            worksheet.clear()
+            return {'spreadsheetId': spreadsheet.id, 'clearedRange': range_name}
+        if action == 'append':
+            # Rows go after the last row of the sheet (the table detection of the real API is not modelled)
+            return worksheet.append_rows(body.get('values', []))
+        if method == 'PUT':
+            worksheet.update(cells or 'A1', body.get('values', []))
+            return {'spreadsheetId': spreadsheet.id, 'updatedRange': range_name}
+        raise ValueError(f"Unsupported endpoint: {method} {path}")
+
+    def _search(self, clauses):
+        files = [{'id': spreadsheet.id} for spreadsheet in self.client._spreadsheets.values()
+                 if 'name' not in clauses or spreadsheet.title == clauses['name']]
+        return {'files': files}
@@ -1,25 +1,100 @@
 """
 Google Sheets Integration Module
 """
-import gspread
-from google.oauth2.service_account import Credentials
 import pandas as pd
-from config import CREDENTIALS_FILE, SCOPES, SHEETS
+import itertools
+import threading
+import time
+from config import (
+    CREDENTIALS_FILE, SCOPES, SHEETS, DRIVE_API_URL,
+    UPDATED_AT_COLUMN, DELTA_SYNC_SHEETS, DELTA_SYNC_MAX_AGE, DELTA_SYNC_FULL_FETCH_RATIO,
+    DELTA_SYNC_FULL_REFRESH, SNAPSHOT_CACHE_EXCLUDE, EXPORT_CHUNK_ROWS,
+    LOCATION_SCOPED_SHEETS, LOCATION_SCOPE_COLUMN, LOCATION_SCOPE_RANGES_PER_CALL, LOCATION_SCOPE_MAX_CALLS
+)
 from datetime import datetime
 import streamlit as st
+from rate_limiter import get_scheduler, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from metrics import SHEETS_CALL_SECONDS, timed_db_method, record_response_bytes, record_cache
+from snapshot_cache import SnapshotCache, submit
+from change_feed import get_change_feed
+from sheet_utils import numericise_all, rowcol_to_a1
+
+# Tokens for cached frames: a new one whenever rows downloaded from Sheets (not change-feed patches) change a frame
+_revisions = itertools.count(1)
+
+def records_from_values(values):
+    """Convert a values grid (header row first) into records like gspread's get_all_records"""
+    if not values:
+        return []
+    headers = values[0]
+    records = []
+    for row in values[1:]:
+        row = list(row) + [''] * (len(headers) - len(row))
+        records.append(dict(zip(headers, numericise_all(row[:len(headers)]))))
+    return records
+
+def failed_read(error):
+    """The empty frame read_data returns when a sheet could not be read, with the error in attrs['read_error']"""
+    frame = pd.DataFrame()
+    frame.attrs['read_error'] = str(error)
+    return frame
+
+def read_failed(frame):
+    """Whether a frame from read_data stands for a failed read (as opposed to an empty sheet)"""
+    return bool(frame.attrs.get('read_error'))
+
+def from_snapshot(frame):
+    """Whether a frame from read_data is a disk snapshot served before revalidation against Sheets"""
+    return bool(frame.attrs.get('from_snapshot'))
+
+def _column_letter(col):
+    return rowcol_to_a1(1, col)[:-1]
+
+def _quote(sheet_name):
+    return "'" + sheet_name.replace("'", "''") + "'"
+
+def _row_runs(rows):
+    """Collapse sorted row numbers into [first, last] runs of consecutive rows"""
+    runs = []
+    for row in rows:
+        if runs and runs[-1][1] == row - 1:
+            runs[-1][1] = row
+        else:
+            runs.append([row, row])
+    return runs
 
 class GoogleSheetsDB:
-    def __init__(self, spreadsheet_id=None):
-        """Initialize Google Sheets connection"""
+    # Callables run as listener(spreadsheet_id, sheet_name) after every successful write
+    change_listeners = []
+    
+    def __init__(self, spreadsheet_id=None, client=None, scheduler=None, snapshot_cache=None):
+        """Initialize Google Sheets connection (pass `client` to use a preconfigured or fake gspread client)"""
+        self.scheduler = scheduler or get_scheduler()
+        self.snapshot_cache = snapshot_cache or SnapshotCache()
+        self._worksheets = {}
+        self._snapshots = {}
+        self._scoped = {}  # sheet -> in-scope rows of LOCATION_SCOPED_SHEETS, see _read_scoped
+        self.scope = None  # Location values this connection may read; None for every row
+        self._revalidated = set()
+        self._pending_id = None
+        self._spreadsheet = None
+        self._open_lock = threading.Lock()
+        self._sync_lock = threading.RLock()
         try:
-            creds = Credentials.from_service_account_file(
-                CREDENTIALS_FILE,
-                scopes=SCOPES
-            )
-            self.client = gspread.authorize(creds)
+            if client is None:
+                # gspread and the Google auth stack are only needed for a real connection
+                import gspread
+                from google.oauth2.service_account import Credentials
+                creds = Credentials.from_service_account_file(
+                    CREDENTIALS_FILE,
+                    scopes=SCOPES
+                )
+                client = gspread.authorize(creds)
+                client.session.hooks['response'].append(record_response_bytes)
+            self.client = client
             self.spreadsheet_id = spreadsheet_id
             if spreadsheet_id:
-                self.spreadsheet = self.client.open_by_key(spreadsheet_id)
+                self.spreadsheet = self._call(self.client.open_by_key, spreadsheet_id)
             else:
                 # Try to open by title if ID not provided
                 self.spreadsheet = None
@@ -28,88 +103,564 @@ class GoogleSheetsDB:
             self.client = None
             self.spreadsheet = None
     
+    def _call(self, fn, *args, priority=PRIORITY_INTERACTIVE, idempotent=True, **kwargs):
+        """Run a gspread call through the shared quota scheduler"""
+        with SHEETS_CALL_SECONDS.time(call=fn.__name__):
+            return self.scheduler.call(fn, *args, priority=priority, idempotent=idempotent, **kwargs)
+    
+    @property
+    def spreadsheet(self):
+        """The gspread Spreadsheet, opened on first use when the session started from disk snapshots"""
+        if self._spreadsheet is None and self._pending_id:
+            with self._open_lock:
+                if self._spreadsheet is None and self._pending_id:
+                    spreadsheet_id, self._pending_id = self._pending_id, None
+                    try:
+                        self._spreadsheet = self._call(self.client.open_by_key, spreadsheet_id)
+                    except Exception as e:
+                        st.error(f"Error opening spreadsheet: {str(e)}")
+        return self._spreadsheet
+    
+    @spreadsheet.setter
+    def spreadsheet(self, spreadsheet):
+        self._spreadsheet = spreadsheet
+    
+    @timed_db_method
     def set_spreadsheet(self, spreadsheet_id_or_title):
         """Set the spreadsheet by ID or title"""
+        if (self._spreadsheet is not None or self._pending_id) and spreadsheet_id_or_title == self.spreadsheet_id:
+            # Already connected; keep worksheet handles and cached snapshots
+            return True
         try:
+            self._worksheets = {}
+            self._snapshots = {}
+            self._scoped = {}
+            self._revalidated = set()
+            if len(spreadsheet_id_or_title) > 30 and self.client is not None and \
+                    self.snapshot_cache.has_snapshots(spreadsheet_id_or_title):
+                # Reads are served from disk first, so defer the metadata round trip until a live call needs it
+                self._spreadsheet = None
+                self._pending_id = spreadsheet_id_or_title
+                self.spreadsheet_id = spreadsheet_id_or_title
+                return True
             if len(spreadsheet_id_or_title) > 30:  # Likely an ID
-                self.spreadsheet = self.client.open_by_key(spreadsheet_id_or_title)
+                self.spreadsheet = self._call(self.client.open_by_key, spreadsheet_id_or_title)
             else:  # Likely a title
-                self.spreadsheet = self.client.open(spreadsheet_id_or_title)
+                self.spreadsheet = self._call(self.client.open, spreadsheet_id_or_title)
             self.spreadsheet_id = self.spreadsheet.id
             return True
         except Exception as e:
             st.error(f"Error opening spreadsheet: {str(e)}")
             return False
     
+    @timed_db_method
     def get_worksheet(self, sheet_name):
         """Get a worksheet by name, create if doesn't exist"""
         if not self.spreadsheet:
             return None
+        if sheet_name in self._worksheets:
+            return self._worksheets[sheet_name]
+        import gspread  # already loaded by whatever client opened the spreadsheet
         try:
-            return self.spreadsheet.worksheet(sheet_name)
+            worksheet = self._call(self.spreadsheet.worksheet, sheet_name)
         except gspread.exceptions.WorksheetNotFound:
             # Create worksheet if it doesn't exist
-            worksheet = self.spreadsheet.add_worksheet(title=sheet_name, rows=1000, cols=20)
-            return worksheet
+            worksheet = self._call(self.spreadsheet.add_worksheet, title=sheet_name, rows=1000, cols=20,
+                                   priority=PRIORITY_BACKGROUND, idempotent=False)
+        self._worksheets[sheet_name] = worksheet
+        return worksheet
+    
+    def _notify_change(self, sheet_name):
+        if sheet_name in self._scoped:
+            # Re-check the index on the next read; rows already downloaded stay reusable
+            self._scoped[sheet_name]['checked'] = float('-inf')
+        for listener in self.change_listeners:
+            listener(self.spreadsheet_id, sheet_name)
+    
+    def _record_change(self, sheet_name, operation, row=None, before=None, after=None):
+        """Add a write to the process-wide change feed"""
+        return get_change_feed().record(self.spreadsheet_id, sheet_name, operation, row, before, after)
+    
+    def _snapshot_row(self, sheet_name, row):
+        """Cached values of a data row (0-based) before it is overwritten, if this session holds them"""
+        scoped = self._scoped.get(sheet_name)
+        if self.scope is not None and scoped is not None:
+            position = scoped['positions'].get(row)
+            if position is None:
+                return None
+            return dict(zip(scoped['headers'], scoped['frame'].iloc[position].tolist()))
+        snapshot = self._snapshots.get(sheet_name)
+        if snapshot is None or not 0 <= row < len(snapshot['frame']):
+            return None
+        return dict(zip(snapshot['headers'], snapshot['frame'].iloc[row].tolist()))
+    
+    def _apply_feed(self, sheet_name, snapshot):
+        """Patch a snapshot with the writes this process made since it was read.
+        
+        Returns False, leaving the snapshot untouched, when a change cannot be placed with
+        certainty (dropped from the feed, unknown row, header change); delta sync then
+        compares rows with the sheet as usual.
+        """
+        feed = get_change_feed()
+        changes = feed.since(snapshot['feed_version'], self.spreadsheet_id, sheet_name)
+        if changes is None:
+            snapshot['feed_version'] = feed.version()
+            return False
+        if not changes:
+            return True
+        headers = snapshot['headers']
+        if not headers:
+            return False
+        updated_position = headers.index(UPDATED_AT_COLUMN) if UPDATED_AT_COLUMN in headers else None
+        frame, keys = snapshot['frame'], list(snapshot['keys'])
+        pending = {}  # column -> {row: value}, applied one column at a time
+        
+        def key_of(values, current=('', '')):
+            first = str(values[headers[0]]) if headers[0] in values else current[0]
+            updated = str(values[UPDATED_AT_COLUMN]) if UPDATED_AT_COLUMN in values else current[1]
+            return (first, updated if updated_position is not None else '')
+        
+        def flush(frame):
+            if not pending:
+                return frame
+            frame = frame.copy()
+            for column, updates in pending.items():
+                values = frame[column].to_numpy(dtype=object, copy=True)
+                values[list(updates)] = numericise_all([str(v) for v in updates.values()])
+                frame[column] = values
+            pending.clear()
+            return frame
+        
+        for change in changes:
+            after = change.after or {}
+            if any(column not in headers for column in after):
+                return False
+            if change.operation in ('update', 'patch'):
+                row = change.row
+                if row is None or not 0 <= row < len(keys) or key_of(after, keys[row])[0] != keys[row][0]:
+                    return False
+                for column, value in after.items():
+                    pending.setdefault(column, {})[row] = value
+                keys[row] = key_of(after, keys[row])
+            elif change.operation == 'append':
+                frame = flush(frame)
+                key = key_of(after)
+                if key in keys[-len(changes):]:
+                    # Already in the rows read after this write was made
+                    continue
+                row_values = numericise_all([str(after.get(h, '')) for h in headers])
+                frame = pd.concat([frame, pd.DataFrame([row_values], columns=headers, index=[len(frame)])])
+                keys.append(key)
+            elif change.operation == 'delete':
+                row = change.row
+                if change.before is None or row is None or not 0 <= row < len(keys) \
+                        or key_of(change.before) != keys[row]:
+                    return False
+                frame = flush(frame).drop(index=row).reset_index(drop=True)
+                del keys[row]
+            else:
+                return False
+        snapshot.update({'frame': flush(frame), 'keys': keys, 'feed_version': changes[-1].version})
+        record_cache('change_feed', True, len(changes))
+        return True
+    
+    def last_version(self):
+        """Drive version behind the most recent delta-synced read (None before one, or when scoped)"""
+        if self.scope is not None:
+            # Results precomputed from every row must not be served to a scoped connection
+            return None
+        versions = [snapshot['version'] for snapshot in self._snapshots.values() if snapshot.get('version')]
+        return max(versions, key=lambda v: int(v) if v.isdigit() else 0) if versions else None
+    
+    def data_revision(self, sheet_name):
+        """Token of the frame behind the last read of sheet_name; it changes when rows read from Sheets
+        change that frame, not when change-feed patches do (None before a delta-synced or scoped read)"""
+        cached = (self._scoped if self._is_scoped(sheet_name) else self._snapshots).get(sheet_name)
+        return cached.get('revision') if cached else None
+    
+    def _drive_version(self):
+        """Spreadsheet-wide revision number from Drive metadata (bumped by any edit)"""
+        response = self._call(
+            self.client.request, 'get', f"{DRIVE_API_URL}/{self.spreadsheet_id}",
+            params={'fields': 'version', 'supportsAllDrives': True}
+        )
+        return str(response.json().get('version', ''))
+    
+    def _full_snapshot(self, sheet_name, worksheet, version):
+        # Taken before the read: changes recorded meanwhile are re-checked against the rows read
+        feed_version = get_change_feed().version()
+        values = self._call(worksheet.get_all_values)
+        headers = values[0] if values else []
+        frame = pd.DataFrame(records_from_values(values), columns=headers or None)
+        key_position = headers.index(UPDATED_AT_COLUMN) if UPDATED_AT_COLUMN in headers else None
+        keys = [self._row_key(row, key_position) for row in values[1:]]
+        self._snapshots[sheet_name] = {
+            'frame': frame, 'headers': headers, 'keys': keys, 'feed_version': feed_version,
+            'version': version, 'checked': time.monotonic(), 'loaded': time.monotonic(), 'revision': next(_revisions)
+        }
+        return frame
+    
+    @staticmethod
+    def _row_key(row, updated_position):
+        """Identity of a row version: first cell plus its Updated At stamp"""
+        first = row[0] if row else ''
+        updated = row[updated_position] if updated_position is not None and len(row) > updated_position else ''
+        return (first, updated)
+    
+    def _read_delta(self, sheet_name, worksheet, version=None):
+        """Refresh the cached snapshot of a sheet, downloading only rows whose version changed"""
+        with self._sync_lock:
+            return self._read_delta_locked(sheet_name, worksheet, version)
+    
+    def _read_delta_locked(self, sheet_name, worksheet, version):
+        if version is None:
+            version = self._drive_version()
+        snapshot = self._snapshots.get(sheet_name)
+        if snapshot is None or time.monotonic() - snapshot['loaded'] > DELTA_SYNC_FULL_REFRESH:
+            # Periodic full reload also catches unstamped edits made directly in the spreadsheet
+            record_cache('delta_sync', False)
+            return self._full_snapshot(sheet_name, worksheet, version)
+        if not self._apply_feed(sheet_name, snapshot):
+            snapshot['checked'] = float('-inf')
+        if version == snapshot['version'] and time.monotonic() - snapshot['checked'] < DELTA_SYNC_MAX_AGE:
+            record_cache('delta_sync', True)
+            return snapshot['frame']
+        
+        headers = snapshot['headers']
+        if UPDATED_AT_COLUMN not in headers:
+            # No per-row stamps yet (nothing written since the upgrade): trust the version alone
+            if version == snapshot['version']:
+                record_cache('delta_sync', True)
+                snapshot['checked'] = time.monotonic()
+                return snapshot['frame']
+            record_cache('delta_sync', False)
+            return self._full_snapshot(sheet_name, worksheet, version)
+        updated_col = _column_letter(headers.index(UPDATED_AT_COLUMN) + 1)
+        sheet = _quote(sheet_name)
+        # One read for the header row, the first column and the Updated At column
+        result = self._call(self.spreadsheet.values_batch_get,
+                            [f"{sheet}!1:1", f"{sheet}!A:A", f"{sheet}!{updated_col}:{updated_col}"])
+        header_range, first_range, updated_range = [r.get('values', []) for r in result.get('valueRanges', [])]
+        if not header_range or header_range[0] != headers:
+            record_cache('delta_sync', False)
+            return self._full_snapshot(sheet_name, worksheet, version)
+        n_rows = max(len(first_range), len(updated_range)) - 1
+        first_values = [r[0] if r else '' for r in first_range[1:]] + [''] * n_rows
+        updated_values = [r[0] if r else '' for r in updated_range[1:]] + [''] * n_rows
+        keys = list(zip(first_values[:n_rows], updated_values[:n_rows]))
+        old_keys = snapshot['keys']
+        changed = [i for i in range(n_rows) if i >= len(old_keys) or keys[i] != old_keys[i]]
+        if n_rows < len(old_keys) or len(changed) > DELTA_SYNC_FULL_FETCH_RATIO * max(n_rows, 1):
+            # Deletions or mass edits: a full download is cheaper than many ranges
+            record_cache('delta_sync', False)
+            return self._full_snapshot(sheet_name, worksheet, version)
+        record_cache('delta_sync', True)
+        
+        frame = snapshot['frame']
+        if changed:
+            ranges = _row_runs(changed)
+            result = self._call(self.spreadsheet.values_batch_get,
+                                [f"{sheet}!A{first + 2}:{last + 2}" for first, last in ranges])
+            rows = []
+            for value_range, (first, last) in zip(result.get('valueRanges', []), ranges):
+                values = value_range.get('values', [])
+                rows.extend(values + [[]] * (last - first + 1 - len(values)))
+            updates = pd.DataFrame(records_from_values([headers] + rows), index=changed, columns=headers)
+            frame = pd.concat([frame[~frame.index.isin(changed)], updates]).sort_index()
+            snapshot['revision'] = next(_revisions)
+        snapshot.update({'frame': frame, 'keys': keys, 'version': version, 'checked': time.monotonic()})
+        return frame
     
+    def set_scope(self, locations):
+        """Limit LOCATION_SCOPED_SHEETS to rows whose Location is one of `locations` (None lifts the limit).
+
+        Row numbers passed to update_row/delete_row then refer to the scoped frame returned by
+        the last read_data of that sheet.
+        """
+        scope = None if locations is None else frozenset(str(location) for location in locations)
+        if scope != self.scope:
+            self.scope = scope
+            self._scoped = {}
+    
+    def _is_scoped(self, sheet_name):
+        return self.scope is not None and sheet_name in LOCATION_SCOPED_SHEETS
+    
+    def _scope_index(self, sheet_name, headers):
+        """(headers, {column: values below the header}) for the first, Location and Updated At columns"""
+        sheet = _quote(sheet_name)
+        for attempt in range(2):
+            if headers is None or attempt > 0:
+                header_range = self._call(self.spreadsheet.values_get, f"{sheet}!1:1").get('values', [])
+                headers = header_range[0] if header_range else []
+            names = [name for name in (LOCATION_SCOPE_COLUMN, UPDATED_AT_COLUMN) if name in headers]
+            if not headers or LOCATION_SCOPE_COLUMN not in names:
+                return headers, None
+            letters = ['A'] + [_column_letter(headers.index(name) + 1) for name in names]
+            result = self._call(self.spreadsheet.values_batch_get,
+                                [f"{sheet}!1:1"] + [f"{sheet}!{letter}:{letter}" for letter in letters])
+            header_range, *column_ranges = [r.get('values', []) for r in result.get('valueRanges', [])]
+            # Columns moved since the header was cached: read it again once
+            if header_range and header_range[0] == headers:
+                break
+        else:
+            raise ValueError(f"Header row of {sheet_name} changed while reading")
+        columns = [[row[0] if row else '' for row in values[1:]] for values in column_ranges]
+        n_rows = max(map(len, columns))
+        return headers, {name: values + [''] * (n_rows - len(values))
+                         for name, values in zip(['first'] + names, columns)}
+    
+    def _read_scoped(self, sheet_name, worksheet):
+        """In-scope rows of a sheet, found with a read of three narrow columns; only those rows are downloaded.
+        
+        Downloaded rows are kept by (first column, Updated At), so later reads fetch only in-scope
+        rows that were added or edited since, whatever happened to the rest of the sheet.
+        """
+        with self._sync_lock:
+            version = self._drive_version()
+            cached = self._scoped.get(sheet_name)
+            if cached is not None and cached['version'] == version and \
+                    time.monotonic() - cached['checked'] < DELTA_SYNC_MAX_AGE:
+                record_cache('location_scope', True)
+                return cached
+            headers, columns = self._scope_index(sheet_name, cached['headers'] if cached else None)
+            if columns is None:
+                # No Location column: no row is in scope
+                cached = {'headers': headers, 'frame': pd.DataFrame(columns=headers), 'rows': [], 'positions': {},
+                          'by_key': {}, 'index': {}, 'version': version, 'checked': time.monotonic(), 'loaded': time.monotonic(),
+                          'revision': next(_revisions)}
+                self._scoped[sheet_name] = cached
+                return cached
+            locations = columns[LOCATION_SCOPE_COLUMN]
+            rows = [row for row, location in enumerate(locations) if location in self.scope]
+            keyed = UPDATED_AT_COLUMN in columns
+            keys = list(zip([columns['first'][row] for row in rows],
+                            [columns[UPDATED_AT_COLUMN][row] for row in rows] if keyed else rows))
+            # Header changes and the periodic full refresh start from nothing; without Updated At
+            # stamps rows are keyed by position, which only holds while the version is unchanged
+            fresh = cached is not None and cached['headers'] == headers and \
+                (keyed or cached['version'] == version) and \
+                time.monotonic() - cached['loaded'] < DELTA_SYNC_FULL_REFRESH
+            by_key = {key: cached['by_key'][key] for key in keys if key in cached['by_key']} if fresh else {}
+            record_cache('location_scope', False)
+            record_cache('location_rows', True, len(by_key))
+            missing = [row for row, key in zip(rows, keys) if key not in by_key]
+            record_cache('location_rows', False, len(missing))
+            
+            sheet = _quote(sheet_name)
+            last_column = _column_letter(len(headers))
+            runs = _row_runs(missing)
+            if len(runs) > LOCATION_SCOPE_RANGES_PER_CALL * LOCATION_SCOPE_MAX_CALLS:
+                # Rows scattered all over the sheet: one download beats many ranged reads
+                values = self._call(worksheet.get_all_values)[1:]
+                fetched = {row: values[row] if row < len(values) else [] for row in missing}
+            else:
+                fetched = {}
+                for start in range(0, len(runs), LOCATION_SCOPE_RANGES_PER_CALL):
+                    chunk = runs[start:start + LOCATION_SCOPE_RANGES_PER_CALL]
+                    result = self._call(self.spreadsheet.values_batch_get,
+                                        [f"{sheet}!A{first + 2}:{last_column}{last + 2}" for first, last in chunk])
+                    for (first, last), value_range in zip(chunk, result.get('valueRanges', [])):
+                        values = value_range.get('values', [])
+                        for row in range(first, last + 1):
+                            fetched[row] = values[row - first] if row - first < len(values) else []
+            for row, key in zip(rows, keys):
+                if row in fetched:
+                    by_key[key] = fetched[row]
+            
+            frame = pd.DataFrame(records_from_values([headers] + [by_key[key] for key in keys]), columns=headers)
+            cached = {
+                'headers': headers, 'frame': frame, 'rows': rows,
+                'positions': {row: position for position, row in enumerate(rows)}, 'by_key': by_key, 'index': columns,
+                'version': version, 'checked': time.monotonic(),
+                'loaded': cached['loaded'] if fresh else time.monotonic(),
+                'revision': cached['revision'] if fresh and not missing and rows == cached['rows'] else next(_revisions)
+            }
+            self._scoped[sheet_name] = cached
+            return cached
+    
+    def _sheet_row(self, sheet_name, row_index):
+        """Sheet data row (1-based) for a row of the last scoped read; unchanged when not scoped"""
+        if not self._is_scoped(sheet_name):
+            return row_index
+        scoped = self._scoped.get(sheet_name)
+        if scoped is None or not 1 <= row_index <= len(scoped['rows']):
+            raise IndexError(f"Row {row_index} is not in the last read of {sheet_name}")
+        return scoped['rows'][row_index - 1] + 1
+    
+    def _seed_from_disk(self, sheet_name, frame, version):
+        """Start delta sync from a disk snapshot; the first live read re-checks every row"""
+        headers = [str(c) for c in frame.columns]
+        updated = frame[UPDATED_AT_COLUMN].astype(str) if UPDATED_AT_COLUMN in frame.columns else pd.Series('', index=frame.index)
+        first = frame.iloc[:, 0].astype(str) if headers else pd.Series('', index=frame.index)
+        with self._sync_lock:
+            self._snapshots[sheet_name] = {
+                'frame': frame, 'headers': headers, 'keys': list(zip(first, updated)),
+                'feed_version': get_change_feed().version(),
+                'version': version, 'checked': float('-inf'), 'loaded': time.monotonic(), 'revision': next(_revisions)
+            }
+    
+    def _read_records(self, worksheet):
+        """Whole sheet as a DataFrame; an empty sheet keeps its header, so it can be told apart from a failed read"""
+        data = self._call(worksheet.get_all_records)
+        if not data:
+            return pd.DataFrame(columns=self._call(worksheet.row_values, 1))
+        return pd.DataFrame(data)
+    
+    def _revalidate(self, sheet_name, version):
+        """Compare a snapshot's version stamp with Drive and refresh it if the spreadsheet changed"""
+        # Stamp is taken before the data is read, so a snapshot is never newer than its version
+        current = self._drive_version()
+        if version is not None and current == version:
+            if sheet_name in self._snapshots:
+                self._snapshots[sheet_name]['checked'] = time.monotonic()
+            return None
+        worksheet = self.get_worksheet(sheet_name)
+        if worksheet is None:
+            return None
+        if sheet_name in DELTA_SYNC_SHEETS:
+            frame = self._read_delta(sheet_name, worksheet, current)
+        else:
+            frame = self._read_records(worksheet)
+        self.snapshot_cache.save(self.spreadsheet_id, sheet_name, frame, current)
+        return frame
+    
+    def _read_cold(self, sheet_name):
+        """First read of a sheet in this session: serve the disk snapshot, revalidate in the background"""
+        self._revalidated.add(sheet_name)
+        loaded = self.snapshot_cache.load(self.spreadsheet_id, sheet_name)
+        record_cache('snapshot', loaded is not None)
+        if loaded is None:
+            return self._revalidate(sheet_name, None)
+        frame, version = loaded
+        if sheet_name in DELTA_SYNC_SHEETS:
+            self._seed_from_disk(sheet_name, frame, version)
+            frame = frame.copy()
+        frame.attrs['from_snapshot'] = True
+        submit(self._revalidate, sheet_name, version)
+        return frame
+    
+    @timed_db_method
     def read_data(self, sheet_name):
         """Read all data from a sheet as DataFrame"""
+        if self._is_scoped(sheet_name):
+            worksheet = self.get_worksheet(sheet_name)
+            if not worksheet:
+                return failed_read("not connected")
+            try:
+                return self._read_scoped(sheet_name, worksheet)['frame'].copy()
+            except Exception as e:
+                st.error(f"Error reading data from {sheet_name}: {str(e)}")
+                return failed_read(e)
+        if self.snapshot_cache.enabled and self.spreadsheet_id and sheet_name not in self._revalidated \
+                and sheet_name not in SNAPSHOT_CACHE_EXCLUDE:
+            try:
+                frame = self._read_cold(sheet_name)
+                if frame is not None:
+                    return frame
+            except Exception as e:
+                st.error(f"Error reading data from {sheet_name}: {str(e)}")
+                return failed_read(e)
         worksheet = self.get_worksheet(sheet_name)
         if not worksheet:
-            return pd.DataFrame()
+            return failed_read("not connected")
         try:
-            data = worksheet.get_all_records()
-            return pd.DataFrame(data)
+            if sheet_name in DELTA_SYNC_SHEETS:
+                # Callers may modify the frame; the cached snapshot must stay intact
+                return self._read_delta(sheet_name, worksheet).copy()
+            return self._read_records(worksheet)
         except Exception as e:
             st.error(f"Error reading data from {sheet_name}: {str(e)}")
-            return pd.DataFrame()
+            return failed_read(e)
+    
+    def iter_rows(self, sheet_name, chunk_rows=EXPORT_CHUNK_ROWS):
+        """Yield a sheet as DataFrames of at most chunk_rows rows, one ranged read per chunk, bypassing the caches"""
+        worksheet = self.get_worksheet(sheet_name)
+        if not worksheet:
+            return
+        if self._is_scoped(sheet_name):
+            # The in-scope rows are already in memory after one narrow index read
+            frame = self._read_scoped(sheet_name, worksheet)['frame']
+            for start in range(0, len(frame), chunk_rows):
+                yield frame.iloc[start:start + chunk_rows].reset_index(drop=True)
+            return
+        headers = self.headers(sheet_name)
+        if not headers:
+            return
+        last_column = _column_letter(len(headers))
+        # Bounded by the grid's row count (fresh metadata), so blank rows (skipped) or a blank chunk don't end the export
+        row_count = self._call(self.spreadsheet.worksheet, sheet_name).row_count
+        for start in range(2, row_count + 1, chunk_rows):
+            values = self._call(
+                self.spreadsheet.values_get,
+                f"{_quote(sheet_name)}!A{start}:{last_column}{start + chunk_rows - 1}",
+                priority=PRIORITY_BACKGROUND
+            ).get('values', [])
+            values = [row for row in values if any(cell != '' for cell in row)]
+            if values:
+                yield pd.DataFrame(records_from_values([headers] + values), columns=headers)
     
+    def headers(self, sheet_name):
+        """Header row of a sheet (one narrow read; the cached header when scoped)"""
+        if self._is_scoped(sheet_name):
+            worksheet = self.get_worksheet(sheet_name)
+            return list(self._read_scoped(sheet_name, worksheet)['headers']) if worksheet else []
+        header = self._call(self.spreadsheet.values_get, f"{_quote(sheet_name)}!1:1").get('values', [])
+        return header[0] if header else []
+    
+    @timed_db_method
     def write_data(self, sheet_name, data):
         """Write data to a sheet (data can be list of dicts or DataFrame)"""
+        if self._is_scoped(sheet_name):
+            # Replacing the sheet with the in-scope rows would delete every other location's assets
+            st.error(f"Cannot replace {sheet_name} while limited to some locations")
+            return False
         worksheet = self.get_worksheet(sheet_name)
         if not worksheet:
             return False
         try:
             # Clear existing data
-            worksheet.clear()
+            self._call(worksheet.clear, priority=PRIORITY_BACKGROUND)
             
             # Handle DataFrame
             if isinstance(data, pd.DataFrame):
                 if not data.empty:
                     # Write headers
-                    worksheet.append_row(data.columns.tolist())
+                    self._call(worksheet.append_row, data.columns.tolist(), priority=PRIORITY_BACKGROUND,
+                               idempotent=False)
                     # Write data rows
                     for _, row in data.iterrows():
-                        worksheet.append_row(row.tolist())
+                        self._call(worksheet.append_row, row.tolist(), priority=PRIORITY_BACKGROUND,
+                                   idempotent=False)
             # Handle list of dicts
             elif isinstance(data, list) and len(data) > 0:
                 headers = list(data[0].keys())
-                worksheet.append_row(headers)
+                self._call(worksheet.append_row, headers, priority=PRIORITY_BACKGROUND, idempotent=False)
                 # Write data rows
                 for row in data:
-                    worksheet.append_row([row.get(h, '') for h in headers])
+                    self._call(worksheet.append_row, [row.get(h, '') for h in headers], priority=PRIORITY_BACKGROUND,
+                               idempotent=False)
+            self._record_change(sheet_name, 'reset')
+            self._notify_change(sheet_name)
             return True
         except Exception as e:
             st.error(f"Error writing data to {sheet_name}: {str(e)}")
             return False
     
+    @timed_db_method
     def append_row(self, sheet_name, row_data):
         """Append a single row to a sheet"""
         worksheet = self.get_worksheet(sheet_name)
         if not worksheet:
             return False
         try:
-            # Get headers if sheet is empty
-            existing_data = worksheet.get_all_values()
-            if len(existing_data) == 0:
-                headers = list(row_data.keys())
-                worksheet.append_row(headers)
+            row_data = self._stamp(sheet_name, row_data)
             
-            # Get current headers
-            headers = worksheet.row_values(1)
+            # Get current headers, writing them if the sheet is empty
+            headers = self._call(worksheet.row_values, 1)
             if not headers:
                 headers = list(row_data.keys())
-                worksheet.append_row(headers)
+                self._call(worksheet.append_row, headers, idempotent=False)
+            headers = self._ensure_updated_at_header(sheet_name, worksheet, headers)
             
             # Ensure all headers exist in row_data
             row_values = []
@@ -123,45 +674,98 @@ class GoogleSheetsDB:
                 else:
                     row_values.append('')
             
-            worksheet.append_row(row_values)
+            self._call(worksheet.append_row, row_values, idempotent=False)
+            self._record_change(sheet_name, 'append', after=dict(zip(headers, row_values)))
+            self._notify_change(sheet_name)
             return True
         except Exception as e:
             st.error(f"Error appending row to {sheet_name}: {str(e)}")
             return False
     
+    def _stamp(self, sheet_name, row_data):
+        """Add an Updated At stamp so delta sync can tell which rows changed"""
+        if sheet_name in DELTA_SYNC_SHEETS:
+            return dict(row_data, **{UPDATED_AT_COLUMN: str(datetime.now())})
+        return row_data
+    
+    def _ensure_updated_at_header(self, sheet_name, worksheet, headers):
+        if sheet_name in DELTA_SYNC_SHEETS and headers and UPDATED_AT_COLUMN not in headers:
+            headers = headers + [UPDATED_AT_COLUMN]
+            self._call(worksheet.update, 'A1', [headers])
+        return headers
+    
+    @timed_db_method
     def update_row(self, sheet_name, row_index, row_data):
         """Update a row in a sheet"""
         worksheet = self.get_worksheet(sheet_name)
         if not worksheet:
             return False
         try:
-            headers = worksheet.row_values(1)
+            row_index = self._sheet_row(sheet_name, row_index)
+            row_data = self._stamp(sheet_name, row_data)
+            headers = self._call(worksheet.row_values, 1)
+            headers = self._ensure_updated_at_header(sheet_name, worksheet, headers)
             row_values = [row_data.get(h, '') for h in headers]
-            worksheet.update(f'A{row_index+1}', [row_values])
+            before = self._snapshot_row(sheet_name, row_index - 1)
+            self._call(worksheet.update, f'A{row_index+1}', [row_values])
+            self._record_change(sheet_name, 'update', row_index - 1, before, dict(zip(headers, row_values)))
+            self._notify_change(sheet_name)
             return True
         except Exception as e:
             st.error(f"Error updating row in {sheet_name}: {str(e)}")
             return False
     
+    @timed_db_method
     def delete_row(self, sheet_name, row_index):
         """Delete a row from a sheet"""
         worksheet = self.get_worksheet(sheet_name)
         if not worksheet:
             return False
         try:
-            worksheet.delete_rows(row_index + 1)
+            row_index = self._sheet_row(sheet_name, row_index)
+            before = self._snapshot_row(sheet_name, row_index - 1)
+            self._call(worksheet.delete_rows, row_index + 1, idempotent=False)
+            self._record_change(sheet_name, 'delete', row_index - 1, before)
+            self._notify_change(sheet_name)
             return True
         except Exception as e:
             st.error(f"Error deleting row from {sheet_name}: {str(e)}")
             return False
     
+    def recorded_locations(self, sheet_name, keys):
+        """{first-column value: Location} for keys anywhere in the sheet, outside the scope too
+        (scoped reads already hold both columns of every row from their narrow index read)"""
+        keys = {str(key) for key in keys}
+        worksheet = self.get_worksheet(sheet_name)
+        if not worksheet or not keys:
+            return {}
+        try:
+            if self._is_scoped(sheet_name):
+                index = self._read_scoped(sheet_name, worksheet)['index']
+                pairs = zip(index.get('first', []), index.get(LOCATION_SCOPE_COLUMN, []))
+            else:
+                frame = self.read_data(sheet_name)
+                if frame.empty or LOCATION_SCOPE_COLUMN not in frame.columns:
+                    return {}
+                pairs = zip(frame.iloc[:, 0].astype(str), frame[LOCATION_SCOPE_COLUMN].astype(str))
+            return {key: location for key, location in pairs if key in keys}
+        except Exception as e:
+            st.error(f"Error reading locations from {sheet_name}: {str(e)}")
+            return {}
+    
+    @timed_db_method
     def find_row(self, sheet_name, column_name, value):
         """Find row index by column value"""
         worksheet = self.get_worksheet(sheet_name)
         if not worksheet:
             return -1
         try:
-            data = worksheet.get_all_records()
+            if self._is_scoped(sheet_name):
+                data = self._read_scoped(sheet_name, worksheet)['frame'].to_dict('records')
+            elif sheet_name in DELTA_SYNC_SHEETS:
+                data = self._read_delta(sheet_name, worksheet).to_dict('records')
+            else:
+                data = self._call(worksheet.get_all_records)
             for idx, row in enumerate(data):
                 if str(row.get(column_name, '')).lower() == str(value).lower():
                     return idx + 1  # +1 because row 1 is header
@@ -0,0 +1,188 @@
+"""
+Point-in-Time Inventory Module
+
+Rebuilds where every asset was on any date from the movement log. Movements are
+sorted once by date into NumPy arrays, and the last-movement position of every
+asset is snapshotted at each month boundary, so an as-of query only replays the
+movements between the nearest snapshot and the requested date.
+"""
+import numpy as np
+import pandas as pd
+import streamlit as st
+from movement_log import get_movement_log
+from config import SHEETS
+
+SNAPSHOT_FREQUENCY = 'MS'  # month start
+
+
+def _last_positions(asset_ids, positions):
+    """For each asset in `asset_ids`, the position of its last occurrence"""
+    reversed_ids = asset_ids[::-1]
+    unique_ids, first_in_reversed = np.unique(reversed_ids, return_index=True)
+    return unique_ids, positions[::-1][first_in_reversed]
+
+
+class InventoryHistory:
+    """Vectorized as-of location queries over the movement log"""
+
+    def __init__(self, movements_df, assets_df=None):
+        movements_df = movements_df if movements_df is not None else pd.DataFrame()
+        dates = pd.to_datetime(movements_df.get('Date', pd.Series(dtype=str)), errors='coerce')
+        created = pd.to_datetime(movements_df.get('Created At', pd.Series(dtype=str)), errors='coerce')
+        valid = dates.notna().to_numpy()
+        movements_df = movements_df[valid]
+        dates = dates[valid].to_numpy(dtype='datetime64[ns]')
+        created = created[valid].fillna(pd.Timestamp.min).to_numpy(dtype='datetime64[ns]')
+
+        # Factorize asset codes and locations once; all further work is on integer arrays
+        asset_codes = pd.Series(movements_df.get('Asset Code', pd.Series(dtype=str)), dtype=str)
+        if assets_df is not None and not assets_df.empty and 'Asset Code' in assets_df.columns:
+            asset_codes = pd.concat([asset_codes, assets_df['Asset Code'].astype(str)], ignore_index=True)
+        asset_ids, self.asset_codes = pd.factorize(asset_codes)
+        asset_ids = asset_ids[:len(movements_df)]
+        asset_locations = pd.Series(dtype=str)
+        if assets_df is not None and not assets_df.empty and 'Location' in assets_df.columns:
+            asset_locations = assets_df['Location'].astype(str)
+        from_ids, to_ids, self.locations = self._factorize_locations(movements_df, asset_locations)
+
+        # Global date order (creation time breaks ties between moves on the same day)
+        order = np.lexsort((np.arange(len(dates)), created, dates))
+        self.dates = dates[order]
+        self.asset_ids = asset_ids[order].astype(np.int64)
+        self.from_ids = from_ids[order]
+        self.to_ids = to_ids[order]
+
+        n_assets = len(self.asset_codes)
+        # Where each asset was before its first recorded move
+        self.initial_location = np.full(n_assets, -1, dtype=np.int64)
+        first_ids, first_positions = np.unique(self.asset_ids, return_index=True)
+        self.initial_location[first_ids] = self.from_ids[first_positions]
+
+        # Current location and creation date for assets that never moved
+        self.current_location = np.full(n_assets, -1, dtype=np.int64)
+        self.created_at = np.full(n_assets, np.datetime64('NaT'), dtype='datetime64[ns]')
+        if assets_df is not None and not assets_df.empty and 'Asset Code' in assets_df.columns:
+            ids = self.asset_codes.get_indexer(assets_df['Asset Code'].astype(str))
+            if 'Location' in assets_df.columns:
+                self.current_location[ids] = self.locations.get_indexer(assets_df['Location'].astype(str))
+            if 'Created At' in assets_df.columns:
+                self.created_at[ids] = pd.to_datetime(assets_df['Created At'], errors='coerce').to_numpy(dtype='datetime64[ns]')
+        self.known_assets = np.zeros(n_assets, dtype=bool)
+        if assets_df is not None and not assets_df.empty and 'Asset Code' in assets_df.columns:
+            self.known_assets[self.asset_codes.get_indexer(assets_df['Asset Code'].astype(str))] = True
+
+        self._build_snapshots()
+
+    def _factorize_locations(self, movements_df, asset_locations):
+        from_locations = pd.Series(movements_df.get('From Location', pd.Series(dtype=str)), dtype=str)
+        to_locations = pd.Series(movements_df.get('To Location', pd.Series(dtype=str)), dtype=str)
+        n = len(from_locations)
+        ids, locations = pd.factorize(pd.concat([from_locations, to_locations, asset_locations], ignore_index=True))
+        return ids[:n].astype(np.int64), ids[n:2 * n].astype(np.int64), pd.Index(locations)
+
+    def _build_snapshots(self):
+        """Record each asset's last-movement position at every month boundary"""
+        n_assets = len(self.asset_codes)
+        dtype = np.int32 if len(self.dates) < np.iinfo(np.int32).max else np.int64
+        last = np.full(n_assets, -1, dtype=dtype)
+        self.snapshot_dates = []
+        self.snapshot_ends = []
+        self.snapshots = []
+        if len(self.dates) == 0:
+            return
+        boundaries = pd.date_range(
+            pd.Timestamp(self.dates[0]).to_period('M').to_timestamp(),
+            pd.Timestamp(self.dates[-1]) + pd.offsets.MonthBegin(1),
+            freq=SNAPSHOT_FREQUENCY
+        ).to_numpy(dtype='datetime64[ns]')
+        ends = np.searchsorted(self.dates, boundaries, side='left')
+        start = 0
+        for boundary, end in zip(boundaries, ends):
+            if end > start:
+                ids, positions = _last_positions(self.asset_ids[start:end], np.arange(start, end))
+                last = last.copy()
+                last[ids] = positions
+            # Snapshot holds every movement strictly before the boundary
+            self.snapshot_dates.append(boundary)
+            self.snapshot_ends.append(end)
+            self.snapshots.append(last)
+            start = end
+        self.snapshot_dates = np.array(self.snapshot_dates, dtype='datetime64[ns]')
+
+    def _last_positions_at(self, date):
+        """Position of each asset's last movement on or before `date` (-1 if none)"""
+        cutoff = np.datetime64(pd.Timestamp(date).normalize() + pd.Timedelta(days=1), 'ns')
+        end = np.searchsorted(self.dates, cutoff, side='left')
+        if len(self.snapshots) == 0:
+            return np.full(len(self.asset_codes), -1, dtype=np.int64)
+        slot = np.searchsorted(self.snapshot_dates, cutoff, side='right') - 1
+        if slot < 0:
+            last = np.full(len(self.asset_codes), -1, dtype=np.int64)
+            start = 0
+        else:
+            last = self.snapshots[slot].astype(np.int64)
+            start = self.snapshot_ends[slot]
+        if end > start:
+            ids, positions = _last_positions(self.asset_ids[start:end], np.arange(start, end))
+            last[ids] = positions
+        return last
+
+    def _locations_at(self, date):
+        last = self._last_positions_at(date)
+        moved = last >= 0
+        location_ids = np.where(moved, self.to_ids[np.where(moved, last, 0)] if len(self.to_ids) else -1,
+                                self.initial_location)
+        # Assets that never moved stay where the Assets sheet says they are
+        location_ids = np.where(location_ids >= 0, location_ids, self.current_location)
+        cutoff = np.datetime64(pd.Timestamp(date).normalize() + pd.Timedelta(days=1), 'ns')
+        # An asset exists on `date` if it was created before it or had already moved by then
+        exists = moved | np.isnat(self.created_at) | (self.created_at < cutoff)
+        exists &= self.known_assets | moved
+        return location_ids, exists
+
+    def inventory_at(self, date):
+        """Location of every asset at the end of `date`"""
+        location_ids, exists = self._locations_at(date)
+        names = np.where(location_ids >= 0, np.asarray(self.locations, dtype=object)[np.maximum(location_ids, 0)], '') \
+            if len(self.locations) else np.full(len(location_ids), '', dtype=object)
+        return pd.DataFrame({
+            'Asset Code': np.asarray(self.asset_codes, dtype=object)[exists],
+            'Location': names[exists]
+        })
+
+    def location_at(self, asset_code, date):
+        """Location of one asset at the end of `date` ('' if unknown)"""
+        inventory = self.inventory_at(date)
+        match = inventory.loc[inventory['Asset Code'] == str(asset_code), 'Location']
+        return match.iloc[0] if not match.empty else ''
+
+    def assets_at_location(self, location, date):
+        """Asset codes at `location` at the end of `date`"""
+        inventory = self.inventory_at(date)
+        return inventory[inventory['Location'] == location].reset_index(drop=True)
+
+    def intervals(self):
+        """Per-asset location intervals: Valid From inclusive, Valid To exclusive (NaT = still there)"""
+        order = np.lexsort((np.arange(len(self.asset_ids)), self.asset_ids))
+        asset_ids = self.asset_ids[order]
+        valid_from = self.dates[order]
+        same_asset_next = np.r_[asset_ids[1:] == asset_ids[:-1], False]
+        valid_to = np.where(same_asset_next, np.roll(valid_from, -1), np.datetime64('NaT'))
+        return pd.DataFrame({
+            'Asset Code': np.asarray(self.asset_codes, dtype=object)[asset_ids],
+            'Location': np.asarray(self.locations, dtype=object)[self.to_ids[order]] if len(order) else [],
+            'Valid From': valid_from,
+            'Valid To': valid_to
+        })
+
+
+def get_inventory_history(db):
+    """Return the session's InventoryHistory, rebuilding it when the movement log grows"""
+    movement_log = get_movement_log(db)
+    count = movement_log.count()
+    cached = st.session_state.get('inventory_history')
+    if cached is None or cached[0] != (db.spreadsheet_id, count):
+        history = InventoryHistory(movement_log.all_movements(), db.read_data(SHEETS['assets']))
+        st.session_state.inventory_history = ((db.spreadsheet_id, count), history)
+        return history
+    return cached[1]
@@ -0,0 +1,214 @@
+"""
+Background Jobs Module
+
+Lightweight in-process scheduler for precomputation. Jobs run on one worker
+thread, periodically and whenever a sheet they depend on is written, against a
+database connection of their own. Results are published per spreadsheet with
+the Drive version of the data they were built from, so a page render only
+reuses a result that matches the data it has just read.
+"""
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+
+from config import JOB_REFRESH_INTERVAL
+from google_sheets import GoogleSheetsDB
+from metrics import JOB_SECONDS, record_cache
+
+
+class Job:
+    """A named precomputation: fn(db) returns the value to publish"""
+
+    def __init__(self, name, fn, sheets=(), interval=JOB_REFRESH_INTERVAL):
+        self.name = name
+        self.fn = fn
+        self.sheets = set(sheets)
+        self.interval = interval
+
+
+class JobScheduler:
+    """Runs registered jobs for every watched spreadsheet on a background thread"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._targets = {}  # spreadsheet id -> database factory
+        self._dbs = {}
+        self._queue = []  # (due, seq, spreadsheet id, job name)
+        self._due = {}  # (spreadsheet id, job name) -> due time of the live queue entry
+        self._seq = itertools.count()
+        self._results = {}  # (spreadsheet id, job name) -> (version, value)
+        self._stats = {}
+        self._history = deque(maxlen=200)
+        self._running = None
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def register(self, job):
+        """Add a job (re-registering a name replaces its definition without queueing a run)"""
+        with self._cond:
+            known = job.name in self._jobs
+            self._jobs[job.name] = job
+            if known:
+                return
+            for spreadsheet_id in self._targets:
+                self._enqueue(spreadsheet_id, job.name, time.monotonic())
+
+    def watch(self, spreadsheet_id, db_factory):
+        """Start running jobs for a spreadsheet; db_factory() returns a new, unconnected database"""
+        with self._cond:
+            if not spreadsheet_id or spreadsheet_id in self._targets:
+                return
+            self._targets[spreadsheet_id] = db_factory
+            for name in self._jobs:
+                self._enqueue(spreadsheet_id, name, time.monotonic())
+            self._start()
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._work, name='job-scheduler', daemon=True)
+            self._thread.start()
+
+    def _enqueue(self, spreadsheet_id, name, due):
+        """Queue a run, keeping only the earliest pending run of each job"""
+        key = (spreadsheet_id, name)
+        if key in self._due and self._due[key] <= due:
+            return
+        self._due[key] = due
+        heapq.heappush(self._queue, (due, next(self._seq), spreadsheet_id, name))
+        self._cond.notify()
+
+    def trigger(self, spreadsheet_id, name):
+        """Run a job as soon as possible"""
+        with self._cond:
+            if spreadsheet_id in self._targets and name in self._jobs:
+                self._enqueue(spreadsheet_id, name, time.monotonic())
+
+    def notify_change(self, spreadsheet_id, sheet_name):
+        """Re-run the jobs that depend on a sheet that was just written"""
+        with self._cond:
+            # Writes to a shard arrive with the shard's ID; refresh every spreadsheet built on it
+            targets = [spreadsheet_id] if spreadsheet_id in self._targets else list(self._targets)
+            for target in targets:
+                for job in self._jobs.values():
+                    if sheet_name in job.sheets:
+                        self._enqueue(target, job.name, time.monotonic())
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while True:
+                    # Drop entries superseded by an earlier run of the same job
+                    while self._queue and self._due.get(self._queue[0][2:]) != self._queue[0][0]:
+                        heapq.heappop(self._queue)
+                    if self._queue and self._queue[0][0] <= time.monotonic():
+                        due, _, spreadsheet_id, name = heapq.heappop(self._queue)
+                        del self._due[(spreadsheet_id, name)]
+                        break
+                    self._cond.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                job = self._jobs[name]
+                self._running = (spreadsheet_id, name)
+            self._run(spreadsheet_id, job)
+            with self._cond:
+                self._running = None
+                if job.interval:
+                    self._enqueue(spreadsheet_id, name, time.monotonic() + job.interval)
+
+    def _db(self, spreadsheet_id):
+        if spreadsheet_id not in self._dbs:
+            db = self._targets[spreadsheet_id]()
+            db.set_spreadsheet(spreadsheet_id)
+            self._dbs[spreadsheet_id] = db
+        return self._dbs[spreadsheet_id]
+
+    def _run(self, spreadsheet_id, job):
+        started = time.perf_counter()
+        error = ''
+        try:
+            db = self._db(spreadsheet_id)
+            value = job.fn(db)
+            # Versions are read after the job so they describe the data it actually used
+            with self._cond:
+                self._results[(spreadsheet_id, job.name)] = (db.last_version(), value)
+        except Exception:
+            error = traceback.format_exc(limit=3)
+        duration = time.perf_counter() - started
+        JOB_SECONDS.observe(duration, job=job.name)
+        with self._cond:
+            stats = self._stats.setdefault(job.name, {'runs': 0, 'errors': 0, 'total_seconds': 0.0})
+            stats['runs'] += 1
+            stats['errors'] += 1 if error else 0
+            stats['total_seconds'] += duration
+            stats.update({'last_seconds': duration, 'last_run': datetime.now(), 'last_error': error})
+            self._history.append({'Job': job.name, 'Spreadsheet': spreadsheet_id, 'Started': datetime.now(),
+                                  'Seconds': round(duration, 4),
+                                  'Error': error.strip().split('\n')[-1] if error else ''})
+
+    def result(self, db, name):
+        """Published value of a job if it was built from the same data version as db's last read"""
+        version = db.last_version()
+        with self._cond:
+            entry = self._results.get((db.spreadsheet_id, name))
+        hit = entry is not None and version is not None and entry[0] == version
+        record_cache('precomputed', hit)
+        return entry[1] if hit else None
+
+    def latest(self, db, name):
+        """Last published value of a job, whatever data version it was built from (None before its first run)"""
+        with self._cond:
+            entry = self._results.get((db.spreadsheet_id, name))
+        return entry[1] if entry is not None else None
+
+    def queue_depth(self):
+        """Runs that are due now and waiting for the worker"""
+        now = time.monotonic()
+        with self._cond:
+            return sum(1 for due in self._due.values() if due <= now)
+
+    def stats(self):
+        """One row per job: runs, errors, durations, next run"""
+        now = time.monotonic()
+        with self._cond:
+            next_due = {}
+            for (_, name), due in self._due.items():
+                next_due[name] = min(next_due.get(name, due), due)
+            running = self._running
+            jobs = list(self._jobs.items())
+            all_stats = {name: dict(stats) for name, stats in self._stats.items()}
+        rows = []
+        for name, job in jobs:
+            stats = all_stats.get(name, {})
+            runs = stats.get('runs', 0)
+            rows.append({
+                'Job': name,
+                'Triggers': ', '.join(sorted(job.sheets)) or '-',
+                'Runs': runs,
+                'Errors': stats.get('errors', 0),
+                'Last Seconds': round(stats.get('last_seconds', 0.0), 4),
+                'Mean Seconds': round(stats.get('total_seconds', 0.0) / runs, 4) if runs else 0.0,
+                'Last Run': stats.get('last_run'),
+                'Next Run In': round(max(next_due[name] - now, 0), 1) if name in next_due else None,
+                'Running': running is not None and running[1] == name,
+            })
+        return rows
+
+    def history(self):
+        with self._cond:
+            return list(self._history)
+
+
+_job_scheduler = None
+_job_scheduler_lock = threading.Lock()
+
+
+def get_job_scheduler():
+    """Process-wide job scheduler; writes through GoogleSheetsDB trigger dependent jobs"""
+    global _job_scheduler
+    with _job_scheduler_lock:
+        if _job_scheduler is None:
+            _job_scheduler = JobScheduler()
+            GoogleSheetsDB.change_listeners.append(_job_scheduler.notify_change)
+        return _job_scheduler
@@ -0,0 +1,36 @@
+"""
+Lazy Imports Module
+
+Per-page modules (the dashboard and plotly, barcode rendering, export, attachments)
+are imported on first use instead of at app start. Each first import is timed into
+metrics.IMPORT_SECONDS against the page that needed it.
+"""
+import importlib
+import sys
+import threading
+import time
+
+from metrics import IMPORT_SECONDS
+
+_imported = set()
+_imported_lock = threading.Lock()
+
+
+def record_import(module_name, page, seconds):
+    """Record a module's import time once per process (app.py re-runs on every interaction)"""
+    with _imported_lock:
+        if module_name in _imported:
+            return
+        _imported.add(module_name)
+    IMPORT_SECONDS.observe(seconds, module=module_name, page=page)
+
+
+def lazy_import(module_name, page=''):
+    """Import a module on first use, recording the import time against the page that needed it"""
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    record_import(module_name, page, time.perf_counter() - started)
+    return module
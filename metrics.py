@@ -0,0 +1,275 @@
+"""
+Instrumentation Module
+
+In-process counters and histograms for Sheets calls, storage methods, caches and
+page renders, rendered in the Prometheus text exposition format.
+"""
+import functools
+import inspect
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import METRICS_FILE, METRICS_HOST, METRICS_PORT
+from rate_limiter import get_scheduler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+class Counter:
+    """Monotonic counter with labels"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self):
+        """Return {label values: count}"""
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = []
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of a block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _quantile(self, series, q):
+        """Estimate a quantile from bucket counts (upper bucket bound)"""
+        target = q * series['count']
+        for bound, count in zip(self.buckets, series['buckets']):
+            if count >= target:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        """Return one dict per label set with count, total, mean and estimated p50/p95"""
+        with self._lock:
+            items = [(key, {'buckets': list(s['buckets']), 'sum': s['sum'], 'count': s['count']})
+                     for key, s in self._series.items()]
+        rows = []
+        for key, series in sorted(items):
+            row = dict(zip(self.labelnames, key))
+            row.update({
+                'count': series['count'],
+                'total_seconds': round(series['sum'], 4),
+                'mean_seconds': round(series['sum'] / series['count'], 4) if series['count'] else 0.0,
+                'p50_seconds': self._quantile(series, 0.5),
+                'p95_seconds': self._quantile(series, 0.95),
+            })
+            rows.append(row)
+        return rows
+
+    def render(self):
+        lines = []
+        with self._lock:
+            items = sorted((key, dict(s, buckets=list(s['buckets']))) for key, s in self._series.items())
+        for key, series in items:
+            for bound, count in zip(self.buckets, series['buckets']):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series['count']}")
+        return lines
+
+
+SHEETS_CALL_SECONDS = Histogram(
+    'assettracker_sheets_call_seconds', 'Latency of Sheets API calls including quota waits', ['call'])
+DB_METHOD_SECONDS = Histogram(
+    'assettracker_db_method_seconds', 'Latency of storage layer methods', ['method', 'sheet'])
+SHEETS_BYTES = Counter(
+    'assettracker_sheets_bytes_total', 'Bytes exchanged with the Google APIs', ['direction'])
+CACHE_REQUESTS = Counter(
+    'assettracker_cache_requests_total', 'Cache lookups by cache and result (hit/miss)', ['cache', 'result'])
+PAGE_RENDER_SECONDS = Histogram(
+    'assettracker_page_render_seconds', 'Time to render each page of the app', ['page'])
+JOB_SECONDS = Histogram(
+    'assettracker_job_seconds', 'Duration of background precomputation jobs', ['job'])
+IMPORT_SECONDS = Histogram(
+    'assettracker_import_seconds', 'First-import time of modules, by the page that needed them', ['module', 'page'])
+
+
+def timed_db_method(fn):
+    """Time a storage method, labelled by method name and, for methods taking sheet_name first, the sheet"""
+    # Other first arguments (a spreadsheet ID, say) would give the histogram one series per value
+    takes_sheet = list(inspect.signature(fn).parameters)[1:2] == ['sheet_name']
+
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        sheet = (args[0] if args else kwargs.get('sheet_name', '')) if takes_sheet else ''
+        with DB_METHOD_SECONDS.time(method=fn.__name__, sheet=sheet):
+            return fn(self, *args, **kwargs)
+    return wrapper
+
+
+def record_cache(cache, hit, count=1):
+    """Count cache hits or misses"""
+    CACHE_REQUESTS.inc(count, cache=cache, result='hit' if hit else 'miss')
+
+
+def cache_hit_ratios():
+    """Return {cache: hit ratio}"""
+    totals = {}
+    for (cache, result), value in CACHE_REQUESTS.values().items():
+        hits, total = totals.get(cache, (0, 0))
+        totals[cache] = (hits + (value if result == 'hit' else 0), total + value)
+    return {cache: (hits / total if total else 0.0) for cache, (hits, total) in totals.items()}
+
+
+def record_response_bytes(response, *args, **kwargs):
+    """requests response hook counting bytes sent and received"""
+    body = getattr(response.request, 'body', None) or b''
+    SHEETS_BYTES.inc(len(body), direction='sent')
+    SHEETS_BYTES.inc(len(response.content or b''), direction='received')
+    return response
+
+
+def _scheduler_lines():
+    snapshot = get_scheduler().get_metrics()
+    lines = []
+    for key in ('calls', 'throttled', 'retried', 'failed'):
+        name = f'assettracker_scheduler_{key}_total'
+        lines += [f'# HELP {name} Sheets scheduler {key} calls', f'# TYPE {name} counter', f'{name} {snapshot[key]}']
+    lines += ['# HELP assettracker_scheduler_throttled_seconds_total Time calls spent waiting for quota',
+              '# TYPE assettracker_scheduler_throttled_seconds_total counter',
+              f"assettracker_scheduler_throttled_seconds_total {snapshot['throttled_seconds']}",
+              '# HELP assettracker_scheduler_queued Calls waiting for quota',
+              '# TYPE assettracker_scheduler_queued gauge',
+              f"assettracker_scheduler_queued {snapshot['queued']}"]
+    return lines
+
+
+def render_prometheus():
+    """Render all metrics in the Prometheus text format"""
+    lines = []
+    with _registry_lock:
+        metrics = list(_registry)
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    lines.extend(_scheduler_lines())
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics_file(path=METRICS_FILE):
+    """Write the Prometheus text to a file (for node_exporter's textfile collector).
+
+    Called from a finally block after every page render, so it never raises: a write
+    error is logged instead of replacing the page's own exception.
+    """
+    if not path:
+        return False
+    temp_path = None
+    try:
+        # One temp file per call: concurrent sessions must not write into each other's file
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(path)),
+                                         prefix='.metrics-', suffix='.tmp', delete=False) as f:
+            temp_path = f.name
+            f.write(render_prometheus())
+        # Temp files are private; the collector may run as another user
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+        return True
+    except OSError:
+        logger.warning("Could not write metrics file %s", path, exc_info=True)
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Serve /metrics on a background thread once per process (on localhost unless host says otherwise)"""
+    global _server
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            except OSError:
+                # Another Streamlit process already owns the port
+                return None
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server
@@ -0,0 +1,484 @@
+"""
+Asset Movement Event Log Module
+
+Movements are stored append-only in monthly partition sheets (AssetMovements_YYYY_MM).
+Every movement also appends one row to the AssetMovementIndex sheet in the same
+batch_update, so the n-th index row of a partition always points at the n-th data
+row of that partition. Queries resolve rows through the in-memory index and fetch
+only those rows with a single ranged batch read. On a connection limited to some
+locations (site managers), queries only return, and only fetch, the movements
+of the assets currently at those locations.
+"""
+import threading
+import pandas as pd
+import streamlit as st
+from collections import Counter
+from datetime import datetime
+from config import (
+    SHEETS, MOVEMENT_COLUMNS, MOVEMENT_INDEX_COLUMNS, MOVEMENT_PARTITION_FORMAT, UPDATED_AT_COLUMN, EXPORT_CHUNK_ROWS
+)
+from google_sheets import read_failed
+from rate_limiter import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from metrics import record_cache
+from sheet_utils import rowcol_to_a1
+
+FETCH_RANGES_PER_CALL = 100
+# Legacy movements copied per batch_update (keeps each request well under the API's payload limit)
+MIGRATE_ROWS_PER_CALL = 5000
+
+
+def partition_for(date_value):
+    """Return the partition sheet name for a movement date"""
+    date = pd.to_datetime(date_value, errors='coerce')
+    if pd.isna(date):
+        date = datetime.now()
+    return date.strftime(MOVEMENT_PARTITION_FORMAT)
+
+
+def _quote(sheet_name):
+    return "'" + sheet_name.replace("'", "''") + "'"
+
+
+def _cell(value):
+    return {'userEnteredValue': {'stringValue': '' if value is None else str(value)}}
+
+
+def _row_runs(rows):
+    """Collapse sorted row numbers into (first, last) runs of consecutive rows"""
+    runs = []
+    for row in rows:
+        if runs and row == runs[-1][1] + 1:
+            runs[-1][1] = row
+        else:
+            runs.append([row, row])
+    return runs
+
+
+class _LogCache:
+    """Index and rows of one spreadsheet's log, shared by every session of the process"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.index = pd.DataFrame(columns=MOVEMENT_INDEX_COLUMNS + ['Row'])
+        self.partition_sizes = {}
+        self.sheet_ids = {}
+        self.rows = {}  # (partition, row) -> values; rows never change once written
+        self.partition_frames = {}
+
+
+_caches = {}  # spreadsheet id -> _LogCache
+_caches_lock = threading.Lock()
+
+
+def _log_cache(spreadsheet_id):
+    with _caches_lock:
+        return _caches.setdefault(spreadsheet_id, _LogCache())
+
+
+def _shared(name):
+    """Attribute stored on the process-wide _LogCache instead of the session's MovementLog"""
+    return property(lambda self: getattr(self._cache, name), lambda self, value: setattr(self._cache, name, value))
+
+
+class MovementLog:
+    """Append-only, month-partitioned movement log with an Asset Code and date index.
+
+    The index and fetched rows are kept per spreadsheet for the whole process, so one
+    session's refresh() serves every other session; each MovementLog only binds them to
+    a session's connection (and its location scope).
+    """
+    _index = _shared('index')
+    _partition_sizes = _shared('partition_sizes')
+    _sheet_ids = _shared('sheet_ids')
+    _rows = _shared('rows')
+    _partition_frames = _shared('partition_frames')
+
+    def __init__(self, db):
+        self.db = db
+        self.spreadsheet_id = db.spreadsheet_id
+        self._cache = _log_cache(self.spreadsheet_id)
+        self._asset_columns = None
+
+    def _load_sheet_ids(self):
+        worksheets = self.db._call(self.db.spreadsheet.worksheets)
+        self._sheet_ids = {ws.title: ws.id for ws in worksheets}
+
+    def _ensure_sheet(self, sheet_name, headers):
+        """Return the sheetId of a log sheet, creating it with a header row if missing"""
+        with self._cache.lock:
+            return self._ensure_sheet_locked(sheet_name, headers)
+
+    def _ensure_sheet_locked(self, sheet_name, headers):
+        if sheet_name not in self._sheet_ids:
+            self._load_sheet_ids()
+        if sheet_name not in self._sheet_ids:
+            worksheet = self.db._call(self.db.spreadsheet.add_worksheet, title=sheet_name,
+                                      rows=1, cols=len(headers), priority=PRIORITY_BACKGROUND, idempotent=False)
+            self.db._call(worksheet.update, 'A1', [headers], priority=PRIORITY_BACKGROUND)
+            self._sheet_ids[sheet_name] = worksheet.id
+        return self._sheet_ids[sheet_name]
+
+    def refresh(self):
+        """Pull index rows appended since the last refresh by any session (one ranged read)"""
+        with self._cache.lock:
+            self._refresh_locked()
+
+    def _refresh_locked(self):
+        index_sheet = SHEETS['asset_movement_index']
+        if index_sheet not in self._sheet_ids:
+            self._load_sheet_ids()
+            if index_sheet not in self._sheet_ids:
+                return
+        start = len(self._index) + 2  # +1 for header, +1 for next row
+        result = self.db._call(
+            self.db.spreadsheet.values_get,
+            f"{_quote(index_sheet)}!A{start}:{chr(ord('A') + len(MOVEMENT_INDEX_COLUMNS) - 1)}"
+        )
+        values = result.get('values', [])
+        if not values:
+            return
+        width = len(MOVEMENT_INDEX_COLUMNS)
+        new = pd.DataFrame([(list(v) + [''] * width)[:width] for v in values], columns=MOVEMENT_INDEX_COLUMNS)
+        # Row in the partition sheet: partition size so far + position within this batch + header
+        offsets = new['Partition'].map(self._partition_sizes).fillna(0).astype(int)
+        new['Row'] = offsets + new.groupby('Partition').cumcount() + 2
+        for partition, count in new['Partition'].value_counts().items():
+            self._partition_sizes[partition] = self._partition_sizes.get(partition, 0) + int(count)
+        self._index = new if self._index.empty else pd.concat([self._index, new], ignore_index=True)
+
+    def build_append_requests(self, movements):
+        """Return batch_update requests that append movements to their partitions and the index"""
+        index_id = self._ensure_sheet(SHEETS['asset_movement_index'], MOVEMENT_INDEX_COLUMNS)
+        by_partition = {}
+        index_rows = []
+        for movement in movements:
+            partition = partition_for(movement.get('Date'))
+            by_partition.setdefault(partition, []).append(
+                {'values': [_cell(movement.get(c, '')) for c in MOVEMENT_COLUMNS]}
+            )
+            index_rows.append({'values': [_cell(movement.get('Asset Code', '')),
+                                          _cell(movement.get('Date', '')),
+                                          _cell(partition)]})
+        requests = []
+        for partition, rows in by_partition.items():
+            sheet_id = self._ensure_sheet(partition, MOVEMENT_COLUMNS)
+            requests.append({'appendCells': {'sheetId': sheet_id, 'rows': rows, 'fields': 'userEnteredValue'}})
+        requests.append({'appendCells': {'sheetId': index_id, 'rows': index_rows, 'fields': 'userEnteredValue'}})
+        return requests
+
+    def append_many(self, movements, priority=PRIORITY_INTERACTIVE):
+        """Append movements atomically (one batch_update for data and index)"""
+        if not movements:
+            return True
+        try:
+            requests = self.build_append_requests(movements)
+            # appendCells adds rows again if repeated, so only a quota rejection is retried
+            self.db._call(self.db.spreadsheet.batch_update, {'requests': requests}, priority=priority,
+                          idempotent=False)
+            return True
+        except Exception as e:
+            st.error(f"Error recording asset movement: {str(e)}")
+            return False
+
+    def append(self, movement):
+        """Append a single movement"""
+        return self.append_many([movement])
+
+    def _asset_locations(self):
+        """Fresh read of the Assets Asset Code and Location columns (header row cached)"""
+        assets_sheet = SHEETS['assets']
+        for attempt in range(2):
+            if self._asset_columns is None or attempt > 0:
+                result = self.db._call(self.db.spreadsheet.values_get, f"{_quote(assets_sheet)}!1:1")
+                headers = result.get('values', [[]])[0]
+                if 'Asset Code' not in headers or 'Location' not in headers:
+                    raise ValueError("Assets sheet needs 'Asset Code' and 'Location' columns")
+                updated_col = headers.index(UPDATED_AT_COLUMN) + 1 if UPDATED_AT_COLUMN in headers else None
+                self._asset_columns = (headers.index('Asset Code') + 1, headers.index('Location') + 1, updated_col)
+            code_col, location_col, updated_col = self._asset_columns
+            ranges = [f"{_quote(assets_sheet)}!{rowcol_to_a1(1, col)[:-1]}:{rowcol_to_a1(1, col)[:-1]}"
+                      for col in (code_col, location_col)]
+            result = self.db._call(self.db.spreadsheet.values_batch_get, ranges)
+            codes, locations = [
+                [row[0] if row else '' for row in value_range.get('values', [])]
+                for value_range in result.get('valueRanges', [])
+            ]
+            # Header moved since it was cached: reload it once
+            if codes and codes[0] == 'Asset Code' and locations and locations[0] == 'Location':
+                break
+        locations += [''] * (len(codes) - len(locations))
+        rows = {code: (row, locations[row - 1]) for row, code in enumerate(codes, start=1) if row > 1}
+        return rows, location_col, updated_col
+
+    def move_assets(self, asset_codes, to_location, reason='', date=None, moved_by='', expected_locations=None,
+                    from_locations=None):
+        """Move assets to one location: movement log rows and Assets.Location in a single batch_update.
+
+        Current locations are re-read right before the write; if an asset is missing, is no longer
+        where `expected_locations` says it is, or is outside `from_locations` (a scoped user's
+        locations), nothing is written. Returns (success, message).
+        """
+        if not asset_codes:
+            return False, "No assets selected"
+        try:
+            if SHEETS['assets'] not in self._sheet_ids:
+                self._load_sheet_ids()
+            assets_id = self._sheet_ids[SHEETS['assets']]
+            current, location_col, updated_col = self._asset_locations()
+
+            if from_locations is not None:
+                outside = [code for code in asset_codes
+                           if code in current and str(current[code][1]) not in from_locations]
+                if outside:
+                    return False, f"Not at your locations: {', '.join(outside[:10])}"
+            conflicts = []
+            for code in asset_codes:
+                if code not in current:
+                    conflicts.append(f"{code} not found")
+                elif expected_locations and code in expected_locations and \
+                        str(current[code][1]) != str(expected_locations[code]):
+                    conflicts.append(f"{code} is now at {current[code][1] or 'no location'}")
+            if conflicts:
+                return False, "Move cancelled, nothing was written: " + "; ".join(conflicts)
+
+            moving = [code for code in asset_codes if current[code][1] != to_location]
+            if not moving:
+                return True, f"All selected assets are already at {to_location}"
+
+            date = str(date or datetime.now().date())
+            created_at = str(datetime.now())
+            movements = [{
+                'Asset Code': code,
+                'From Location': current[code][1],
+                'To Location': to_location,
+                'Reason': reason,
+                'Date': date,
+                'Moved By': moved_by,
+                'Created At': created_at
+            } for code in moving]
+            requests = self.build_append_requests(movements)
+            for code in moving:
+                requests.append({'updateCells': {
+                    'start': {'sheetId': assets_id, 'rowIndex': current[code][0] - 1, 'columnIndex': location_col - 1},
+                    'rows': [{'values': [_cell(to_location)]}],
+                    'fields': 'userEnteredValue'
+                }})
+                if updated_col:
+                    # Keep delta sync's per-row change stamp in step with the location edit
+                    requests.append({'updateCells': {
+                        'start': {'sheetId': assets_id, 'rowIndex': current[code][0] - 1, 'columnIndex': updated_col - 1},
+                        'rows': [{'values': [_cell(created_at)]}],
+                        'fields': 'userEnteredValue'
+                    }})
+            self.db._call(self.db.spreadsheet.batch_update, {'requests': requests}, idempotent=False)
+            for code in moving:
+                after = {'Asset Code': code, 'Location': to_location}
+                if updated_col:
+                    after[UPDATED_AT_COLUMN] = created_at
+                self.db._record_change(SHEETS['assets'], 'patch', current[code][0] - 2,
+                                       {'Asset Code': code, 'Location': current[code][1]}, after)
+            self.db._notify_change(SHEETS['assets'])
+            return True, f"Moved {len(moving)} asset(s) to {to_location}"
+        except Exception as e:
+            return False, f"Error moving assets: {str(e)}"
+
+    def move_asset(self, asset_code, to_location, from_location=None, **kwargs):
+        """Move one asset, failing if it is no longer at `from_location`"""
+        expected = {asset_code: from_location} if from_location is not None else None
+        return self.move_assets([asset_code], to_location, expected_locations=expected, **kwargs)
+
+    def _fetch(self, index_rows):
+        """Fetch the movement rows referenced by index entries, serving cached rows from memory"""
+        if index_rows.empty:
+            return pd.DataFrame(columns=MOVEMENT_COLUMNS)
+        keys = list(zip(index_rows['Partition'], index_rows['Row']))
+        missing = sorted({key for key in keys if key not in self._rows})
+        record_cache('movement_rows', True, len(keys) - len(missing))
+        record_cache('movement_rows', False, len(missing))
+        ranges = []
+        by_partition = {}
+        for partition, row in missing:
+            by_partition.setdefault(partition, []).append(row)
+        last_column = chr(ord('A') + len(MOVEMENT_COLUMNS) - 1)
+        for partition, rows in by_partition.items():
+            for first, last in _row_runs(rows):
+                ranges.append((partition, first, f"{_quote(partition)}!A{first}:{last_column}{last}"))
+        width = len(MOVEMENT_COLUMNS)
+        # Keep each batch read's URL within limits
+        for start in range(0, len(ranges), FETCH_RANGES_PER_CALL):
+            chunk = ranges[start:start + FETCH_RANGES_PER_CALL]
+            result = self.db._call(self.db.spreadsheet.values_batch_get, [r[2] for r in chunk])
+            for (partition, first, _), value_range in zip(chunk, result.get('valueRanges', [])):
+                for offset, values in enumerate(value_range.get('values', [])):
+                    self._rows[(partition, first + offset)] = (list(values) + [''] * width)[:width]
+        return pd.DataFrame([self._rows.get(key, [''] * width) for key in keys], columns=MOVEMENT_COLUMNS)
+
+    def _in_scope(self, index_rows):
+        """Index rows of assets the connection's location scope covers (every row when unscoped)"""
+        if getattr(self.db, 'scope', None) is None:
+            return index_rows
+        assets_df = self.db.read_data(SHEETS['assets'])
+        codes = set(assets_df['Asset Code'].astype(str)) if 'Asset Code' in assets_df.columns else set()
+        return index_rows[index_rows['Asset Code'].isin(codes)]
+
+    def all_movements(self):
+        """Return the full history in append order; partitions are cached and only their new tails fetched"""
+        self.refresh()
+        if getattr(self.db, 'scope', None) is not None:
+            # Fetch only the scoped assets' rows instead of whole partitions
+            return self._fetch(self._in_scope(self._index))
+        with self._cache.lock:
+            return self._all_movements_locked()
+
+    def _all_movements_locked(self):
+        width = len(MOVEMENT_COLUMNS)
+        last_column = chr(ord('A') + width - 1)
+        ranges = []
+        for partition, size in self._partition_sizes.items():
+            cached = self._partition_frames.get(partition)
+            have = 0 if cached is None else len(cached)
+            record_cache('movement_partitions', have == size)
+            if have < size:
+                ranges.append((partition, f"{_quote(partition)}!A{have + 2}:{last_column}{size + 1}"))
+        for start in range(0, len(ranges), FETCH_RANGES_PER_CALL):
+            chunk = ranges[start:start + FETCH_RANGES_PER_CALL]
+            result = self.db._call(self.db.spreadsheet.values_batch_get, [r[1] for r in chunk])
+            for (partition, _), value_range in zip(chunk, result.get('valueRanges', [])):
+                rows = [(list(v) + [''] * width)[:width] for v in value_range.get('values', [])]
+                new = pd.DataFrame(rows, columns=MOVEMENT_COLUMNS)
+                cached = self._partition_frames.get(partition)
+                self._partition_frames[partition] = new if cached is None else pd.concat([cached, new], ignore_index=True)
+        frames = [self._partition_frames[p] for p in sorted(self._partition_frames)]
+        if not frames:
+            return pd.DataFrame(columns=MOVEMENT_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+    def iter_movements(self, chunk_rows=EXPORT_CHUNK_ROWS):
+        """Yield the full history partition by partition in chunks of at most chunk_rows, without caching rows"""
+        self.refresh()
+        if getattr(self.db, 'scope', None) is not None:
+            movements = self.all_movements()
+            for start in range(0, len(movements), chunk_rows):
+                yield movements.iloc[start:start + chunk_rows].reset_index(drop=True)
+            return
+        width = len(MOVEMENT_COLUMNS)
+        last_column = chr(ord('A') + width - 1)
+        with self._cache.lock:
+            sizes = dict(self._partition_sizes)
+        for partition in sorted(sizes):
+            size = sizes[partition]
+            for first in range(2, size + 2, chunk_rows):
+                last = min(first + chunk_rows - 1, size + 1)
+                result = self.db._call(self.db.spreadsheet.values_get,
+                                       f"{_quote(partition)}!A{first}:{last_column}{last}",
+                                       priority=PRIORITY_BACKGROUND)
+                rows = [(list(v) + [''] * width)[:width] for v in result.get('values', [])]
+                if rows:
+                    yield pd.DataFrame(rows, columns=MOVEMENT_COLUMNS)
+
+    def count(self):
+        """Total number of movements in the log"""
+        self.refresh()
+        return len(self._index)
+
+    def partitions(self):
+        """Partition sheet names, oldest first"""
+        self.refresh()
+        with self._cache.lock:
+            return sorted(self._partition_sizes)
+
+    def latest(self, n=10):
+        """Return the last n movements appended, oldest first"""
+        self.refresh()
+        return self._fetch(self._in_scope(self._index).tail(n))
+
+    def timeline(self, asset_code):
+        """Return every movement of one asset ordered by date"""
+        self.refresh()
+        rows = self._in_scope(self._index[self._index['Asset Code'] == asset_code])
+        return self._sort_by_date(self._fetch(rows))
+
+    def between(self, start_date, end_date):
+        """Return movements with start_date <= Date <= end_date ordered by date"""
+        self.refresh()
+        start = pd.Timestamp(start_date)
+        end = pd.Timestamp(end_date)
+        # Prune whole partitions first, then filter the remaining index rows by date
+        first, last = start.strftime(MOVEMENT_PARTITION_FORMAT), end.strftime(MOVEMENT_PARTITION_FORMAT)
+        candidates = self._index[(self._index['Partition'] >= first) & (self._index['Partition'] <= last)]
+        dates = pd.to_datetime(candidates['Date'], errors='coerce')
+        rows = self._in_scope(candidates[(dates >= start) & (dates <= end)])
+        return self._sort_by_date(self._fetch(rows))
+
+    @staticmethod
+    def _sort_by_date(movements):
+        if movements.empty:
+            return movements
+        order = pd.to_datetime(movements['Date'], errors='coerce').argsort(kind='stable')
+        return movements.iloc[order].reset_index(drop=True)
+
+    def read_legacy(self):
+        """The legacy single-sheet AssetMovements history"""
+        return self.db.read_data(SHEETS['asset_movements'])
+
+    def migrate_legacy(self):
+        """Copy movements from the legacy single AssetMovements sheet into the partitioned log"""
+        return migrate_movements(self, self.read_legacy())
+
+
+_legacy_remaining = {}  # spreadsheet id -> (log count when checked, legacy movements not yet copied)
+
+
+def unmigrated_movements(log, legacy_df):
+    """Legacy movements (as records) not in the log yet; whole rows are matched, so repeated rows are kept"""
+    movements = legacy_df.astype(str).to_dict('records')
+    if not movements:
+        return []
+    copied = Counter(map(tuple, log.all_movements()[MOVEMENT_COLUMNS].astype(str).values.tolist()))
+    pending = []
+    for movement in movements:
+        key = tuple(movement.get(column, '') for column in MOVEMENT_COLUMNS)
+        if copied[key]:
+            copied[key] -= 1
+        else:
+            pending.append(movement)
+    return pending
+
+
+def migrate_movements(log, legacy_df):
+    """Append the legacy movements not yet in log in batches of MIGRATE_ROWS_PER_CALL; returns how many were copied.
+
+    Each batch is one atomic batch_update and rows already in the log are skipped, so after a failure
+    (or a 5xx that was applied anyway) running it again copies only what is missing.
+    """
+    movements = unmigrated_movements(log, legacy_df)
+    _legacy_remaining.pop(log.spreadsheet_id, None)
+    for start in range(0, len(movements), MIGRATE_ROWS_PER_CALL):
+        if not log.append_many(movements[start:start + MIGRATE_ROWS_PER_CALL], priority=PRIORITY_BACKGROUND):
+            return start
+    return len(movements)
+
+
+def legacy_remaining(log):
+    """How many legacy movements still need copying; rechecked only when the log has grown since the last check"""
+    count = log.count()
+    checked = _legacy_remaining.get(log.spreadsheet_id)
+    # The legacy sheet is no longer written, so a finished migration stays finished
+    if checked is not None and (checked[1] == 0 or checked[0] == count):
+        return checked[1]
+    legacy_df = log.read_legacy()
+    if read_failed(legacy_df):
+        return 0
+    remaining = len(unmigrated_movements(log, legacy_df))
+    _legacy_remaining[log.spreadsheet_id] = (count, remaining)
+    return remaining
+
+
+def get_movement_log(db):
+    """Return the session's movement log for the connected spreadsheet (its index is shared process-wide)"""
+    log = st.session_state.get('movement_log')
+    if log is None or log.db is not db or log.spreadsheet_id != db.spreadsheet_id:
+        # A sharded database supplies a log that fans out over its shards
+        log = db.movement_log() if hasattr(db, 'movement_log') else MovementLog(db)
+        st.session_state.movement_log = log
+    return log
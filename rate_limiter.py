@@ -0,0 +1,234 @@
+"""
+Rate Limiting Module
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+
+from config import SHEETS_REQUESTS_PER_MINUTE, SHEETS_MAX_RETRIES, SHEETS_BACKOFF_BASE, SHEETS_BACKOFF_MAX
+
+# Priority lanes, lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# A write that is not idempotent (an append, a row delete) may already have been applied when a
+# 5xx comes back; only a quota rejection is known not to have run
+NON_IDEMPOTENT_RETRYABLE_STATUS_CODES = {429}
+
+
+class TokenBucket:
+    """Thread-safe token bucket used to keep Sheets calls inside the API quota"""
+
+    def __init__(self, rate, capacity):
+        """Create a bucket refilled with `rate` tokens per second, holding at most `capacity`"""
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests_per_minute, burst=None):
+        """Create a bucket from a per-minute quota"""
+        return cls(requests_per_minute / 60.0, burst or requests_per_minute)
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def reserve(self, tokens=1):
+        """Take tokens and return how many seconds the caller must wait before using them"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available; otherwise return seconds until they will be, taking nothing"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        """Block the current thread until tokens are available"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens=1):
+        """Suspend the current coroutine until tokens are available"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def status_code_of(error):
+    """Extract an HTTP status code from gspread, requests or aiohttp errors"""
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status is None:
+        status = getattr(error, 'status', None)
+    return status
+
+
+class RequestScheduler:
+    """Central gate for Sheets API calls: quota token bucket, priority lanes and retry with backoff"""
+
+    def __init__(self, requests_per_minute=SHEETS_REQUESTS_PER_MINUTE, max_retries=SHEETS_MAX_RETRIES,
+                 backoff_base=SHEETS_BACKOFF_BASE, backoff_max=SHEETS_BACKOFF_MAX):
+        self.bucket = TokenBucket.per_minute(requests_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._metrics_lock = threading.Lock()
+        self.metrics = {
+            'calls': 0,
+            'throttled': 0,
+            'throttled_seconds': 0.0,
+            'retried': 0,
+            'failed': 0,
+            'calls_by_priority': {PRIORITY_INTERACTIVE: 0, PRIORITY_BACKGROUND: 0},
+        }
+
+    def _count(self, key, amount=1):
+        with self._metrics_lock:
+            self.metrics[key] += amount
+
+    def _take_turn(self, ticket):
+        """With the condition held: 0 once ticket has left the queue with a token, else seconds to wait
+        (None when another call is ahead of it)"""
+        if self._queue[0] != ticket:
+            return None
+        delay = self.bucket.try_acquire()
+        if delay == 0:
+            heapq.heappop(self._queue)
+            self._condition.notify_all()
+        return delay
+
+    def _wait_turn(self, priority):
+        """Block until this call is at the head of the queue and a quota token is free"""
+        ticket = (priority, next(self._sequence))
+        started = time.monotonic()
+        throttled = False
+        with self._condition:
+            heapq.heappush(self._queue, ticket)
+            while True:
+                delay = self._take_turn(ticket)
+                if delay == 0:
+                    break
+                throttled = True
+                # Wake early if a higher-priority call arrives and takes the head
+                self._condition.wait(delay)
+        self._count_turn(priority, started, throttled)
+
+    async def _wait_turn_async(self, priority):
+        """Suspend the coroutine until this call is at the head of the queue and a quota token is free.
+
+        Never blocks the event loop: the condition is only held to inspect the queue, and the
+        coroutine sleeps for the token bucket's delay (or one token's refill time while other
+        calls are ahead of it) between checks.
+        """
+        ticket = (priority, next(self._sequence))
+        started = time.monotonic()
+        throttled = False
+        with self._condition:
+            heapq.heappush(self._queue, ticket)
+        try:
+            while True:
+                with self._condition:
+                    delay = self._take_turn(ticket)
+                if delay == 0:
+                    break
+                throttled = True
+                await asyncio.sleep(1.0 / self.bucket.rate if delay is None else delay)
+        except BaseException:
+            # Cancelled while queued: leave the queue so the calls behind are not stuck
+            with self._condition:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                    self._condition.notify_all()
+            raise
+        self._count_turn(priority, started, throttled)
+
+    def _count_turn(self, priority, started, throttled):
+        with self._metrics_lock:
+            self.metrics['calls'] += 1
+            self.metrics['calls_by_priority'][priority] = self.metrics['calls_by_priority'].get(priority, 0) + 1
+            if throttled:
+                self.metrics['throttled'] += 1
+                self.metrics['throttled_seconds'] += time.monotonic() - started
+
+    def _backoff(self, attempt):
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _should_retry(self, error, attempt, idempotent):
+        codes = RETRYABLE_STATUS_CODES if idempotent else NON_IDEMPOTENT_RETRYABLE_STATUS_CODES
+        return attempt < self.max_retries and status_code_of(error) in codes
+
+    def call(self, fn, *args, priority=PRIORITY_INTERACTIVE, idempotent=True, **kwargs):
+        """Run a blocking API call through the scheduler; pass idempotent=False for appends and deletes"""
+        attempt = 0
+        while True:
+            self._wait_turn(priority)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not self._should_retry(e, attempt, idempotent):
+                    self._count('failed')
+                    raise
+                self._count('retried')
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+
+    async def call_async(self, fn, *args, priority=PRIORITY_INTERACTIVE, idempotent=True, **kwargs):
+        """Await an API coroutine through the scheduler; `fn` must return a fresh awaitable per attempt"""
+        attempt = 0
+        while True:
+            await self._wait_turn_async(priority)
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                if not self._should_retry(e, attempt, idempotent):
+                    self._count('failed')
+                    raise
+                self._count('retried')
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+
+    def get_metrics(self):
+        """Return a snapshot of scheduler metrics"""
+        with self._metrics_lock:
+            snapshot = dict(self.metrics)
+            snapshot['calls_by_priority'] = dict(self.metrics['calls_by_priority'])
+        with self._condition:
+            snapshot['queued'] = len(self._queue)
+        return snapshot
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide scheduler; the Sheets quota is shared by every session"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
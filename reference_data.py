@@ -0,0 +1,115 @@
+"""
+Reference Data Module
+
+Categories, Subcategories, Brands and Locations are small lookup sheets that
+the asset forms read on every rerun. They are loaded once per spreadsheet and
+turned into the plain dicts and lists the forms need (category -> subcategories,
+name -> code, location name -> record), so a form rerun does no Sheets I/O and
+no DataFrame filtering. Writes to any of the sheets through GoogleSheetsDB
+drop the cached copy; REFERENCE_DATA_TTL bounds staleness from edits made
+directly in Sheets.
+"""
+import threading
+import time
+from fnmatch import fnmatchcase
+
+from config import SHEETS, REFERENCE_DATA_TTL
+from google_sheets import GoogleSheetsDB, from_snapshot, read_failed
+from metrics import record_cache
+
+REFERENCE_SHEETS = [SHEETS['categories'], SHEETS['subcategories'], SHEETS['brands'], SHEETS['locations']]
+
+
+def _column(frame, name):
+    return frame[name].astype(str).tolist() if name in frame.columns else [''] * len(frame)
+
+
+class ReferenceData:
+    """Precomputed lookups over the reference sheets"""
+
+    def __init__(self, categories_df, subcategories_df, brands_df, locations_df):
+        category_names = _column(categories_df, 'Category Name')
+        self.category_names = [name for name in category_names if name]
+        self.category_codes = dict(zip(category_names, _column(categories_df, 'Category Code')))
+
+        self.subcategories = {}
+        self.subcategory_codes = {}
+        for category, name, code in zip(_column(subcategories_df, 'Category'),
+                                        _column(subcategories_df, 'Subcategory Name'),
+                                        _column(subcategories_df, 'Subcategory Code')):
+            self.subcategories.setdefault(category, []).append(name)
+            self.subcategory_codes[(category, name)] = code
+
+        self.brand_names = [name for name in _column(brands_df, 'Brand Name') if name]
+
+        location_names = _column(locations_df, 'Location Name')
+        self.location_names = [name for name in location_names if name]
+        self.locations = dict(zip(location_names, locations_df.to_dict('records')))
+
+    def locations_matching(self, patterns):
+        """Location names matching any of the patterns (exact names or wildcards like "Site 01 - *")"""
+        return frozenset(name for name in self.location_names if any(fnmatchcase(name, p) for p in patterns))
+    
+    def location_names_in(self, scope):
+        """Location options for a user limited to `scope` (every location when None)"""
+        return self.location_names if scope is None else [name for name in self.location_names if name in scope]
+    
+    def subcategories_for(self, category):
+        return self.subcategories.get(category, [])
+
+    def category_code(self, category):
+        return self.category_codes.get(category, '')
+
+    def subcategory_code(self, category, subcategory):
+        return self.subcategory_codes.get((category, subcategory), '') if subcategory else ''
+
+    @staticmethod
+    def index_of(options, value, default=0):
+        """Position of value in a selectbox option list (default when absent)"""
+        try:
+            return options.index(value)
+        except ValueError:
+            return default
+
+
+_cache = {}  # spreadsheet id -> (loaded at, ReferenceData)
+_invalidated_at = {}  # spreadsheet id (None for all) -> time of the last invalidation
+_cache_lock = threading.Lock()
+
+
+def get_reference_data(db):
+    """Cached reference data for db's spreadsheet, loading it on first use or after a write"""
+    with _cache_lock:
+        entry = _cache.get(db.spreadsheet_id)
+    if entry is not None and time.monotonic() - entry[0] < REFERENCE_DATA_TTL:
+        record_cache('reference_data', True)
+        return entry[1]
+    record_cache('reference_data', False)
+    loaded_at = time.monotonic()
+    frames = [db.read_data(sheet_name) for sheet_name in REFERENCE_SHEETS]
+    data = ReferenceData(*frames)
+    if any(read_failed(frame) or from_snapshot(frame) for frame in frames):
+        # Caching a failed read would hide every option for the TTL, and a cold-start disk snapshot is
+        # only being revalidated; the next call reads again. An empty sheet is a valid result.
+        return data
+    with _cache_lock:
+        # A write that landed while loading may not be in what was read; don't cache it then
+        invalidated = max(_invalidated_at.get(db.spreadsheet_id, 0), _invalidated_at.get(None, 0))
+        if loaded_at > invalidated:
+            _cache[db.spreadsheet_id] = (loaded_at, data)
+    return data
+
+
+def invalidate_reference_data(spreadsheet_id=None, sheet_name=None):
+    """Drop cached reference data (for one spreadsheet, or all) if sheet_name is a reference sheet"""
+    if sheet_name is not None and sheet_name not in REFERENCE_SHEETS:
+        return
+    with _cache_lock:
+        _invalidated_at[spreadsheet_id] = time.monotonic()
+        if spreadsheet_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(spreadsheet_id, None)
+
+
+GoogleSheetsDB.change_listeners.append(invalidate_reference_data)
@@ -0,0 +1,435 @@
+"""
+Sharding Module
+
+Spreads the Assets sheet, and with it the movement log, over several
+spreadsheets. A shard map routes each asset to a spreadsheet by Location or by
+the year it was created. Other sheets (master data, users) stay in the
+connected "home" spreadsheet. Cross-shard reads fan out in parallel and merge
+the results, so search, the dashboard and the scanner keep working on one
+combined Assets frame. With a location scope set (site managers), only the
+shards holding the scoped locations are read at all.
+
+Example shards.json:
+
+    {"by": "location",
+     "shards": [{"spreadsheet_id": "1AbC...", "locations": ["Site 01 - Room 01", "Site 01 - Room 02"]},
+                {"spreadsheet_id": "1XyZ...", "locations": ["Site 02 - Room 01"]}]}
+
+or {"by": "year", "shards": [{"spreadsheet_id": "...", "years": [2019, 2020, 2021]}, ...]}.
+Assets that match no shard live in the home spreadsheet.
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from config import (
+    SHEETS, MOVEMENT_COLUMNS, SHARDS_FILE, SHARDED_SHEETS, SHEETS_MAX_CONCURRENCY, UPDATED_AT_COLUMN, EXPORT_CHUNK_ROWS
+)
+from google_sheets import GoogleSheetsDB, from_snapshot, read_failed
+from movement_log import MovementLog, migrate_movements
+from rate_limiter import PRIORITY_INTERACTIVE
+
+
+class ShardRouter:
+    """Maps assets to spreadsheets by Location or by creation year"""
+
+    def __init__(self, config):
+        self.by = config.get('by', 'location')
+        if self.by not in ('location', 'year'):
+            raise ValueError(f"Unknown shard key: {self.by}")
+        self.routes = {}
+        self.shard_ids = []
+        for shard in config.get('shards', []):
+            spreadsheet_id = shard['spreadsheet_id']
+            self.shard_ids.append(spreadsheet_id)
+            keys = shard.get('locations', []) if self.by == 'location' else [int(y) for y in shard.get('years', [])]
+            for key in keys:
+                self.routes[key] = spreadsheet_id
+
+    @classmethod
+    def from_file(cls, path=SHARDS_FILE):
+        """Load the shard map, or return None when sharding is not configured"""
+        if not path or not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def shard_for(self, asset, home_id):
+        """Spreadsheet ID that should hold an asset row"""
+        if self.by == 'location':
+            return self.routes.get(str(asset.get('Location', '')), home_id)
+        created = pd.to_datetime(asset.get('Created At'), errors='coerce')
+        if pd.isna(created):
+            return home_id
+        return self.routes.get(created.year, home_id)
+
+
+class ShardedSheetsDB:
+    """GoogleSheetsDB facade that routes sharded sheets across spreadsheets
+
+    Row numbers passed to update_row/delete_row refer to the merged frame returned by the
+    last read_data of that sheet, exactly as they refer to a single sheet's rows otherwise.
+    Anything not overridden here is served by the home spreadsheet's GoogleSheetsDB.
+    """
+
+    def __init__(self, home, router, max_workers=SHEETS_MAX_CONCURRENCY):
+        self.home = home
+        self.router = router
+        self.max_workers = max_workers
+        self._dbs = {}
+        self._row_maps = {}  # sheet -> [(shard id, local row)] for the last merged read
+        self.scope = None
+
+    def __getattr__(self, name):
+        return getattr(self.home, name)
+
+    def set_spreadsheet(self, spreadsheet_id_or_title):
+        """Set the home spreadsheet; shards come from the shard map"""
+        previous = self.home.spreadsheet_id
+        connected = self.home.set_spreadsheet(spreadsheet_id_or_title)
+        if self.home.spreadsheet_id != previous:
+            # Shard connections (and their caches) belong to the previous home spreadsheet
+            self._dbs = {}
+            self._row_maps = {}
+        return connected
+
+    def last_version(self):
+        """Versions of every shard's most recent delta-synced read"""
+        if self.scope is not None:
+            return None
+        versions = tuple(self.db_for(spreadsheet_id).last_version() for spreadsheet_id in self.shard_ids())
+        return None if None in versions else versions
+
+    def data_revision(self, sheet_name):
+        """Revisions of the frames behind the last read of sheet_name, one per shard it was read from"""
+        if sheet_name not in SHARDED_SHEETS:
+            return self.home.data_revision(sheet_name)
+        revisions = tuple(self.db_for(spreadsheet_id).data_revision(sheet_name) for spreadsheet_id in self.shard_ids())
+        return None if None in revisions else revisions
+
+    def set_scope(self, locations):
+        """Limit Assets (and movement) reads to `locations`; shards holding none of them are skipped"""
+        scope = None if locations is None else frozenset(str(location) for location in locations)
+        if scope != self.scope:
+            self.scope = scope
+            self._row_maps = {}
+        self.home.set_scope(scope)
+        for db in self._dbs.values():
+            db.set_scope(scope)
+
+    def shard_ids(self):
+        """Home spreadsheet first, then every configured shard (only those the scope needs, when scoped)"""
+        ids = [self.home.spreadsheet_id]
+        ids += [i for i in self.router.shard_ids if i not in ids]
+        if self.scope is None or self.router.by != 'location':
+            return ids
+        needed = {self.router.shard_for({'Location': location}, ids[0]) for location in self.scope}
+        return [i for i in ids if i in needed]
+
+    def db_for(self, spreadsheet_id):
+        """GoogleSheetsDB for one shard, sharing the home client, scheduler and snapshot cache"""
+        if spreadsheet_id == self.home.spreadsheet_id:
+            return self.home
+        if spreadsheet_id not in self._dbs:
+            self._dbs[spreadsheet_id] = GoogleSheetsDB(
+                spreadsheet_id, client=self.home.client, scheduler=self.home.scheduler,
+                snapshot_cache=self.home.snapshot_cache
+            )
+            self._dbs[spreadsheet_id].set_scope(self.scope)
+        return self._dbs[spreadsheet_id]
+
+    def fan_out(self, fn):
+        """Run fn(shard_db) for every shard in parallel; results are in shard_ids() order"""
+        shard_ids = self.shard_ids()
+        if not shard_ids:
+            return []
+        # Attach the Streamlit script context so st.error from worker threads still reaches the page
+        ctx = get_script_run_ctx()
+
+        def run(spreadsheet_id):
+            if ctx is not None:
+                add_script_run_ctx(ctx=ctx)
+            return fn(self.db_for(spreadsheet_id))
+
+        if len(shard_ids) == 1:
+            return [run(shard_ids[0])]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(shard_ids))) as executor:
+            return list(executor.map(run, shard_ids))
+
+    def read_data(self, sheet_name):
+        """Read a sheet; sharded sheets are read from every shard and concatenated"""
+        if sheet_name not in SHARDED_SHEETS:
+            return self.home.read_data(sheet_name)
+        frames = self.fan_out(lambda db: db.read_data(sheet_name))
+        # A shard that could not be read makes the merged frame incomplete: report the failure instead
+        failed = next((frame for frame in frames if read_failed(frame)), None)
+        if failed is not None:
+            self._row_maps.pop(sheet_name, None)
+            return failed
+        parts = []
+        for spreadsheet_id, frame in zip(self.shard_ids(), frames):
+            if frame.empty:
+                continue
+            frame = frame.copy()
+            frame['_shard'] = spreadsheet_id
+            frame['_row'] = range(len(frame))
+            parts.append(frame)
+        if not parts:
+            self._row_maps[sheet_name] = []
+            return pd.DataFrame()
+        merged = pd.concat(parts, ignore_index=True)
+        if 'Asset Code' in merged.columns:
+            # An asset handed over between shards is briefly in both; keep the newest copy
+            if UPDATED_AT_COLUMN in merged.columns:
+                stamps = pd.to_datetime(merged[UPDATED_AT_COLUMN], errors='coerce')
+                order = stamps.fillna(pd.Timestamp.min).argsort(kind='stable')
+                keep = ~merged.iloc[order]['Asset Code'].duplicated(keep='last')
+                merged = merged.iloc[order][keep].sort_index()
+            else:
+                merged = merged[~merged['Asset Code'].duplicated(keep='first')]
+            merged = merged.reset_index(drop=True)
+        self._row_maps[sheet_name] = list(zip(merged['_shard'], merged['_row']))
+        merged = merged.drop(columns=['_shard', '_row'])
+        merged.attrs['from_snapshot'] = any(from_snapshot(frame) for frame in frames)
+        return merged
+
+    def _locate(self, sheet_name, row_index):
+        """(shard db, local row number) for a row of the last merged read"""
+        if sheet_name not in self._row_maps:
+            self.read_data(sheet_name)
+        row_map = self._row_maps[sheet_name]
+        if not 1 <= row_index <= len(row_map):
+            raise IndexError(f"Row {row_index} is not in the last read of {sheet_name}")
+        spreadsheet_id, local = row_map[row_index - 1]
+        return self.db_for(spreadsheet_id), local + 1
+
+    def append_row(self, sheet_name, row_data):
+        """Append a row to the shard its routing key maps to"""
+        if sheet_name not in SHARDED_SHEETS:
+            return self.home.append_row(sheet_name, row_data)
+        # Appends land after existing rows, so the row map of the last read stays valid
+        return self.db_for(self.router.shard_for(row_data, self.home.spreadsheet_id)).append_row(sheet_name, row_data)
+
+    def update_row(self, sheet_name, row_index, row_data):
+        """Update a row in place, or hand it over to another shard if its routing key changed"""
+        if sheet_name not in SHARDED_SHEETS:
+            return self.home.update_row(sheet_name, row_index, row_data)
+        try:
+            db, local = self._locate(sheet_name, row_index)
+        except IndexError as e:
+            st.error(f"Error updating row in {sheet_name}: {str(e)}")
+            return False
+        target = self.db_for(self.router.shard_for(row_data, self.home.spreadsheet_id))
+        if target is db:
+            return db.update_row(sheet_name, local, row_data)
+        # Copy first, then delete: a failure in between leaves a duplicate (resolved on read), never a loss
+        self._row_maps.pop(sheet_name, None)
+        return target.append_row(sheet_name, row_data) and db.delete_row(sheet_name, local)
+
+    def delete_row(self, sheet_name, row_index):
+        if sheet_name not in SHARDED_SHEETS:
+            return self.home.delete_row(sheet_name, row_index)
+        try:
+            db, local = self._locate(sheet_name, row_index)
+        except IndexError as e:
+            st.error(f"Error deleting row from {sheet_name}: {str(e)}")
+            return False
+        self._row_maps.pop(sheet_name, None)
+        return db.delete_row(sheet_name, local)
+
+    def find_row(self, sheet_name, column_name, value):
+        """Find a row number in the merged frame by column value"""
+        if sheet_name not in SHARDED_SHEETS:
+            return self.home.find_row(sheet_name, column_name, value)
+        data = self.read_data(sheet_name)
+        if column_name not in data.columns:
+            return -1
+        matches = data.index[data[column_name].astype(str).str.lower() == str(value).lower()]
+        return int(matches[0]) + 1 if len(matches) else -1
+
+    def recorded_locations(self, sheet_name, keys):
+        """recorded_locations over every shard, including shards outside the scope"""
+        if sheet_name not in SHARDED_SHEETS:
+            return self.home.recorded_locations(sheet_name, keys)
+        ids = [self.home.spreadsheet_id] + [i for i in self.router.shard_ids if i != self.home.spreadsheet_id]
+        found = {}
+        for spreadsheet_id in ids:
+            found.update(self.db_for(spreadsheet_id).recorded_locations(sheet_name, keys))
+        return found
+
+    def write_data(self, sheet_name, data):
+        """Replace a sheet's contents; sharded rows are split by routing key"""
+        if sheet_name not in SHARDED_SHEETS:
+            return self.home.write_data(sheet_name, data)
+        records = data.to_dict('records') if isinstance(data, pd.DataFrame) else list(data)
+        by_shard = {spreadsheet_id: [] for spreadsheet_id in self.shard_ids()}
+        for record in records:
+            by_shard.setdefault(self.router.shard_for(record, self.home.spreadsheet_id), []).append(record)
+        self._row_maps.pop(sheet_name, None)
+        columns = data.columns if isinstance(data, pd.DataFrame) else None
+        results = self.fan_out(lambda db: db.write_data(
+            sheet_name, pd.DataFrame(by_shard.get(db.spreadsheet_id, []), columns=columns)))
+        return all(results)
+
+    def iter_rows(self, sheet_name, chunk_rows=EXPORT_CHUNK_ROWS):
+        """Stream a sheet chunk by chunk; sharded sheets are streamed one shard after another"""
+        if sheet_name not in SHARDED_SHEETS:
+            yield from self.home.iter_rows(sheet_name, chunk_rows)
+            return
+        # Shards add columns on their own (Updated At is added on first write), so chunks share one union header
+        shard_dbs = [self.db_for(spreadsheet_id) for spreadsheet_id in self.shard_ids()]
+        headers = []
+        for shard_headers in self.fan_out(lambda db: db.headers(sheet_name)):
+            headers += [column for column in shard_headers if column not in headers]
+        for db in shard_dbs:
+            for chunk in db.iter_rows(sheet_name, chunk_rows):
+                yield chunk.reindex(columns=headers, fill_value='')
+
+    def asset_shards(self):
+        """{asset code: shard id} for every asset (one fan-out read)"""
+        assets_df = self.read_data(SHEETS['assets'])
+        if 'Asset Code' not in assets_df.columns:
+            return {}
+        row_map = self._row_maps[SHEETS['assets']]
+        return {str(code): row_map[i][0] for i, code in enumerate(assets_df['Asset Code'])}
+
+    def movement_log(self):
+        return ShardedMovementLog(self)
+
+
+class ShardedMovementLog:
+    """Movement log over all shards: each shard logs the moves of the assets it holds"""
+
+    def __init__(self, db):
+        self.db = db
+        self.spreadsheet_id = db.spreadsheet_id
+        self._logs = {}
+
+    def log_for(self, shard_db):
+        if shard_db.spreadsheet_id not in self._logs:
+            self._logs[shard_db.spreadsheet_id] = MovementLog(shard_db)
+        return self._logs[shard_db.spreadsheet_id]
+
+    def _fan_out(self, fn):
+        return self.db.fan_out(lambda shard_db: fn(self.log_for(shard_db)))
+
+    def refresh(self):
+        self._fan_out(lambda log: log.refresh())
+
+    def count(self):
+        return sum(self._fan_out(lambda log: log.count()))
+
+    def partitions(self):
+        return sorted(set().union(*self._fan_out(lambda log: log.partitions())))
+
+    @staticmethod
+    def _merge(frames, sort_column):
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return pd.DataFrame(columns=MOVEMENT_COLUMNS)
+        merged = pd.concat(frames, ignore_index=True)
+        order = pd.to_datetime(merged[sort_column], errors='coerce').argsort(kind='stable')
+        return merged.iloc[order].reset_index(drop=True)
+
+    def latest(self, n=10):
+        """Last n movements across shards by creation time, oldest first"""
+        return self._merge(self._fan_out(lambda log: log.latest(n)), 'Created At').tail(n).reset_index(drop=True)
+
+    def timeline(self, asset_code):
+        return self._merge(self._fan_out(lambda log: log.timeline(asset_code)), 'Date')
+
+    def between(self, start_date, end_date):
+        return self._merge(self._fan_out(lambda log: log.between(start_date, end_date)), 'Date')
+
+    def all_movements(self):
+        return self._merge(self._fan_out(lambda log: log.all_movements()), 'Date')
+
+    def iter_movements(self, chunk_rows=EXPORT_CHUNK_ROWS):
+        """Stream every shard's log in turn (ordered by partition within a shard)"""
+        for spreadsheet_id in self.db.shard_ids():
+            yield from self.log_for(self.db.db_for(spreadsheet_id)).iter_movements(chunk_rows)
+
+    def append_many(self, movements, priority=PRIORITY_INTERACTIVE):
+        """Append movements to the shards holding their assets"""
+        shards = self.db.asset_shards()
+        home_id = self.db.home.spreadsheet_id
+        by_shard = {}
+        for movement in movements:
+            by_shard.setdefault(shards.get(str(movement.get('Asset Code', '')), home_id), []).append(movement)
+        return all([self.log_for(self.db.db_for(spreadsheet_id)).append_many(rows, priority)
+                    for spreadsheet_id, rows in by_shard.items()])
+
+    def append(self, movement):
+        return self.append_many([movement])
+
+    def move_assets(self, asset_codes, to_location, reason='', date=None, moved_by='', expected_locations=None,
+                    from_locations=None):
+        """Move assets shard by shard; each shard's move is atomic, cross-shard handovers follow it"""
+        if not asset_codes:
+            return False, "No assets selected"
+        assets_df = self.db.read_data(SHEETS['assets'])
+        shards = self.db.asset_shards()
+        home_id = self.db.home.spreadsheet_id
+        by_shard = {}
+        for code in asset_codes:
+            by_shard.setdefault(shards.get(str(code), home_id), []).append(code)
+        messages = []
+        for spreadsheet_id, codes in by_shard.items():
+            shard_db = self.db.db_for(spreadsheet_id)
+            success, message = self.log_for(shard_db).move_assets(
+                codes, to_location, reason=reason, date=date, moved_by=moved_by,
+                expected_locations=expected_locations, from_locations=from_locations
+            )
+            if not success:
+                return False, "; ".join(messages + [message])
+            messages.append(message)
+            target = self.db.router.shard_for({'Location': to_location}, home_id)
+            if self.db.router.by == 'location' and target != shard_db.spreadsheet_id:
+                handed_over = self._hand_over(shard_db, self.db.db_for(target), codes, assets_df, to_location)
+                if not handed_over:
+                    return False, "; ".join(messages + ["Moved, but handing the assets over to their new shard failed"])
+        return True, "; ".join(messages)
+
+    def _hand_over(self, source, target, codes, assets_df, to_location):
+        """Copy moved asset rows to the shard of their new location, then delete them from the old one"""
+        assets_sheet = SHEETS['assets']
+        rows = assets_df[assets_df['Asset Code'].astype(str).isin([str(c) for c in codes])]
+        for _, asset in rows.iterrows():
+            row_data = asset.to_dict()
+            row_data['Location'] = to_location
+            if not target.append_row(assets_sheet, row_data):
+                return False
+        self.db._row_maps.pop(assets_sheet, None)
+        # The moved rows may now be outside a scoped user's locations, so find and delete them
+        # in the whole source sheet; bottom-up, so earlier deletes don't shift the later rows
+        try:
+            current = self.log_for(source)._asset_locations()[0]
+        except Exception as e:
+            st.error(f"Error reading {assets_sheet} for the shard handover: {str(e)}")
+            return False
+        moved = [str(code) for code in rows['Asset Code']]
+        if any(code not in current for code in moved):
+            return False
+        unscoped = source if source.scope is None else GoogleSheetsDB(
+            source.spreadsheet_id, client=source.client, scheduler=source.scheduler,
+            snapshot_cache=source.snapshot_cache
+        )
+        for row in sorted((current[code][0] - 1 for code in moved), reverse=True):
+            if not unscoped.delete_row(assets_sheet, row):
+                return False
+        return True
+
+    def move_asset(self, asset_code, to_location, from_location=None, **kwargs):
+        expected = {asset_code: from_location} if from_location is not None else None
+        return self.move_assets([asset_code], to_location, expected_locations=expected, **kwargs)
+
+    def read_legacy(self):
+        """Legacy movements live in the home spreadsheet"""
+        return self.db.home.read_data(SHEETS['asset_movements'])
+
+    def migrate_legacy(self):
+        return migrate_movements(self, self.read_legacy())
@@ -0,0 +1,38 @@
+"""
+Sheet Utils Module
+
+A1 notation and cell value helpers with the same results as their namesakes in
+gspread.utils. Importing anything from gspread runs its package __init__, which
+loads gspread.auth and the Google auth stack; the storage layer uses these so
+that cost is only paid when a real connection is made.
+"""
+
+
+def numericise(value):
+    """int or float for numeric text (thousands commas allowed, underscores not); anything else unchanged"""
+    if isinstance(value, str) and '_' not in value:
+        cleaned = value.replace(',', '')
+        try:
+            return int(cleaned)
+        except ValueError:
+            try:
+                return float(cleaned)
+            except ValueError:
+                pass
+    return value
+
+
+def numericise_all(values):
+    return [numericise(value) for value in values]
+
+
+def rowcol_to_a1(row, col):
+    """A1 label of a cell (row and column start at 1)"""
+    row, col = int(row), int(col)
+    if row < 1 or col < 1:
+        raise ValueError(f"({row}, {col}) is not a cell")
+    label = ''
+    while col:
+        col, mod = divmod(col - 1, 26)
+        label = chr(ord('A') + mod) + label
+    return f"{label}{row}"
@@ -0,0 +1,143 @@
+"""
+Snapshot Cache Module
+
+Persists the last-known contents of each sheet on local disk as an Arrow IPC
+file stamped with the spreadsheet's Drive version. A new session can render
+from the memory-mapped snapshot straight away while GoogleSheetsDB revalidates
+against Google in the background.
+"""
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from config import SNAPSHOT_CACHE_DIR
+from sheet_utils import numericise_all
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # optional dependency: without pyarrow the cache is disabled
+    pa = None
+    feather = None
+
+logger = logging.getLogger(__name__)
+
+# Revalidation runs off the Streamlit script thread; Sheets calls still go through the scheduler
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='snapshot-revalidate')
+
+
+def submit(fn, *args):
+    """Run fn(*args) on the background revalidation pool, logging failures"""
+    def run():
+        try:
+            return fn(*args)
+        except Exception:
+            logger.exception("Background revalidation failed")
+    return _executor.submit(run)
+
+
+def _encode_column(values):
+    """Arrow array for one column of get_all_records values, and whether it needs numericising on load"""
+    types = {type(v) for v in values}
+    if types <= {str}:
+        return pa.array(values, type=pa.string()), False
+    if types == {int}:
+        return pa.array(values, type=pa.int64()), False
+    if types == {float}:
+        return pa.array(values, type=pa.float64()), False
+    # Mixed cells (e.g. numbers and blanks) are stored as text and numericised again on load
+    return pa.array(['' if v is None else str(v) for v in values], type=pa.string()), True
+
+
+def _numericise(series):
+    unique = series.unique().tolist()
+    return series.map(dict(zip(unique, numericise_all(unique))))
+
+
+class SnapshotCache:
+    """Versioned per-sheet snapshots under directory/<spreadsheet id>/<sheet>.arrow"""
+
+    def __init__(self, directory=SNAPSHOT_CACHE_DIR):
+        self.directory = directory
+
+    @property
+    def enabled(self):
+        return bool(self.directory) and pa is not None
+
+    def _path(self, spreadsheet_id, sheet_name):
+        return os.path.join(self.directory, quote(spreadsheet_id, safe=''), quote(sheet_name, safe='') + '.arrow')
+
+    def has_snapshots(self, spreadsheet_id):
+        """True if any sheet of the spreadsheet has been snapshotted"""
+        if not self.enabled or not spreadsheet_id:
+            return False
+        folder = os.path.join(self.directory, quote(spreadsheet_id, safe=''))
+        return os.path.isdir(folder) and any(name.endswith('.arrow') for name in os.listdir(folder))
+
+    def load(self, spreadsheet_id, sheet_name):
+        """Return (frame, version) from disk, or None if there is no usable snapshot"""
+        if not self.enabled or not spreadsheet_id:
+            return None
+        path = self._path(spreadsheet_id, sheet_name)
+        if not os.path.exists(path):
+            return None
+        try:
+            table = feather.read_table(path, memory_map=True)
+            metadata = table.schema.metadata or {}
+            columns = json.loads(metadata[b'columns'])
+            numericise = set(json.loads(metadata[b'numericise']))
+            frame = table.to_pandas()
+            frame.columns = columns
+            for position in numericise:
+                frame.isetitem(position, _numericise(frame.iloc[:, position]))
+            return frame, metadata[b'version'].decode()
+        except Exception:
+            # A truncated or incompatible file is just a cache miss
+            logger.warning("Ignoring unreadable snapshot %s", path, exc_info=True)
+            return None
+
+    def save(self, spreadsheet_id, sheet_name, frame, version):
+        """Atomically write a snapshot of frame stamped with version"""
+        if not self.enabled or not spreadsheet_id:
+            return False
+        arrays = []
+        numericise = []
+        for position in range(frame.shape[1]):
+            array, needs_numericise = _encode_column(frame.iloc[:, position].tolist())
+            arrays.append(array)
+            if needs_numericise:
+                numericise.append(position)
+        # Sheet headers may repeat or be blank, so fields are positional and names live in the metadata
+        table = pa.Table.from_arrays(arrays, names=[f'c{i}' for i in range(len(arrays))]).replace_schema_metadata({
+            'columns': json.dumps([str(c) for c in frame.columns]),
+            'numericise': json.dumps(numericise),
+            'version': str(version or ''),
+        })
+        path = self._path(spreadsheet_id, sheet_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # One temp file per save: revalidation workers and sessions may save the same sheet at once
+        fd, temp_path = tempfile.mkstemp(prefix='.snapshot-', suffix='.tmp', dir=os.path.dirname(path))
+        os.close(fd)
+        try:
+            # Uncompressed so reads can be memory-mapped without decoding
+            feather.write_feather(table, temp_path, compression='uncompressed')
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return True
+
+    def clear(self, spreadsheet_id=None):
+        """Delete snapshots for one spreadsheet (or all)"""
+        if not self.directory:
+            return
+        folder = os.path.join(self.directory, quote(spreadsheet_id, safe='')) if spreadsheet_id else self.directory
+        if not os.path.isdir(folder):
+            return
+        for root, _, files in os.walk(folder):
+            for name in files:
+                if name.endswith('.arrow'):
+                    os.remove(os.path.join(root, name))
@@ -0,0 +1,220 @@
+"""
+Stocktake Module
+
+Physical audit of one location. Scanned codes are appended to a session buffer
+(one cheap rerun per scan, nothing read from Sheets while scanning) and the
+whole buffer is reconciled against the expected inventory at once with set
+operations: found, missing, misplaced (known asset scanned here but recorded
+elsewhere) and unknown codes. Misplaced assets can be moved here with one
+batched movement write. For users limited to some locations, scanned codes
+outside their scope are looked up in the full code/Location columns, so assets
+of other sites count as misplaced rather than unknown.
+"""
+import re
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from config import SHEETS
+from movement_log import get_movement_log
+from reference_data import get_reference_data
+
+SCAN_SEPARATORS = re.compile(r'[\s,;]+')
+
+
+class StocktakeSession:
+    """Scans collected for one location, in scan order"""
+
+    def __init__(self, location):
+        self.location = location
+        self.started = datetime.now()
+        self._started_at = time.monotonic()
+        self.codes = []
+        self.result = None
+
+    def add(self, text):
+        """Append every code in text (one scan, or a pasted batch); returns how many were added"""
+        codes = [code for code in SCAN_SEPARATORS.split(str(text).strip()) if code]
+        self.codes.extend(codes)
+        # New scans make an earlier reconciliation stale
+        self.result = None
+        return len(codes)
+
+    def undo(self):
+        if self.codes:
+            self.codes.pop()
+            self.result = None
+
+    @property
+    def unique_count(self):
+        return len(set(self.codes))
+
+    def scans_per_minute(self):
+        elapsed = time.monotonic() - self._started_at
+        return len(self.codes) / elapsed * 60 if elapsed > 0 else 0.0
+
+
+def reconcile(assets_df, location, scanned_codes, recorded_locations=None):
+    """Found, missing, misplaced and unknown assets for a location given the scanned codes.
+
+    recorded_locations ({code: Location}) covers assets not in assets_df, e.g. outside the
+    user's scope; those scanned codes are reported under 'elsewhere' instead of unknown.
+    """
+    recorded_locations = recorded_locations or {}
+    columns = [c for c in ('Asset Code', 'Item Name', 'Asset Category', 'Location', 'Asset Status')
+               if c in assets_df.columns]
+    if assets_df.empty or 'Asset Code' not in assets_df.columns:
+        empty = pd.DataFrame(columns=columns)
+        scanned = list(dict.fromkeys(str(code) for code in scanned_codes))
+        return {'found': empty, 'missing': empty, 'misplaced': empty,
+                **_outside(scanned, set(), recorded_locations), 'duplicates': len(scanned_codes) - len(scanned)}
+
+    # Set membership mapped in C over both sides; scans keep their order, repeats dropped
+    codes = assets_df['Asset Code'].astype(str).tolist()
+    scanned = list(dict.fromkeys(str(code) for code in scanned_codes))
+    scanned_set, code_set = set(scanned), set(codes)
+    was_scanned = np.fromiter(map(scanned_set.__contains__, codes), dtype=bool, count=len(codes))
+    expected_here = (assets_df['Location'].astype(str) == str(location)).to_numpy(dtype=bool) \
+        if 'Location' in assets_df.columns else np.zeros(len(codes), dtype=bool)
+    return {
+        'found': assets_df.loc[was_scanned & expected_here, columns],
+        'missing': assets_df.loc[~was_scanned & expected_here, columns],
+        'misplaced': assets_df.loc[was_scanned & ~expected_here, columns],
+        **_outside(scanned, code_set, recorded_locations),
+        'duplicates': len(scanned_codes) - len(scanned),
+    }
+
+
+def _outside(scanned, code_set, recorded_locations):
+    """Scanned codes missing from the frame: recorded elsewhere (outside the scope) or unknown"""
+    codes = [code for code in scanned if code not in code_set]
+    elsewhere = [code for code in codes if code in recorded_locations]
+    return {
+        'elsewhere': pd.DataFrame({'Asset Code': elsewhere, 'Location': [recorded_locations[c] for c in elsewhere]}),
+        'unknown': pd.DataFrame({'Asset Code': [code for code in codes if code not in recorded_locations]}),
+    }
+
+
+def reconcile_session(db, session):
+    """reconcile a stocktake session against the assets the user can see, resolving the rest by code"""
+    assets_df = db.read_data(SHEETS['assets'])
+    recorded = None
+    if db.scope is not None:
+        seen = set(assets_df['Asset Code'].astype(str)) if 'Asset Code' in assets_df.columns else set()
+        outside = {str(code) for code in session.codes} - seen
+        recorded = db.recorded_locations(SHEETS['assets'], outside) if outside else None
+    return reconcile(assets_df, session.location, session.codes, recorded)
+
+
+def _record_scan():
+    """on_change callback of the scan box: buffer the code and clear the box for the next scan"""
+    session = st.session_state.get('stocktake')
+    if session is not None:
+        session.add(st.session_state.get('stocktake_scan', ''))
+    st.session_state.stocktake_scan = ''
+
+
+def _record_pasted():
+    session = st.session_state.get('stocktake')
+    if session is not None:
+        session.add(st.session_state.get('stocktake_paste', ''))
+    st.session_state.stocktake_paste = ''
+
+
+def show_stocktake(db):
+    """Stocktake page"""
+    st.title("📋 Stocktake")
+
+    session = st.session_state.get('stocktake')
+    if session is None:
+        location_names = get_reference_data(db).location_names_in(db.scope)
+        if not location_names:
+            st.info("No locations available")
+            return
+        location = st.selectbox("Location to Audit *", location_names)
+        if st.button("Start Stocktake"):
+            st.session_state.stocktake = StocktakeSession(location)
+            st.rerun()
+        return
+
+    st.subheader(f"Auditing: {session.location}")
+    st.caption(f"Started {session.started:%Y-%m-%d %H:%M}")
+
+    # Scanner guns type the code and press Enter; each Enter buffers one scan
+    st.text_input("Scan Barcode", key='stocktake_scan', on_change=_record_scan)
+    with st.expander("Paste Scans"):
+        st.text_area("One code per line (or separated by spaces/commas)", key='stocktake_paste')
+        st.button("Add Scans", on_click=_record_pasted)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Scans", len(session.codes))
+    with col2:
+        st.metric("Unique Codes", session.unique_count)
+    with col3:
+        st.metric("Scans / Minute", f"{session.scans_per_minute():.0f}")
+    if session.codes:
+        st.write("Last scans: " + ", ".join(session.codes[-10:][::-1]))
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        if st.button("Reconcile", type="primary"):
+            session.result = reconcile_session(db, session)
+    with col2:
+        if st.button("Undo Last Scan"):
+            session.undo()
+            st.rerun()
+    with col3:
+        if st.button("End Stocktake"):
+            del st.session_state['stocktake']
+            st.rerun()
+
+    result = session.result
+    if result is None:
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Found", len(result['found']))
+    with col2:
+        st.metric("Missing", len(result['missing']))
+    with col3:
+        st.metric("Misplaced", len(result['misplaced']) + len(result['elsewhere']))
+    with col4:
+        st.metric("Unknown", len(result['unknown']))
+    if result['duplicates']:
+        st.caption(f"{result['duplicates']} repeated scan(s) ignored")
+
+    tab1, tab2, tab3, tab4 = st.tabs(["Found", "Missing", "Misplaced", "Unknown"])
+    with tab1:
+        st.dataframe(result['found'], use_container_width=True)
+    with tab2:
+        st.dataframe(result['missing'], use_container_width=True)
+    with tab3:
+        misplaced = result['misplaced']
+        st.dataframe(misplaced, use_container_width=True)
+        if not misplaced.empty and st.button(f"Move {len(misplaced)} Misplaced Asset(s) to {session.location}"):
+            codes = misplaced['Asset Code'].astype(str).tolist()
+            recorded = misplaced['Location'].astype(str).tolist() if 'Location' in misplaced.columns else [''] * len(codes)
+            # One batch_update; cancelled if any asset was moved by someone else since reconciling
+            success, message = get_movement_log(db).move_assets(
+                codes,
+                session.location,
+                reason=f"Stocktake {session.started:%Y-%m-%d}",
+                moved_by=st.session_state.username,
+                expected_locations=dict(zip(codes, recorded))
+            )
+            if success:
+                session.result = reconcile_session(db, session)
+                st.success(message)
+                st.rerun()
+            else:
+                st.error(message)
+        if not result['elsewhere'].empty:
+            st.caption("Recorded at locations outside your access (ask a manager of that site to move them)")
+            st.dataframe(result['elsewhere'], use_container_width=True)
+    with tab4:
+        st.dataframe(result['unknown'], use_container_width=True)
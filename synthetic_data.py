@@ -0,0 +1,159 @@
+"""
+Synthetic Data Generator Module
+
+Generates realistic-looking master data, assets and movements for benchmarks:
+Zipf-distributed locations, categories and brands, log-normal amounts, weighted
+statuses and movement dates spread over several years.
+"""
+import numpy as np
+import pandas as pd
+from config import SHEETS, ASSET_STATUS_OPTIONS, OWNERSHIP_OPTIONS, MOVEMENT_COLUMNS, MOVEMENT_INDEX_COLUMNS
+from auth import hash_password
+from movement_log import partition_for
+
+CATEGORY_TREE = {
+    'IT Equipment': ['Laptop', 'Desktop', 'Monitor', 'Printer', 'Network Switch', 'Phone'],
+    'Furniture': ['Desk', 'Chair', 'Cabinet', 'Shelf', 'Table'],
+    'Vehicles': ['Car', 'Van', 'Forklift'],
+    'Machinery': ['Generator', 'Compressor', 'Drill Press', 'Lathe'],
+    'Office Equipment': ['Projector', 'Shredder', 'Copier', 'Whiteboard'],
+    'Appliances': ['Refrigerator', 'Microwave', 'Air Conditioner', 'Water Dispenser'],
+}
+BRANDS = ['Dell', 'HP', 'Lenovo', 'Apple', 'Samsung', 'LG', 'Canon', 'Epson', 'Cisco', 'Herman Miller',
+          'Steelcase', 'IKEA', 'Toyota', 'Ford', 'Bosch', 'Makita', 'Atlas Copco', 'Honda', 'Daikin', 'Philips']
+DEPARTMENTS = ['Finance', 'HR', 'IT', 'Operations', 'Sales', 'Marketing', 'Legal', 'Facilities', 'R&D', 'Logistics']
+STATUS_WEIGHTS = [0.82, 0.08, 0.05, 0.04, 0.01]
+WARRANTIES = ['', '6 Months', '1 Year', '2 Years', '3 Years', '5 Years']
+WORDS = ['standard', 'heavy duty', 'compact', 'portable', 'refurbished', 'new', 'spare', 'shared',
+         'executive', 'backup', 'floor', 'wireless', 'ergonomic', 'industrial', 'mobile', 'rack']
+
+
+def _zipf_choice(rng, n_items, size, exponent=1.1):
+    """Indices drawn from a Zipf-like distribution over n_items (a few popular, a long tail)"""
+    weights = 1.0 / np.arange(1, n_items + 1) ** exponent
+    return rng.choice(n_items, size=size, p=weights / weights.sum())
+
+
+def generate_master_data(n_locations=40, seed=0):
+    """Return DataFrames for Locations, Categories, Subcategories, AssetTypes and Brands"""
+    rng = np.random.default_rng(seed)
+    locations = pd.DataFrame({
+        'Location Name': [f"Site {i // 10 + 1:02d} - Room {i % 10 + 1:02d}" for i in range(n_locations)],
+        'Address': [f"{rng.integers(1, 999)} Industrial Way" for _ in range(n_locations)],
+        'Description': '',
+    })
+    categories = pd.DataFrame({
+        'Category Name': list(CATEGORY_TREE),
+        'Category Code': [name[:3].upper() for name in CATEGORY_TREE],
+        'Description': '',
+    })
+    subcategories = pd.DataFrame(
+        [(category, sub, sub[:3].upper(), '') for category, subs in CATEGORY_TREE.items() for sub in subs],
+        columns=['Category', 'Subcategory Name', 'Subcategory Code', 'Description']
+    )
+    asset_types = pd.DataFrame({'Asset Type': ['Fixed', 'Portable', 'Consumable'], 'Description': ''})
+    brands = pd.DataFrame({'Brand Name': BRANDS, 'Description': ''})
+    return {
+        SHEETS['locations']: locations,
+        SHEETS['categories']: categories,
+        SHEETS['subcategories']: subcategories,
+        SHEETS['asset_types']: asset_types,
+        SHEETS['brands']: brands,
+    }
+
+
+def generate_users(n_users=5):
+    """Return a Users DataFrame; every user's password is 'password' and user1 manages Site 04 only"""
+    return pd.DataFrame({
+        'ID': [str(i + 1) for i in range(n_users)],
+        'Username': ['admin'] + [f"user{i}" for i in range(1, n_users)],
+        'Password': hash_password('password'),
+        'Role': ['Admin'] + ['User'] * (n_users - 1),
+        'Locations': ['Site 04 - *' if i == 1 else '' for i in range(n_users)],
+        'CreatedAt': '',
+    })
+
+
+def generate_assets(n_assets, master_data, seed=0):
+    """Return an Assets DataFrame with n_assets rows"""
+    rng = np.random.default_rng(seed)
+    subcategories = master_data[SHEETS['subcategories']]
+    locations = master_data[SHEETS['locations']]['Location Name'].to_numpy()
+
+    sub_idx = _zipf_choice(rng, len(subcategories), n_assets, exponent=0.8)
+    category = subcategories['Category'].to_numpy()[sub_idx]
+    subcategory = subcategories['Subcategory Name'].to_numpy()[sub_idx]
+    category_code = pd.Series(category).str[:3].str.upper().to_numpy()
+    subcategory_code = subcategories['Subcategory Code'].to_numpy()[sub_idx]
+    purchase = pd.Timestamp('2018-01-01') + pd.to_timedelta(rng.integers(0, 365 * 7, n_assets), unit='D')
+    words = np.array(WORDS)
+
+    return pd.DataFrame({
+        'Asset Code': [f"AST-{c}-{s}-{i:07d}" for i, (c, s) in enumerate(zip(category_code, subcategory_code))],
+        'Item Name': [f"{w.title()} {s}" for w, s in zip(words[rng.integers(0, len(words), n_assets)], subcategory)],
+        'Asset Category': category,
+        'Asset Subcategory': subcategory,
+        'Brand': np.array(BRANDS)[_zipf_choice(rng, len(BRANDS), n_assets)],
+        'Asset Description': [' '.join(words[rng.integers(0, len(words), 3)]) for _ in range(n_assets)],
+        'Amount': np.round(rng.lognormal(mean=6.5, sigma=1.2, size=n_assets), 2).astype(str),
+        'Location': locations[_zipf_choice(rng, len(locations), n_assets)],
+        'Date of Purchase': purchase.strftime('%Y-%m-%d'),
+        'Warranty': np.array(WARRANTIES)[rng.integers(0, len(WARRANTIES), n_assets)],
+        'Department': np.array(DEPARTMENTS)[_zipf_choice(rng, len(DEPARTMENTS), n_assets, exponent=0.7)],
+        'Ownership': np.array(OWNERSHIP_OPTIONS)[rng.choice(len(OWNERSHIP_OPTIONS), n_assets, p=[0.8, 0.15, 0.05])],
+        'Asset Status': np.array(ASSET_STATUS_OPTIONS)[rng.choice(len(ASSET_STATUS_OPTIONS), n_assets, p=STATUS_WEIGHTS)],
+        'Image': 'No',
+        'Document': 'No',
+        'Created At': (purchase + pd.to_timedelta(rng.integers(0, 86400, n_assets), unit='s')).astype(str),
+    })
+
+
+def generate_movements(n_movements, assets_df, master_data, seed=0):
+    """Return movements in chronological order; a minority of assets account for most moves"""
+    rng = np.random.default_rng(seed)
+    locations = master_data[SHEETS['locations']]['Location Name'].to_numpy()
+    if n_movements == 0 or assets_df.empty:
+        return pd.DataFrame(columns=MOVEMENT_COLUMNS)
+    asset_idx = _zipf_choice(rng, len(assets_df), n_movements, exponent=0.6)
+    created = pd.Timestamp('2019-01-01') + pd.to_timedelta(
+        np.sort(rng.integers(0, 365 * 6 * 86400, n_movements)), unit='s')
+    to_location = locations[_zipf_choice(rng, len(locations), n_movements)]
+    movements = pd.DataFrame({
+        'Asset Code': assets_df['Asset Code'].to_numpy()[asset_idx],
+        'To Location': to_location,
+        'Reason': np.array(['Reassignment', 'Repair', 'Relocation', 'Storage', ''])[rng.integers(0, 5, n_movements)],
+        'Date': created.strftime('%Y-%m-%d'),
+        'Moved By': np.array(['admin', 'user1', 'user2'])[rng.integers(0, 3, n_movements)],
+        'Created At': created.astype(str),
+    })
+    # From Location is where the previous move of the same asset went (or its starting location)
+    previous = movements.groupby('Asset Code')['To Location'].shift(1)
+    start = movements['Asset Code'].map(assets_df.set_index('Asset Code')['Location'])
+    movements['From Location'] = previous.fillna(start)
+    return movements[MOVEMENT_COLUMNS]
+
+
+def populate(client, spreadsheet, n_assets=1000, n_movements=5000, n_locations=40, seed=0):
+    """Fill a FakeSpreadsheet with synthetic data; movements go to the partitioned movement log"""
+    master_data = generate_master_data(n_locations, seed)
+    for sheet_name, frame in master_data.items():
+        client.load_frame(spreadsheet, sheet_name, frame)
+    client.load_frame(spreadsheet, SHEETS['users'], generate_users())
+    assets_df = generate_assets(n_assets, master_data, seed)
+    movements_df = generate_movements(n_movements, assets_df, master_data, seed)
+    if not movements_df.empty:
+        # Assets end up where their last movement took them
+        last_location = movements_df.groupby('Asset Code')['To Location'].last()
+        assets_df['Location'] = assets_df['Asset Code'].map(last_location).fillna(assets_df['Location'])
+    client.load_frame(spreadsheet, SHEETS['assets'], assets_df)
+
+    partitions = movements_df['Date'].map(partition_for) if not movements_df.empty else pd.Series(dtype=str)
+    for partition, frame in movements_df.groupby(partitions, sort=True):
+        client.load_frame(spreadsheet, partition, frame)
+    index_df = pd.DataFrame({
+        'Asset Code': movements_df['Asset Code'],
+        'Date': movements_df['Date'],
+        'Partition': partitions,
+    }, columns=MOVEMENT_INDEX_COLUMNS)
+    client.load_frame(spreadsheet, SHEETS['asset_movement_index'], index_df)
+    return {'assets': assets_df, 'movements': movements_df, 'master_data': master_data}
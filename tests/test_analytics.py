@@ -0,0 +1,44 @@
+"""Warranty expiry and book value analytics"""
+import numpy as np
+import pandas as pd
+
+from analytics import asset_analytics, expiring_within, parse_dates
+
+
+def assets(dates, warranty='1 Year'):
+    return pd.DataFrame({
+        'Asset Code': [f"A{i}" for i in range(len(dates))],
+        'Date of Purchase': dates,
+        'Amount': ['1,000'] * len(dates),
+        'Warranty': [warranty] * len(dates),
+        'Asset Category': ['IT Equipment'] * len(dates),
+    })
+
+
+def test_expiry_and_book_value():
+    analytics = asset_analytics(assets(['2024-01-31', 'not a date']), as_of='2024-06-30')
+    assert analytics['Warranty Expiry'].iloc[0] == pd.Timestamp('2025-01-31')
+    assert analytics['Days To Expiry'].iloc[0] == 215
+    assert pd.isna(analytics['Warranty Expiry'].iloc[1])
+    # Without a purchase date the asset is carried at cost
+    assert analytics['Book Value'].iloc[1] == 1000
+    assert analytics['Book Value'].iloc[0] < 1000
+    assert list(expiring_within(analytics, 365)['Asset Code']) == ['A0']
+
+
+def test_empty_frame():
+    analytics = asset_analytics(assets([]).iloc[:0], as_of='2024-06-30')
+    assert analytics.empty
+    assert expiring_within(analytics, 30).empty
+
+
+def test_all_dates_blank():
+    analytics = asset_analytics(assets([None, None, None]), as_of='2024-06-30')
+    assert analytics['Warranty Expiry'].isna().all()
+    assert analytics['Days To Expiry'].isna().all()
+    assert (analytics['Book Value'] == 1000).all()
+
+
+def test_parse_dates_keeps_datetime_dtype_without_values():
+    assert parse_dates(pd.Series([None, None], dtype=object)).dtype == np.dtype('datetime64[D]')
+    assert parse_dates(pd.Series([], dtype=object)).dtype == np.dtype('datetime64[D]')
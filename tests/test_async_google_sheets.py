@@ -0,0 +1,112 @@
+"""AsyncGoogleSheetsDB against the local fake Sheets REST server"""
+import asyncio
+
+import pandas as pd
+
+from async_google_sheets import AsyncGoogleSheetsDB
+from config import SHEETS
+from fake_sheets import FakeClient
+from fake_sheets_server import FakeSheetsServer, parse_drive_query
+from rate_limiter import RequestScheduler
+from synthetic_data import populate
+
+
+def run(test, title='Asset Tracker', delay=0.0, max_concurrency=4, n_assets=50):
+    """Run test(db, server, spreadsheet) with a connected client and a fake server holding synthetic data"""
+    client = FakeClient()
+    spreadsheet = client.create(title)
+    populate(client, spreadsheet, n_assets=n_assets, n_movements=20, n_locations=5, seed=0)
+
+    async def main():
+        async with FakeSheetsServer(client, delay=delay) as server:
+            db = AsyncGoogleSheetsDB(spreadsheet.id, base_url=server.sheets_url, drive_url=server.drive_url,
+                                     anonymous=True, max_concurrency=max_concurrency,
+                                     scheduler=RequestScheduler(requests_per_minute=10 ** 9))
+            async with db:
+                return await test(db, server, spreadsheet)
+
+    return asyncio.run(main())
+
+
+def expected_frame(spreadsheet, sheet_name):
+    values = spreadsheet._worksheets[sheet_name]._rows
+    return pd.DataFrame(values[1:], columns=values[0])
+
+
+def test_read_data_matches_sheet():
+    async def test(db, server, spreadsheet):
+        frame = await db.read_data(SHEETS['assets'])
+        expected = expected_frame(spreadsheet, SHEETS['assets'])
+        assert list(frame.columns) == list(expected.columns)
+        assert len(frame) == len(expected) == 50
+        assert frame['Asset Code'].astype(str).tolist() == expected['Asset Code'].tolist()
+    run(test)
+
+
+def test_read_many_runs_concurrently_within_limit():
+    async def test(db, server, spreadsheet):
+        sheets = [SHEETS[name] for name in ('assets', 'locations', 'categories', 'subcategories', 'brands', 'users')]
+        frames = await db.read_many(sheets)
+        assert set(frames) == set(sheets)
+        assert all(not frame.empty for frame in frames.values())
+        assert server.max_in_flight == 2
+    run(test, delay=0.05, max_concurrency=2)
+
+
+def test_append_update_delete_roundtrip():
+    async def test(db, server, spreadsheet):
+        assets = SHEETS['assets']
+        assert await db.append_row(assets, {'Asset Code': 'NEW-1', 'Item Name': 'Test Laptop'})
+        frame = await db.read_data(assets)
+        assert frame.iloc[-1]['Item Name'] == 'Test Laptop'
+
+        row = await db.find_row(assets, 'Asset Code', 'new-1')
+        assert row == len(frame)
+        assert await db.update_row(assets, row, dict(frame.iloc[-1], **{'Item Name': 'Renamed'}))
+        assert (await db.read_data(assets)).iloc[-1]['Item Name'] == 'Renamed'
+
+        assert await db.delete_row(assets, row)
+        frame = await db.read_data(assets)
+        assert len(frame) == 50
+        assert 'NEW-1' not in frame['Asset Code'].astype(str).tolist()
+    run(test)
+
+
+def test_write_data_replaces_sheet():
+    async def test(db, server, spreadsheet):
+        data = pd.DataFrame({'Location Name': ['A', 'B'], 'Location Code': ['L1', 'L2']})
+        assert await db.write_data(SHEETS['locations'], data)
+        frame = await db.read_data(SHEETS['locations'])
+        assert frame.to_dict('records') == [{'Location Name': 'A', 'Location Code': 'L1'},
+                                            {'Location Name': 'B', 'Location Code': 'L2'}]
+    run(test)
+
+
+def test_missing_worksheet_is_created():
+    async def test(db, server, spreadsheet):
+        assert await db.append_row('Imports', {'Batch': '1', 'Rows': '10'})
+        assert 'Imports' in spreadsheet._worksheets
+        assert (await db.read_data('Imports')).to_dict('records') == [{'Batch': 1, 'Rows': 10}]
+    run(test)
+
+
+def test_set_spreadsheet_by_title_with_quotes_and_backslashes():
+    title = "O'Brien \\ Sons"
+
+    async def test(db, server, spreadsheet):
+        db.spreadsheet_id = None
+        assert await db.set_spreadsheet(title)
+        assert db.spreadsheet_id == spreadsheet.id
+        assert server.requests['drive_files_list'] == 1
+        assert not await db.set_spreadsheet("Someone else's sheet")
+    run(test, title=title)
+
+
+def test_drive_query_rejects_unescaped_quotes():
+    assert parse_drive_query("name = 'O\\'Brien' and trashed = false") == {'name': "O'Brien", 'trashed': False}
+    try:
+        parse_drive_query("name = 'O'Brien' and trashed = false")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("unescaped quote accepted")
@@ -0,0 +1,89 @@
+"""RequestScheduler quota waits and retries"""
+import asyncio
+import threading
+import time
+
+from rate_limiter import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, RequestScheduler
+
+
+class ApiError(Exception):
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+def failing(status):
+    calls = []
+
+    def fn():
+        calls.append(status)
+        raise ApiError(status)
+    return fn, calls
+
+
+def call_and_count(scheduler, status, idempotent):
+    fn, calls = failing(status)
+    try:
+        scheduler.call(fn, idempotent=idempotent)
+    except ApiError:
+        pass
+    return len(calls)
+
+
+def test_non_idempotent_calls_retry_only_on_429():
+    scheduler = RequestScheduler(requests_per_minute=10 ** 9, max_retries=2, backoff_base=0.001)
+    assert call_and_count(scheduler, 503, idempotent=True) == 3
+    assert call_and_count(scheduler, 503, idempotent=False) == 1
+    assert call_and_count(scheduler, 429, idempotent=False) == 3
+
+
+def test_async_wait_does_not_use_threads():
+    # One token a second with a burst of one: the second call waits about a second on the event loop
+    scheduler = RequestScheduler(requests_per_minute=60)
+    scheduler.bucket.capacity = scheduler.bucket.tokens = 1
+
+    async def noop():
+        return threading.get_ident()
+
+    async def main():
+        started = time.monotonic()
+        ticker_runs = 0
+
+        async def ticker():
+            nonlocal ticker_runs
+            while True:
+                ticker_runs += 1
+                await asyncio.sleep(0.05)
+
+        task = asyncio.create_task(ticker())
+        idents = [await scheduler.call_async(noop) for _ in range(2)]
+        task.cancel()
+        return idents, time.monotonic() - started, ticker_runs
+
+    idents, elapsed, ticker_runs = asyncio.run(main())
+    assert idents[0] == idents[1] == threading.get_ident()
+    assert 0.8 < elapsed < 2
+    # The loop kept running other tasks while the second call waited
+    assert ticker_runs > 5
+    assert scheduler.get_metrics()['queued'] == 0
+
+
+def test_cancelled_async_wait_leaves_the_queue():
+    scheduler = RequestScheduler(requests_per_minute=60)
+    scheduler.bucket.capacity = scheduler.bucket.tokens = 0
+
+    async def noop():
+        return None
+
+    async def main():
+        task = asyncio.create_task(scheduler.call_async(noop, priority=PRIORITY_BACKGROUND))
+        await asyncio.sleep(0.05)
+        assert scheduler.get_metrics()['queued'] == 1
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+    assert scheduler.get_metrics()['queued'] == 0
+    # A later call is not stuck behind the cancelled one
+    scheduler.bucket.tokens = 1
+    assert scheduler.call(lambda: 'ok', priority=PRIORITY_INTERACTIVE) == 'ok'